@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import functools
+import threading
+import collections
+from unittest import mock
+
+import swiftarchive.files
+import swiftarchive.shell
+import swiftarchive.swift
+from benchmarks.fake_swift import FakeSwiftServer
+
+
+def parse_distribution(distribution):
+    """
+    Parse a file size distribution
+    :param distribution: "fixed:SIZE", "uniform:MIN:MAX" or "lognormal:MEDIAN:SIGMA" with sizes in bytes
+    :return: Function taking a random.Random and returning a file size in bytes
+    """
+    name, _, values = distribution.partition(":")
+
+    try:
+        values = [float(value) for value in values.split(":")]
+
+        if name == "fixed" and len(values) == 1:
+            return lambda rng: int(values[0])
+        elif name == "uniform" and len(values) == 2:
+            return lambda rng: rng.randint(int(values[0]), int(values[1]))
+        elif name == "lognormal" and len(values) == 2:
+            return lambda rng: int(rng.lognormvariate(math.log(values[0]), values[1]))
+    except ValueError:
+        pass
+
+    raise ValueError("Invalid file size distribution: %s" % distribution)
+
+
+def generate_tree(root, files, distribution, files_per_directory=100, seed=0):
+    """
+    Create a synthetic directory tree of files with sizes drawn from distribution
+    :param root: Path to create the files under
+    :param files: Number of files
+    :param distribution: File size distribution, see parse_distribution
+    :param files_per_directory: Number of files in each directory. Default is 100.
+    :param seed: Seed for the file sizes and contents. Default is 0.
+    :return: Total size of the files in bytes
+    """
+    rng = random.Random(seed)
+    size = parse_distribution(distribution)
+    block = bytes(rng.getrandbits(8) for _ in range(65536))
+    total = 0
+
+    for i in range(files):
+        directory = os.path.join(root, "%04d" % (i // files_per_directory))
+        if i % files_per_directory == 0:
+            os.makedirs(directory, exist_ok=True)
+
+        file_size = size(rng)
+        # Every file starts with its index so no two files have the same contents
+        header = b"%d\n" % i
+        with open(os.path.join(directory, "%06d.dat" % i), "wb") as local:
+            local.write(header[:file_size])
+            remaining = file_size - len(header[:file_size])
+            while remaining > 0:
+                local.write(block[:remaining])
+                remaining -= len(block[:remaining])
+
+        total += file_size
+
+    return total
+
+
+class PhaseTimer:
+
+    def __init__(self):
+        """
+        Accumulate the time spent in each phase of a run by wrapping the functions that make up the
+        phase. Phases run concurrently, so the total is thread time rather than wall time.
+        """
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.lock = threading.Lock()
+        self.patches = []
+
+    def add(self, phase, started):
+        with self.lock:
+            self.seconds[phase] += time.perf_counter() - started
+            self.calls[phase] += 1
+
+    def wrap(self, owner, attribute, phase, generator=False):
+        """
+        :param owner: module or class the function is looked up on
+        :param attribute: name of the function
+        :param phase: name of the phase the time is added to
+        :param generator: True if the function returns a generator, so the time of every step is measured
+        """
+        function = getattr(owner, attribute)
+
+        if generator:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                iterator = function(*args, **kwargs)
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        self.add(phase, started)
+                        return
+                    self.add(phase, started)
+                    yield item
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add(phase, started)
+
+        patch = mock.patch.object(owner, attribute, wrapper)
+        patch.start()
+        self.patches.append(patch)
+
+    def stop(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.patches = []
+
+
+def run_benchmark(files=1000, distribution="lognormal:16384:1.5", latency=0.0, bandwidth=0, archive_args=None,
+                  seed=0, capacity=0):
+    """
+    Archive a synthetic tree to the fake Swift server with shell.main
+    :param files: Number of files. Default is 1000.
+    :param distribution: File size distribution, see parse_distribution. Default is "lognormal:16384:1.5".
+    :param latency: Seconds added to every request. Default is 0.0.
+    :param bandwidth: Maximum bytes per second per connection, 0 for unlimited. Default is 0.
+    :param archive_args: List of extra swift-archive arguments, e.g. ["--workers", "8"]. Default is None.
+    :param seed: Seed for the file sizes and contents. Default is 0.
+    :param capacity: Object uploads in flight before the server responds 498 Rate Limited, 0 for unlimited.
+                     Default is 0.
+    :return: dict with the files, bytes, seconds, files/s, MB/s, requests and per-phase times of the run
+    """
+    root = tempfile.mkdtemp(prefix="swift-archive-benchmark-")
+
+    try:
+        archive_path = os.path.join(root, "archive") + "/"
+        total = generate_tree(archive_path, files, distribution, seed=seed)
+
+        with FakeSwiftServer(latency=latency, bandwidth=bandwidth, capacity=capacity) as server:
+            argv = ["swift-archive",
+                    "--os-username", "benchmark",
+                    "--os-password", "benchmark",
+                    "--os-project-name", "benchmark",
+                    "--os-auth-url", server.auth_url,
+                    "--container", "benchmark",
+                    "--archive-path", archive_path] + list(archive_args or [])
+
+            timer = PhaseTimer()
+            # Swift authenticates lazily, on its first request, and refreshes the token before every request
+            timer.wrap(swiftarchive.swift.Swift, "authenticate", "auth")
+            timer.wrap(swiftarchive.files, "scan_directory", "scan", generator=True)
+            timer.wrap(swiftarchive.swift.Swift, "list_objects", "listing", generator=True)
+            # Files are hashed while they are uploaded, and on their own when they are checked without an upload
+            timer.wrap(swiftarchive.files.HashingReader, "read", "hash")
+            timer.wrap(swiftarchive.swift.Swift, "local_etag", "hash")
+            timer.wrap(swiftarchive.swift.Swift, "put_object", "upload")
+            timer.wrap(swiftarchive.swift.Swift, "put_archive", "upload")
+            timer.wrap(swiftarchive.swift.Swift, "put_stream", "upload")
+            timer.wrap(swiftarchive.files, "delete", "delete")
+
+            started = time.perf_counter()
+            try:
+                with mock.patch.object(sys, "argv", argv):
+                    result = swiftarchive.shell.main()
+            finally:
+                seconds = time.perf_counter() - started
+                timer.stop()
+
+            if result != 0:
+                raise RuntimeError(result)
+
+            requests = server.requests
+            throttled = server.throttled
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {"files": files,
+            "bytes": total,
+            "seconds": seconds,
+            "files_per_second": files / seconds,
+            "mb_per_second": total / 1048576 / seconds,
+            "requests": requests,
+            "throttled": throttled,
+            "phases": {phase: {"seconds": timer.seconds[phase], "calls": timer.calls[phase]}
+                       for phase in sorted(timer.seconds)}}
+
+
+def main():
+    """
+    :return: 0 if successful
+    """
+    parser = argparse.ArgumentParser(description="Benchmark swift-archive against an in-process fake Swift "
+                                                 "server. Unknown arguments are passed to swift-archive.")
+    parser.add_argument("--files", type=int, default=1000, help="Number of Files. (Default 1000)")
+    parser.add_argument("--distribution", default="lognormal:16384:1.5",
+                        help="File Size Distribution: fixed:SIZE, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA. "
+                             "(Default lognormal:16384:1.5)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds Added to Every Request. (Default 0)")
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="Bytes per Second per Connection, 0 for Unlimited. (Default 0)")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="Object Uploads in Flight Before the Server Responds 498 Rate Limited, 0 for Unlimited. "
+                             "(Default 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the File Sizes and Contents. (Default 0)")
+    parser.add_argument("--json", action="store_true", help="Print the Results as JSON.")
+    args, archive_args = parser.parse_known_args()
+
+    result = run_benchmark(args.files, args.distribution, args.latency, args.bandwidth, archive_args, args.seed,
+                           args.capacity)
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return 0
+
+    print("files:     %d" % result["files"])
+    print("bytes:     %d" % result["bytes"])
+    print("seconds:   %.3f" % result["seconds"])
+    print("files/s:   %.1f" % result["files_per_second"])
+    print("MB/s:      %.2f" % result["mb_per_second"])
+    print("requests:  %d" % result["requests"])
+    print("throttled: %d" % result["throttled"])
+    print("phase thread seconds:")
+    for phase, timing in result["phases"].items():
+        print("  %-8s %10.3f s %8d calls" % (phase, timing["seconds"], timing["calls"]))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+
+import io
+import json
+import time
+import uuid
+import tarfile
+import hashlib
+import logging
+import datetime
+import threading
+import socketserver
+import http.server
+from urllib.parse import urlsplit, parse_qs, unquote
+
+logger = logging.getLogger('swiftarchive.benchmarks.fake_swift')
+
+ACCOUNT = "AUTH_benchmark"
+
+
+class FakeObject:
+
+    def __init__(self, data, etag=None, manifest=None, metadata=None, content_type="application/octet-stream"):
+        """
+        An object stored by the fake Swift server
+        :param data: object contents as bytes (empty for a Static Large Object manifest)
+        :param etag: etag of the object. Default is the md5 hash of data.
+        :param manifest: list of segment dicts if the object is a Static Large Object. Default is None.
+        :param metadata: dict of X-Object-Meta-* headers. Default is None.
+        :param content_type: content type of the object. Default is application/octet-stream.
+        """
+        self.data = data
+        self.etag = etag or hashlib.md5(data).hexdigest()
+        self.manifest = manifest
+        self.metadata = metadata or {}
+        self.content_type = content_type
+
+
+class FakeSwiftServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, bandwidth=0, capacity=0, host="127.0.0.1", port=0):
+        """
+        In-process HTTP stand-in for the Keystone v3 and Swift calls made by swiftarchive.swift.Swift.
+        Objects are kept in memory. Every request is delayed by latency and request and response bodies
+        are throttled to bandwidth, so throughput can be measured against a slow or distant cluster.
+        :param latency: Seconds added to every request. Default is 0.0.
+        :param bandwidth: Maximum bytes per second transferred by each connection, 0 for unlimited.
+                          Default is 0.
+        :param capacity: Object uploads in flight before uploads are rejected with 498 Rate Limited, like a
+                         throttled account, 0 for unlimited. Default is 0.
+        :param host: Address to listen on. Default is 127.0.0.1.
+        :param port: Port to listen on, 0 picks a free port. Default is 0.
+        """
+        http.server.HTTPServer.__init__(self, (host, port), FakeSwiftHandler)
+        self.latency = float(latency)
+        self.bandwidth = int(bandwidth)
+        self.capacity = int(capacity)
+        self.uploads = 0
+        self.throttled = 0
+
+        # {container: {object name: FakeObject}}
+        self.containers = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def auth_url(self):
+        """
+        :return: Keystone v3 auth URL of the server
+        """
+        return "http://%s:%s/v3" % self.server_address[:2]
+
+    @property
+    def storage_url(self):
+        """
+        :return: Swift storage URL of the account
+        """
+        return "http://%s:%s/v1/%s" % (self.server_address[0], self.server_address[1], ACCOUNT)
+
+    def start(self):
+        """
+        Serve requests from a background thread
+        :return: self
+        """
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-swift", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests and close the listening socket
+        """
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def objects(self, container):
+        """
+        :param container: container name
+        :return: dict of object name to FakeObject, an empty dict if the container doesn't exist
+        """
+        with self.lock:
+            return dict(self.containers.get(container, {}))
+
+
+class FakeSwiftHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def throttle(self, length):
+        """
+        Sleep long enough for length bytes to be transferred at the server bandwidth
+        :param length: number of bytes transferred
+        """
+        if self.server.bandwidth > 0:
+            time.sleep(length / self.server.bandwidth)
+
+    def read_body(self):
+        """
+        :return: Request body as bytes, reading both Content-Length and chunked transfer encoding
+        """
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = io.BytesIO()
+            while True:
+                length = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if length == 0:
+                    # Skip any trailers up to the blank line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body.write(self.rfile.read(length))
+                self.rfile.readline()
+                self.throttle(length)
+            return body.getvalue()
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self.throttle(length)
+        return body
+
+    def respond(self, status, body=b"", headers=None, send_body=True):
+        """
+        :param status: HTTP status code
+        :param body: response body as bytes or a JSON serializable object
+        :param headers: dict of extra response headers
+        :param send_body: False for a HEAD response. Default is True.
+        """
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers = dict(headers or {}, **{"Content-Type": "application/json"})
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Trans-Id", uuid.uuid4().hex)
+        self.end_headers()
+
+        if send_body and body:
+            self.throttle(len(body))
+            self.wfile.write(body)
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        parts = [unquote(part) for part in url.path.split("/", 4)[1:]]
+
+        # Object and extract-archive uploads count against the capacity for as long as they take
+        upload = method == "PUT" and len(parts) > 2 and parts[0] == "v1" and \
+            (len(parts) > 3 or "extract-archive" in query)
+
+        with self.server.lock:
+            self.server.requests += 1
+            if upload and 0 < self.server.capacity <= self.server.uploads:
+                self.server.throttled += 1
+                throttled = True
+            else:
+                self.server.uploads += upload
+                throttled = False
+
+        if throttled:
+            self.read_body()
+            return self.respond(498, b"Slow down")
+
+        try:
+            if self.server.latency > 0:
+                time.sleep(self.server.latency)
+
+            return self.route(method, parts, query)
+        finally:
+            with self.server.lock:
+                self.server.uploads -= upload
+
+    def route(self, method, parts, query):
+        if parts and parts[0] == "v3":
+            return self.keystone(method, parts[1:])
+
+        if len(parts) < 2 or parts[0] != "v1" or parts[1] != ACCOUNT:
+            self.read_body()
+            return self.respond(404)
+
+        container = parts[2] if len(parts) > 2 else ""
+        object_name = parts[3] if len(parts) > 3 else ""
+
+        if not container:
+            self.read_body()
+            return self.respond(405)
+        elif not object_name:
+            return self.container(method, container, query)
+        return self.object(method, container, object_name, query)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_HEAD(self):
+        self.handle_request("HEAD")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def keystone(self, method, parts):
+        """
+        Keystone v3: version discovery and password authentication
+        """
+        self.read_body()
+
+        if method == "POST" and parts[:2] == ["auth", "tokens"]:
+            now = datetime.datetime.utcnow()
+            expires = now + datetime.timedelta(hours=1)
+            domain = {"id": "default", "name": "Default"}
+            token = {"token": {"methods": ["password"],
+                               "issued_at": now.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+                               "expires_at": expires.strftime("%Y-%m-%dT%H:%M:%S.000000Z"),
+                               "user": {"id": "benchmark", "name": "benchmark", "domain": domain},
+                               "project": {"id": "benchmark", "name": "benchmark", "domain": domain},
+                               "catalog": [{"id": "swift",
+                                            "type": "object-store",
+                                            "name": "swift",
+                                            "endpoints": [{"id": "swift-public",
+                                                           "interface": "public",
+                                                           "region": "RegionOne",
+                                                           "region_id": "RegionOne",
+                                                           "url": self.server.storage_url}]}]}}
+            return self.respond(201, token, {"X-Subject-Token": uuid.uuid4().hex})
+
+        if method == "GET" and parts in ([], [""]):
+            return self.respond(200, {"version": {"id": "v3.14", "status": "stable",
+                                                  "links": [{"rel": "self", "href": self.server.auth_url}]}})
+
+        return self.respond(404)
+
+    def container(self, method, container, query):
+        """
+        Swift container requests: HEAD, PUT, GET (JSON listing) and PUT with extract-archive
+        """
+        if method == "PUT" and "extract-archive" in query:
+            return self.extract_archive(container)
+
+        self.read_body()
+
+        with self.server.lock:
+            objects = self.server.containers.get(container)
+
+            if method == "PUT":
+                status = 202 if objects is not None else 201
+                self.server.containers.setdefault(container, {})
+                return self.respond(status)
+
+            if objects is None:
+                return self.respond(404, send_body=method != "HEAD")
+
+            headers = {"X-Container-Object-Count": str(len(objects)),
+                       "X-Container-Bytes-Used": str(sum(len(obj.data) for obj in objects.values()))}
+
+            if method == "HEAD":
+                return self.respond(204, headers=headers, send_body=False)
+
+            if method != "GET":
+                return self.respond(405)
+
+            prefix = query.get("prefix", "")
+            marker = query.get("marker", "")
+            end_marker = query.get("end_marker")
+            limit = int(query.get("limit", 10000))
+            listing = []
+
+            for name in sorted(objects):
+                if name <= marker or not name.startswith(prefix):
+                    continue
+                if end_marker is not None and name >= end_marker:
+                    break
+                obj = objects[name]
+                entry = {"name": name,
+                         "bytes": self.object_size(obj),
+                         "hash": obj.etag,
+                         "content_type": obj.content_type,
+                         "last_modified": "1970-01-01T00:00:00.000000"}
+                if obj.manifest:
+                    # Like Swift, the hash of a Static Large Object is that of its manifest
+                    entry["hash"] = hashlib.md5(json.dumps(obj.manifest).encode()).hexdigest()
+                    entry["slo_etag"] = '"%s"' % obj.etag
+                listing.append(entry)
+                if len(listing) >= limit:
+                    break
+
+        return self.respond(200, listing, headers)
+
+    def extract_archive(self, container):
+        """
+        Swift bulk middleware: create an object for every file in an uploaded tar
+        """
+        body = self.read_body()
+        created = 0
+
+        with self.server.lock:
+            objects = self.server.containers.setdefault(container, {})
+
+            with tarfile.open(fileobj=io.BytesIO(body), mode="r:") as tar:
+                for member in tar:
+                    if member.isfile():
+                        objects[member.name.lstrip("/")] = FakeObject(tar.extractfile(member).read())
+                        created += 1
+
+        return self.respond(201, {"Number Files Created": created, "Response Status": "201 Created",
+                                  "Response Body": "", "Errors": []})
+
+    def object(self, method, container, object_name, query):
+        """
+        Swift object requests: PUT (including Static Large Object manifests and X-Copy-From server-side
+        copies), GET with Range or of a Static Large Object manifest, HEAD, POST metadata and DELETE
+        """
+        body = self.read_body()
+
+        with self.server.lock:
+            objects = self.server.containers.get(container)
+
+            if objects is None:
+                return self.respond(404, send_body=method != "HEAD")
+
+            metadata = {name: value for name, value in self.headers.items()
+                        if name.lower().startswith("x-object-meta-")}
+
+            if method == "PUT":
+                copy_from = self.headers.get("X-Copy-From")
+
+                if copy_from is not None:
+                    source_container, source_name = unquote(copy_from).lstrip("/").split("/", 1)
+                    source = self.server.containers.get(source_container, {}).get(source_name)
+                    if source is None:
+                        return self.respond(404)
+                    metadata = dict(source.metadata, **metadata)
+                    if source.manifest and query.get("multipart-manifest") == "get":
+                        obj = FakeObject(b"", etag=source.etag, manifest=source.manifest, metadata=metadata)
+                    else:
+                        obj = FakeObject(self.object_data(source), metadata=metadata)
+                elif query.get("multipart-manifest") == "put":
+                    obj = self.manifest(json.loads(body.decode()), metadata)
+                    if obj is None:
+                        return self.respond(400)
+                else:
+                    obj = FakeObject(body, metadata=metadata)
+
+                if copy_from is not None:
+                    obj.content_type = source.content_type
+                obj.content_type = self.headers.get("Content-Type", obj.content_type)
+                objects[object_name] = obj
+                return self.respond(201, headers={"Etag": '"%s"' % obj.etag if obj.manifest else obj.etag})
+
+            obj = objects.get(object_name)
+
+            if obj is None:
+                return self.respond(404, send_body=method != "HEAD")
+
+            if method == "POST":
+                obj.metadata = metadata
+                obj.content_type = self.headers.get("Content-Type", obj.content_type)
+                return self.respond(202)
+
+            if method == "DELETE":
+                del objects[object_name]
+                return self.respond(204)
+
+            if obj.manifest and method == "GET" and query.get("multipart-manifest") == "get":
+                # Like Swift, the stored manifest names each segment by its path
+                data = json.dumps([{"name": segment["path"], "hash": segment["etag"], "bytes": segment["size_bytes"]}
+                                   for segment in obj.manifest]).encode()
+            else:
+                data = self.object_data(obj)
+
+        headers = dict(obj.metadata)
+        headers["Etag"] = '"%s"' % obj.etag if obj.manifest else obj.etag
+        if obj.manifest:
+            headers["X-Static-Large-Object"] = "True"
+
+        if method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            self.send_response(200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            start, end = range_header[len("bytes="):].split("-")
+            start, end = int(start), min(int(end), len(data) - 1)
+            headers["Content-Range"] = "bytes %s-%s/%s" % (start, end, len(data))
+            return self.respond(206, data[start:end + 1], headers)
+
+        return self.respond(200, data, headers)
+
+    def manifest(self, segments, metadata):
+        """
+        :param segments: Static Large Object manifest from the request body
+        :param metadata: dict of X-Object-Meta-* headers
+        :return: FakeObject for the manifest, or None if a segment is missing or doesn't match
+        """
+        for segment in segments:
+            segment_container, segment_name = segment["path"].lstrip("/").split("/", 1)
+            obj = self.server.containers.get(segment_container, {}).get(segment_name)
+            if obj is None or obj.etag != segment["etag"] or len(obj.data) != segment["size_bytes"]:
+                return None
+
+        etag = hashlib.md5("".join(segment["etag"] for segment in segments).encode()).hexdigest()
+        return FakeObject(b"", etag=etag, manifest=segments, metadata=metadata)
+
+    def object_data(self, obj):
+        """
+        :param obj: FakeObject
+        :return: The contents of the object, joining the segments of a Static Large Object
+        """
+        if not obj.manifest:
+            return obj.data
+
+        data = b""
+        for segment in obj.manifest:
+            segment_container, segment_name = segment["path"].lstrip("/").split("/", 1)
+            data += self.server.containers[segment_container][segment_name].data
+        return data
+
+    def object_size(self, obj):
+        """
+        :param obj: FakeObject
+        :return: Size of the object in bytes
+        """
+        if obj.manifest:
+            return sum(segment["size_bytes"] for segment in obj.manifest)
+        return len(obj.data)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Packages only needed once there is something to upload, which a run with nothing to archive must not import
+HEAVY_MODULES = ("keystoneauth1", "swiftclient", "requests", "urllib3")
+
+SCRIPT = "import sys; from swiftarchive.shell import main; sys.exit(main())"
+
+
+def import_times(stderr):
+    """
+    Parse the output of python -X importtime
+    :param stderr: stderr of the python process
+    :return: dict of module name to a tuple of its self and cumulative import time in microseconds
+    """
+    times = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+
+        # The header line has column names rather than times
+        if self_us.strip().isdigit():
+            times[module.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+
+def measure_startup(runs=5, archive_path=None):
+    """
+    Time swift-archive runs with nothing to archive in fresh python processes, the cost paid by every cron
+    invocation that finds no eligible files
+    :param runs: Number of runs. Default is 5.
+    :param archive_path: Archive path to run against. Default is None (an empty temporary directory).
+    :return: dict with the median seconds and import microseconds of the runs and the modules imported
+    """
+    directory = tempfile.mkdtemp(prefix="swift-archive-startup-")
+    argv = ["--os-username", "startup",
+            "--os-password", "startup",
+            "--os-project-name", "startup",
+            # Nothing listens here, so authenticating would fail the run
+            "--os-auth-url", "http://127.0.0.1:9/v3",
+            "--container", "startup",
+            "--archive-path", archive_path or directory]
+
+    seconds = []
+    import_us = []
+    times = {}
+
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            process = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT] + argv,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            seconds.append(time.perf_counter() - started)
+
+            if process.returncode != 0:
+                raise RuntimeError(process.stderr)
+
+            times = import_times(process.stderr)
+            import_us.append(sum(self_us for self_us, _ in times.values()))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {"runs": runs,
+            "seconds": statistics.median(seconds),
+            "import_us": statistics.median(import_us),
+            "modules": times,
+            "heavy_modules": sorted(module for module in times if module.split(".")[0] in HEAVY_MODULES)}
+
+
+def main():
+    """
+    :return: 0 if successful, 1 if a run imported a heavy module
+    """
+    parser = argparse.ArgumentParser(description="Measure the startup cost of a swift-archive run with nothing to "
+                                                 "archive.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of Runs. (Default 5)")
+    parser.add_argument("--top", type=int, default=15,
+                        help="Number of Modules With the Largest Cumulative Import Time Shown. (Default 15)")
+    parser.add_argument("--json", action="store_true", help="Print the Results as JSON.")
+    args = parser.parse_args()
+
+    result = measure_startup(args.runs)
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+    else:
+        print("runs:          %d" % result["runs"])
+        print("seconds:       %.3f" % result["seconds"])
+        print("import ms:     %.1f" % (result["import_us"] / 1000))
+        print("modules:       %d" % len(result["modules"]))
+        print("heavy modules: %s" % (", ".join(result["heavy_modules"]) or "none"))
+        print("largest cumulative imports:")
+        for module, (_, cumulative_us) in sorted(result["modules"].items(), key=lambda item: -item[1][1])[:args.top]:
+            print("  %-40s %8.1f ms" % (module, cumulative_us / 1000))
+
+    return 1 if result["heavy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,9 @@ try:
         "python-swiftclient>=3.8.0",
         "keystoneauth1>=3.18.0",
     ],
+        extras_require={
+            "zstd": ["zstandard"],
+        },
         include_package_data=True,
         test_suite="tests.suite.load_tests",
     )
@@ -27,6 +30,7 @@ setup(name="openstack-swift-archive",
       author_email="kcoakley@sdsc.edu",
       scripts=[
           "bin/swift-archive",
+          "bin/swift-restore",
       ],
       url="",
       packages=[
@@ -40,6 +40,12 @@ def parse_arguments(args):
                         help="OpenStack Keystone Auth URL.",
                         default=os.environ.get('OS_AUTH_URL', None))
 
+    parser.add_argument("--token-cache",
+                        metavar="token_cache",
+                        dest="token_cache",
+                        help="Path to a File the Keystone Token is Cached in Between Runs.",
+                        default=os.environ.get('TOKEN_CACHE', None))
+
     parser.add_argument("--container",
                         metavar="container",
                         dest="container",
@@ -64,4 +70,291 @@ def parse_arguments(args):
                         help="Archive All Files That Haven't Been Updated Since in Seconds.",
                         default=os.environ.get('SECONDS_SINCE_UPDATED', 0))
 
+    parser.add_argument('--skip-existing',
+                        dest="skip_existing",
+                        help="Skip Files Already in the Container With a Matching Size and md5 Sum.",
+                        action='store_true',
+                        default=os.environ.get('SKIP_EXISTING', False))
+
+    parser.add_argument("--state-db",
+                        metavar="state_db",
+                        dest="state_db",
+                        help="Path to a Local SQLite Index Used to Skip Files Uploaded by Previous Runs.",
+                        default=os.environ.get('STATE_DB', None))
+
+    parser.add_argument("--journal",
+                        metavar="journal",
+                        dest="journal",
+                        help="Path to an Append-Only Journal of the Run Used to Resume it if it is Interrupted.",
+                        default=os.environ.get('JOURNAL', None))
+
+    parser.add_argument("--dedup-db",
+                        metavar="dedup_db",
+                        dest="dedup_db",
+                        help="Path to a Local SQLite Index Used to Copy Duplicate Files Within Swift Rather Than Upload Them.",
+                        default=os.environ.get('DEDUP_DB', None))
+
+    parser.add_argument("--workers",
+                        metavar="workers",
+                        dest="workers",
+                        help="Number of Concurrent Uploads.",
+                        type=int,
+                        default=os.environ.get('WORKERS', 4))
+
+    parser.add_argument("--segment-size",
+                        metavar="segment_size",
+                        dest="segment_size",
+                        help="Size in Bytes of Each Segment of a Static Large Object.",
+                        type=int,
+                        default=os.environ.get('SEGMENT_SIZE', 1073741824))
+
+    parser.add_argument("--segment-threshold",
+                        metavar="segment_threshold",
+                        dest="segment_threshold",
+                        help="Upload Files Larger Than This Many Bytes as Segmented Static Large Objects.",
+                        type=int,
+                        default=os.environ.get('SEGMENT_THRESHOLD', 3500000000))
+
+    parser.add_argument("--bulk-threshold",
+                        metavar="bulk_threshold",
+                        dest="bulk_threshold",
+                        help="Upload Files of at Most This Many Bytes in Batches With the Swift Bulk Middleware.",
+                        type=int,
+                        default=os.environ.get('BULK_THRESHOLD', 0))
+
+    parser.add_argument("--bulk-count",
+                        metavar="bulk_count",
+                        dest="bulk_count",
+                        help="Maximum Number of Files in a Bulk Upload Batch.",
+                        type=int,
+                        default=os.environ.get('BULK_COUNT', 1000))
+
+    parser.add_argument("--bulk-size",
+                        metavar="bulk_size",
+                        dest="bulk_size",
+                        help="Maximum Number of Bytes in a Bulk Upload Batch.",
+                        type=int,
+                        default=os.environ.get('BULK_SIZE', 67108864))
+
+    parser.add_argument("--pack-threshold",
+                        metavar="pack_threshold",
+                        dest="pack_threshold",
+                        help="Pack Files of at Most This Many Bytes Into Pack Objects With a Sidecar Index.",
+                        type=int,
+                        default=os.environ.get('PACK_THRESHOLD', 0))
+
+    parser.add_argument("--pack-size",
+                        metavar="pack_size",
+                        dest="pack_size",
+                        help="Size in Bytes a Pack Object is Filled to Before it is Uploaded.",
+                        type=int,
+                        default=os.environ.get('PACK_SIZE', 268435456))
+
+    parser.add_argument("--scan-workers",
+                        metavar="scan_workers",
+                        dest="scan_workers",
+                        help="Number of Directories Scanned in Parallel.",
+                        type=int,
+                        default=os.environ.get('SCAN_WORKERS', 1))
+
+    parser.add_argument("--schedule",
+                        metavar="schedule",
+                        dest="schedule",
+                        help="Order Files Are Uploaded in: largest (Largest First), oldest (Oldest First) or walk "
+                             "(As Found), Within a Window of --queue-size Files.",
+                        default=os.environ.get('SCHEDULE', "largest"))
+
+    parser.add_argument("--queue-size",
+                        metavar="queue_size",
+                        dest="queue_size",
+                        help="Maximum Number of Files Queued Between Pipeline Stages.",
+                        type=int,
+                        default=os.environ.get('QUEUE_SIZE', 1000))
+
+    parser.add_argument("--metrics-textfile",
+                        metavar="metrics_textfile",
+                        dest="metrics_textfile",
+                        help="Path to Write Metrics to as a Prometheus Node Exporter Textfile.",
+                        default=os.environ.get('METRICS_TEXTFILE', None))
+
+    parser.add_argument("--metrics-json",
+                        metavar="metrics_json",
+                        dest="metrics_json",
+                        help="Path to Write Metrics to as JSON.",
+                        default=os.environ.get('METRICS_JSON', None))
+
+    parser.add_argument("--metrics-interval",
+                        metavar="metrics_interval",
+                        dest="metrics_interval",
+                        help="Seconds Between Metrics Writes While Running, 0 to Only Write at the End.",
+                        type=int,
+                        default=os.environ.get('METRICS_INTERVAL', 60))
+
+    parser.add_argument('--watch',
+                        dest="watch",
+                        help="Keep Running and Archive New Files Found With inotify.",
+                        action='store_true',
+                        default=os.environ.get('WATCH', False))
+
+    parser.add_argument("--rescan-interval",
+                        metavar="rescan_interval",
+                        dest="rescan_interval",
+                        help="Seconds Between Rescans in Watch Mode When inotify Can't Be Used.",
+                        type=int,
+                        default=os.environ.get('RESCAN_INTERVAL', 600))
+
+    parser.add_argument("--hash-buffer-size",
+                        metavar="hash_buffer_size",
+                        dest="hash_buffer_size",
+                        help="Number of Bytes Read per Call When Hashing a Local File.",
+                        type=int,
+                        default=os.environ.get('HASH_BUFFER_SIZE', 1048576))
+
+    parser.add_argument("--hash-processes",
+                        metavar="hash_processes",
+                        dest="hash_processes",
+                        help="Number of Processes Used to Hash Files That Are Checked Without Being Uploaded.",
+                        type=int,
+                        default=os.environ.get('HASH_PROCESSES', 0))
+
+    parser.add_argument("--max-retries",
+                        metavar="max_retries",
+                        dest="max_retries",
+                        help="Number of Times a Throttled or Failed Request is Retried With Jittered Backoff.",
+                        type=int,
+                        default=os.environ.get('MAX_RETRIES', 5))
+
+    parser.add_argument('--adaptive-concurrency',
+                        dest="adaptive_concurrency",
+                        help="Adapt the Number of Uploads in Flight, up to --workers, to Throttling and Latency.",
+                        action='store_true',
+                        default=os.environ.get('ADAPTIVE_CONCURRENCY', False))
+
+    parser.add_argument("--compress",
+                        metavar="compress",
+                        dest="compress",
+                        help="Compress Files That Compress Well While They Are Uploaded, With gzip or zstd.",
+                        default=os.environ.get('COMPRESS', None))
+
+    parser.add_argument("--compress-level",
+                        metavar="compress_level",
+                        dest="compress_level",
+                        help="Compression Level, Default is 6 for gzip and 3 for zstd.",
+                        type=int,
+                        default=os.environ.get('COMPRESS_LEVEL', None))
+
+    parser.add_argument("--compress-sample-size",
+                        metavar="compress_sample_size",
+                        dest="compress_sample_size",
+                        help="Number of Bytes From the Start of Each File Compressed to Decide Whether to Compress it.",
+                        type=int,
+                        default=os.environ.get('COMPRESS_SAMPLE_SIZE', 65536))
+
+    parser.add_argument("--max-memory",
+                        metavar="max_memory",
+                        dest="max_memory",
+                        help="Maximum Bytes of Memory Used, Sizing the State Kept in Memory and Stopping the Run if "
+                             "it is Exceeded.",
+                        type=int,
+                        default=os.environ.get('MAX_MEMORY', None))
+
+    parser.add_argument('--plan',
+                        dest="plan",
+                        help="Report the Files, Bytes and Requests a Run Would Upload and its Estimated Duration "
+                             "Without Uploading.",
+                        action='store_true',
+                        default=os.environ.get('ARCHIVE_PLAN', False))
+
+    parser.add_argument("--plan-throughput",
+                        metavar="plan_throughput",
+                        dest="plan_throughput",
+                        help="Bytes per Second Used to Estimate the Duration of a Plan, Default is Measured From "
+                             "--metrics-json.",
+                        type=float,
+                        default=os.environ.get('PLAN_THROUGHPUT', None))
+
+    parser.add_argument("--plan-request-seconds",
+                        metavar="plan_request_seconds",
+                        dest="plan_request_seconds",
+                        help="Seconds per Upload Request Used to Estimate the Duration of a Plan, Default is "
+                             "Measured From --metrics-json.",
+                        type=float,
+                        default=os.environ.get('PLAN_REQUEST_SECONDS', None))
+
+    return parser.parse_args(args)
+
+
+def parse_restore_arguments(args):
+    """
+    Parse swift-restore Commandline Arguments
+    :param args: *args positional arguments
+    :return: Commandline arguments parsed by argparse
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--debug',
+                        dest="debug",
+                        action='store_true')
+
+    parser.add_argument("--os-username",
+                        metavar="os_username",
+                        dest="os_username",
+                        help="OpenStack Keystone Username.",
+                        default=os.environ.get('OS_USERNAME', None))
+
+    parser.add_argument("--os-password",
+                        metavar="os_password",
+                        dest="os_password",
+                        help="OpenStack Keystone Password.",
+                        default=os.environ.get('OS_PASSWORD', None))
+
+    parser.add_argument("--os-project-name",
+                        metavar="os_project_name",
+                        dest="os_project_name",
+                        help="OpenStack Keystone Project Name.",
+                        default=os.environ.get('OS_PROJECT_NAME', None))
+
+    parser.add_argument("--os-auth-url",
+                        metavar="os_auth_url",
+                        dest="os_auth_url",
+                        help="OpenStack Keystone Auth URL.",
+                        default=os.environ.get('OS_AUTH_URL', None))
+
+    parser.add_argument("--token-cache",
+                        metavar="token_cache",
+                        dest="token_cache",
+                        help="Path to a File the Keystone Token is Cached in Between Runs.",
+                        default=os.environ.get('TOKEN_CACHE', None))
+
+    parser.add_argument("--container",
+                        metavar="container",
+                        dest="container",
+                        help="OpenStack Swift Container.",
+                        default=os.environ.get('CONTAINER', None))
+
+    parser.add_argument("--restore-path",
+                        metavar="restore_path",
+                        dest="restore_path",
+                        help="Local Path to Restore the Objects to.",
+                        default=os.environ.get('RESTORE_PATH', None))
+
+    parser.add_argument("--prefix",
+                        metavar="prefix",
+                        dest="prefix",
+                        help="Only Restore Objects Whose Names Start With Prefix.",
+                        default=os.environ.get('RESTORE_PREFIX', None))
+
+    parser.add_argument('--packs',
+                        dest="packs",
+                        help="Also Restore the Files Stored in Pack Objects.",
+                        action='store_true',
+                        default=os.environ.get('RESTORE_PACKS', False))
+
+    parser.add_argument("--workers",
+                        metavar="workers",
+                        dest="workers",
+                        help="Number of Concurrent Downloads.",
+                        type=int,
+                        default=os.environ.get('RESTORE_WORKERS', 4))
+
     return parser.parse_args(args)
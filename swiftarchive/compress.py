@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+import zlib
+import hashlib
+import logging
+
+from swiftarchive.exceptions import LocalFileException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('swiftarchive.compress')
+
+# Leading bytes of formats that are already compressed, so sampling them can be skipped
+COMPRESSED_MAGIC = (
+    b"\x1f\x8b",                # gzip
+    b"\x28\xb5\x2f\xfd",        # zstd
+    b"\xfd7zXZ\x00",            # xz
+    b"BZh",                     # bzip2
+    b"\x04\x22\x4d\x18",        # lz4
+    b"PK\x03\x04",              # zip, jar, docx, ...
+    b"7z\xbc\xaf\x27\x1c",      # 7z
+    b"\x89PNG",                 # png
+    b"\xff\xd8\xff",            # jpeg
+    b"GIF8",                    # gif
+)
+
+CODECS = ("gzip", "zstd")
+
+# Content type of the objects compressed with each codec
+CONTENT_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+
+def available_codecs():
+    """
+    :return: Tuple of the codec names that can be used, zstd is only available if zstandard is installed
+    """
+    return tuple(codec for codec in CODECS if codec != "zstd" or zstandard is not None)
+
+
+def check_codec(codec):
+    """
+    :param codec: codec name
+    :return: codec if it can be used
+    """
+    if codec not in available_codecs():
+        if codec == "zstd":
+            raise LocalFileException("Compression codec zstd requires the zstandard package") from None
+        raise LocalFileException("Unknown compression codec: %s" % codec) from None
+    return codec
+
+
+def content_type(codec, original_size, original_md5):
+    """
+    :param codec: codec name
+    :param original_size: size of the original file in bytes
+    :param original_md5: md5 hash of the original file
+    :return: Content type of an object compressed with codec. The container listing only has the size and etag
+             of the compressed bytes, so those of the original file are added as parameters, which
+             swiftarchive.listing.RemoteListing compares instead.
+    """
+    return "%s; swift_archive_original_size=%d; swift_archive_original_md5=%s" % \
+        (CONTENT_TYPES[codec], original_size, original_md5)
+
+
+def compressor(codec, level=None):
+    """
+    :param codec: codec name
+    :param level: compression level. Default is None (the codec's default level).
+    :return: Object with compress(data) and flush() methods
+    """
+    check_codec(codec)
+
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+    # wbits 31 writes a gzip header and trailer, so the object can also be read with gunzip
+    return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+
+
+def decompressor(codec):
+    """
+    :param codec: codec name
+    :return: Object with decompress(data) and flush() methods
+    """
+    check_codec(codec)
+
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    return zlib.decompressobj(31)
+
+
+def compressible(sample, codec, level=None, min_ratio=0.9):
+    """
+    Decide from a sample of the start of a file whether compressing the file is worthwhile
+    :param sample: bytes from the start of the file
+    :param codec: codec name
+    :param level: compression level. Default is None (the codec's default level).
+    :param min_ratio: The sample must compress to less than min_ratio of its size. Default is 0.9.
+    :return: True if the file should be compressed
+    """
+    if not sample or sample.startswith(COMPRESSED_MAGIC):
+        return False
+
+    sample_compressor = compressor(codec, level)
+    compressed = len(sample_compressor.compress(sample)) + len(sample_compressor.flush())
+
+    return compressed < len(sample) * min_ratio
+
+
+class CompressingReader:
+
+    def __init__(self, stream, codec, level=None, offset=0, chunk_size=1048576):
+        """
+        File-like wrapper that compresses the bytes read from stream, so a file can be compressed while
+        it is uploaded without a temporary file. The md5 hashes of both the original bytes and the
+        compressed bytes are calculated on the way through.
+        :param stream: Binary file object to read from, positioned at offset
+        :param codec: codec name
+        :param level: compression level. Default is None (the codec's default level).
+        :param offset: Position in stream that reset rewinds to. Default is 0.
+        :param chunk_size: Number of bytes read from stream at a time. Default is 1MiB.
+        """
+        self.stream = stream
+        self.codec = codec
+        self.level = level
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.reset()
+
+    def read(self, size=-1):
+        """
+        :param size: Maximum number of bytes to read. Default is -1 (read to the end of the stream)
+        :return: Compressed bytes, b"" once the stream is exhausted
+        """
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = self.stream.read(self.chunk_size)
+
+            if chunk:
+                self.original_md5.update(chunk)
+                self.original_size += len(chunk)
+                self.buffer += self.compressor.compress(chunk)
+            else:
+                self.buffer += self.compressor.flush()
+                self.finished = True
+
+        if size < 0:
+            size = len(self.buffer)
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.hash_md5.update(data)
+        self.size += len(data)
+        return data
+
+    def reset(self):
+        """
+        Rewind the stream and restart the compression and hashes (used when retrying an upload)
+        """
+        self.stream.seek(self.offset)
+        self.compressor = compressor(self.codec, self.level)
+        self.buffer = bytearray()
+        self.finished = False
+        self.hash_md5 = hashlib.md5()
+        self.size = 0
+        self.original_md5 = hashlib.md5()
+        self.original_size = 0
+
+    def hexdigest(self):
+        """
+        :return: md5 hash of the compressed bytes read so far
+        """
+        return self.hash_md5.hexdigest()
+
+    def original_hexdigest(self):
+        """
+        :return: md5 hash of the original bytes compressed so far
+        """
+        return self.original_md5.hexdigest()
+
+
+class DecompressingWriter:
+
+    def __init__(self, stream, codec):
+        """
+        File-like wrapper that decompresses the bytes written through it, so a compressed object can be
+        restored while it is downloaded
+        :param stream: Binary file object the decompressed bytes are written to
+        :param codec: codec name
+        """
+        self.stream = stream
+        self.decompressor = decompressor(codec)
+
+    def write(self, data):
+        """
+        :param data: Compressed bytes
+        :return: Number of compressed bytes written
+        """
+        try:
+            decompressed = self.decompressor.decompress(data)
+        except Exception as ex:
+            # zlib.error and zstandard.ZstdError
+            raise LocalFileException("Unable to decompress: %s" % ex) from None
+
+        self.stream.write(decompressed)
+        return len(data)
+
+    def flush(self):
+        """
+        Write any decompressed bytes still held by the decompressor
+        """
+        self.stream.write(self.decompressor.flush())
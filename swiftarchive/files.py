@@ -1,76 +1,267 @@
 #!/usr/bin/env python
 
 import os
+import mmap
 import time
+import queue
 import errno
+import random
+import logging
 import hashlib
+import threading
+import collections
 
 from swiftarchive.exceptions import LocalFileException
 
+logger = logging.getLogger('swiftarchive.files')
 
-def get_files(path, seconds_since_updated=0):
+# A file found by scan_files, with the size, mtime and inode from the directory scan
+FileRecord = collections.namedtuple('FileRecord', ['path', 'size', 'mtime', 'inode'])
+
+
+def scan_files(path, seconds_since_updated=0):
     """
+    Walk path with os.scandir, reusing the file type and stat information cached on each DirEntry
+    so every file costs at most one stat call
     :param path: Path to the files
     :param seconds_since_updated: Number of seconds since the file was updated. Default is 0.
-    :return: List of files in path
+    :return: Generator yielding a FileRecord for each file in path as it is found
     """
-    file_list = []
+    seconds_since_updated = parse_seconds_since_updated(seconds_since_updated)
 
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            # Construct the full path to the file
-            file_path = os.path.join(root, file)
+    directories = [path]
 
-            # Exclude symlinks
-            if os.path.islink(file_path) is False:
-                # If the file is older than seconds_since_updated then add it to file_list
-                if check_modified_time(file_path, seconds_since_updated):
-                    file_list.append(file_path)
+    while directories:
+        subdirectories = []
 
-    return file_list
+        for record in scan_directory(directories.pop(), seconds_since_updated, subdirectories):
+            yield record
 
+        # Walk the subdirectories in the order they were listed
+        directories.extend(reversed(subdirectories))
 
-def check_modified_time(file_path, seconds_since_updated):
+
+def scan_files_parallel(path, seconds_since_updated=0, workers=8, queue_size=1000):
     """
-    :param file_path: Path to the file
-    :param seconds_since_updated: Number of seconds since the file was updated.
-    :return: True if file is older than seconds_since_updated else False
+    Walk path with a pool of threads, for trees where the walk is limited by metadata latency
+    :param path: Path to the files
+    :param seconds_since_updated: Number of seconds since the file was updated. Default is 0.
+    :param workers: Number of directories scanned at the same time. Default is 8.
+    :param queue_size: Maximum number of files found but not yet consumed. Default is 1000.
+    :return: Generator yielding a FileRecord for each file in path as it is found
     """
-    # Set the default modified time to now
-    mtime = time.time()
+    return iter(ParallelScanner(path, seconds_since_updated, workers, queue_size))
 
-    # Find the last modified time of the file
-    try:
-        mtime = os.path.getmtime(file_path)
-    except OSError as ex:
-        if ex.errno == errno.ENOENT:
-            raise LocalFileException("File \"%s\" could not be found" % file_path) from None
-        elif ex.errno == errno.EACCES:
-            raise LocalFileException("Permission error with \"%s\"" % file_path) from None
-        else:
-            raise LocalFileException("Unknown error with \"%s\": %s" % (file_path, ex.strerror)) from None
 
+def object_name(file_path, strip_path=""):
+    """
+    :param file_path: Path of the file
+    :param strip_path: Remove the strip_path from the start of file_path. Default is "".
+    :return: Name of the object file_path is uploaded to
+    """
+    return file_path[len(strip_path):]
+
+
+def parse_seconds_since_updated(seconds_since_updated):
+    """
+    :param seconds_since_updated: Number of seconds since the file was updated.
+    :return: seconds_since_updated as a float
+    """
     try:
-        # If the file is older than seconds_since_updated then return True
-        if time.time() - mtime > float(seconds_since_updated):
-            return True
-        else:
-            return False
+        return float(seconds_since_updated)
     except ValueError:
         raise LocalFileException("Invalid seconds_since_updated: %s" % seconds_since_updated) from None
 
 
-def md5(file_path):
+class ParallelScanner:
+
+    def __init__(self, path, seconds_since_updated=0, workers=8, queue_size=1000):
+        """
+        Work-stealing directory walker. Each worker keeps its own deque of directories, scanning the
+        newest one it found itself and stealing the oldest one from another worker when it runs out.
+        The files found by every worker are merged into a single bounded queue.
+        :param path: Path to the files
+        :param seconds_since_updated: Number of seconds since the file was updated. Default is 0.
+        :param workers: Number of directories scanned at the same time. Default is 8.
+        :param queue_size: Maximum number of files found but not yet consumed. Default is 1000.
+        """
+        self.seconds_since_updated = parse_seconds_since_updated(seconds_since_updated)
+        self.workers = max(1, int(workers))
+        self.records = queue.Queue(maxsize=queue_size)
+
+        self.deques = [collections.deque() for worker in range(self.workers)]
+        self.deques[0].append(path)
+
+        # Number of directories queued or being scanned; the walk is finished when it reaches 0
+        self.pending = 1
+        self.pending_lock = threading.Condition()
+
+        self.finished = threading.Event()
+        self.error = None
+
+    def __iter__(self):
+        threads = [threading.Thread(target=self.worker, args=(worker,), name="scan-%s" % worker, daemon=True)
+                   for worker in range(self.workers)]
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                if self.error is not None:
+                    raise self.error
+
+                try:
+                    record = self.records.get(timeout=0.1)
+                except queue.Empty:
+                    # Every record is queued before the walk is marked finished
+                    if self.finished.is_set() and self.records.empty():
+                        return
+                    continue
+
+                yield record
+        finally:
+            # Stop the workers if the consumer stops early or the walk failed
+            self.finished.set()
+
+    def worker(self, worker):
+        """
+        Scan directories until the walk is finished
+        :param worker: Index of the worker's own deque
+        """
+        try:
+            while not self.finished.is_set():
+                directory = self.next_directory(worker)
+
+                if directory is None:
+                    with self.pending_lock:
+                        if self.pending > 0 and not self.finished.is_set():
+                            self.pending_lock.wait(0.05)
+                    continue
+
+                subdirectories = []
+
+                for record in scan_directory(directory, self.seconds_since_updated, subdirectories):
+                    if self.put(record) is False:
+                        return
+
+                # Queue the subdirectories before this directory stops counting as pending
+                self.deques[worker].extend(subdirectories)
+
+                with self.pending_lock:
+                    self.pending += len(subdirectories) - 1
+                    if self.pending == 0:
+                        self.finished.set()
+                    self.pending_lock.notify_all()
+        except BaseException as ex:
+            if self.error is None:
+                self.error = ex
+            self.finished.set()
+
+    def next_directory(self, worker):
+        """
+        :param worker: Index of the worker's own deque
+        :return: The newest directory on the worker's own deque, the oldest directory stolen from
+                 another worker, or None if there are no directories waiting to be scanned
+        """
+        try:
+            return self.deques[worker].pop()
+        except IndexError:
+            pass
+
+        offset = random.randrange(self.workers)
+
+        for victim in range(self.workers):
+            try:
+                return self.deques[(offset + victim) % self.workers].popleft()
+            except IndexError:
+                pass
+
+        return None
+
+    def put(self, record):
+        """
+        Put a record on the bounded output queue without blocking forever if the walk is stopped
+        :param record: FileRecord found by a worker
+        :return: True if the record was queued, False if the walk was stopped
+        """
+        while not self.finished.is_set():
+            try:
+                self.records.put(record, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def scan_directory(directory, seconds_since_updated, subdirectories, changed_since=None):
+    """
+    Scan a single directory
+    :param directory: Path to the directory
+    :param seconds_since_updated: Number of seconds since the file was updated.
+    :param subdirectories: List the subdirectories of directory are appended to
+    :param changed_since: Only yield files whose inode changed (st_ctime) at or after this unix time, which
+                          unlike the mtime includes files renamed or copied into directory with their original
+                          mtime. Default is None (every file).
+    :return: Generator yielding a FileRecord for each file in directory older than seconds_since_updated
+    """
+    try:
+        entries = os.scandir(directory)
+    except OSError as ex:
+        # Skip directories that can't be listed, the same as os.walk
+        logger.debug("unable to scan %s: %s", directory, ex.strerror)
+        return
+
+    with entries:
+        for entry in entries:
+            # Exclude symlinks
+            if entry.is_symlink():
+                continue
+
+            if entry.is_dir():
+                subdirectories.append(entry.path)
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError as ex:
+                if ex.errno == errno.ENOENT:
+                    raise LocalFileException("File \"%s\" could not be found" % entry.path) from None
+                elif ex.errno == errno.EACCES:
+                    raise LocalFileException("Permission error with \"%s\"" % entry.path) from None
+                else:
+                    raise LocalFileException("Unknown error with \"%s\": %s" %
+                                             (entry.path, ex.strerror)) from None
+
+            if changed_since is not None and stat.st_ctime < changed_since:
+                continue
+
+            # If the file is older than seconds_since_updated then yield it
+            if time.time() - stat.st_mtime > seconds_since_updated:
+                yield FileRecord(entry.path, stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+def md5(file_path, offset=0, length=None, buffer_size=1048576, mmap_threshold=67108864):
     """
     :param file_path: Path to the file
+    :param offset: Position in the file to start hashing from. Default is 0.
+    :param length: Number of bytes to hash. Default is None (hash to the end of the file)
+    :param buffer_size: Number of bytes hashed per read. Default is 1MiB.
+    :param mmap_threshold: Regions of at least mmap_threshold bytes are hashed from a memory map instead
+                           of being read into a buffer. Default is 64MiB, 0 to never use a memory map.
     :return: md5 hash of file_path
     """
     hash_md5 = hashlib.md5()
 
     try:
         with open(file_path, "rb") as local:
-            for chunk in iter(lambda: local.read(4096), b""):
-                hash_md5.update(chunk)
+            file_size = os.fstat(local.fileno()).st_size
+            remaining = max(0, file_size - offset) if length is None else min(length, max(0, file_size - offset))
+
+            if 0 < mmap_threshold <= remaining:
+                md5_mmap(local, hash_md5, offset, remaining, buffer_size)
+            else:
+                md5_read(local, hash_md5, offset, remaining, buffer_size)
     except OSError as ex:
         if ex.errno == errno.ENOENT:
             raise LocalFileException("File \"%s\" could not be found" % file_path) from None
@@ -82,6 +273,143 @@ def md5(file_path):
     return hash_md5.hexdigest()
 
 
+def md5_read(local, hash_md5, offset, length, buffer_size):
+    """
+    Hash a region of a file, reading it into one reused buffer
+    :param local: Binary file object
+    :param hash_md5: hashlib md5 object to update
+    :param offset: Position in the file to start hashing from
+    :param length: Number of bytes to hash
+    :param buffer_size: Number of bytes hashed per read
+    """
+    buffer = memoryview(bytearray(max(1, min(buffer_size, length))))
+    local.seek(offset)
+
+    while length > 0:
+        read = local.readinto(buffer[:min(len(buffer), length)])
+        if not read:
+            break
+        hash_md5.update(buffer[:read])
+        length -= read
+
+
+def md5_mmap(local, hash_md5, offset, length, buffer_size):
+    """
+    Hash a region of a file from a read-only memory map, without copying it into Python buffers.
+    hashlib releases the GIL while hashing large buffers, so regions can be hashed on several threads.
+    :param local: Binary file object
+    :param hash_md5: hashlib md5 object to update
+    :param offset: Position in the file to start hashing from
+    :param length: Number of bytes to hash
+    :param buffer_size: Number of bytes hashed per update
+    """
+    # The offset of a memory map has to be a multiple of the allocation granularity
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+
+    with mmap.mmap(local.fileno(), length + offset - start, offset=start, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+        with memoryview(mapped) as view:
+            # Hash in large steps to keep the number of Python calls per gigabyte low
+            step = max(buffer_size, 16777216)
+            for position in range(offset - start, offset - start + length, step):
+                with view[position:min(position + step, offset - start + length)] as chunk:
+                    hash_md5.update(chunk)
+
+
+class HashingReader:
+
+    def __init__(self, stream, offset=0):
+        """
+        File-like wrapper that calculates the md5 hash of the bytes read through it, so a file
+        can be hashed and uploaded in a single pass
+        :param stream: Binary file object to read from, positioned at offset
+        :param offset: Position in stream that reset rewinds to. Default is 0.
+        """
+        self.stream = stream
+        self.offset = offset
+        self.hash_md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        """
+        :param size: Maximum number of bytes to read. Default is -1 (read to the end of the stream)
+        :return: Bytes read from the stream
+        """
+        chunk = self.stream.read(size)
+        self.hash_md5.update(chunk)
+        return chunk
+
+    def reset(self):
+        """
+        Rewind the stream and restart the hash (used by swiftclient when retrying an upload)
+        """
+        self.stream.seek(self.offset)
+        self.hash_md5 = hashlib.md5()
+
+    def hexdigest(self):
+        """
+        :return: md5 hash of the bytes read so far
+        """
+        return self.hash_md5.hexdigest()
+
+
+class HashingWriter:
+
+    def __init__(self, stream, segment_size=None):
+        """
+        File-like wrapper that calculates the md5 hash of the bytes written through it, so a download
+        can be verified while it is written to disk
+        :param stream: Binary file object to write to
+        :param segment_size: Also hash every segment_size bytes separately, to verify a Static Large
+                             Object. Default is None.
+        """
+        self.stream = stream
+        self.hash_md5 = hashlib.md5()
+        self.segment_size = segment_size
+        self.segment_md5s = []
+        self.segment_md5 = hashlib.md5()
+        self.segment_length = 0
+
+    def write(self, data):
+        """
+        :param data: Bytes to write to the stream
+        :return: Number of bytes written
+        """
+        self.stream.write(data)
+        self.hash_md5.update(data)
+
+        if self.segment_size:
+            view = memoryview(data)
+            while view:
+                length = min(len(view), self.segment_size - self.segment_length)
+                self.segment_md5.update(view[:length])
+                self.segment_length += length
+                view = view[length:]
+
+                if self.segment_length == self.segment_size:
+                    self.segment_md5s.append(self.segment_md5.hexdigest())
+                    self.segment_md5 = hashlib.md5()
+                    self.segment_length = 0
+
+        return len(data)
+
+    def hexdigest(self):
+        """
+        :return: md5 hash of the bytes written so far
+        """
+        return self.hash_md5.hexdigest()
+
+    def slo_hexdigest(self):
+        """
+        :return: md5 hash of the segment md5 hashes, the etag of a Static Large Object
+        """
+        segment_md5s = list(self.segment_md5s)
+        if self.segment_length:
+            segment_md5s.append(self.segment_md5.hexdigest())
+        return hashlib.md5("".join(segment_md5s).encode()).hexdigest()
+
+
 def delete(file_path):
     """
     :param file_path: Path to the file
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import os
+import sqlite3
+import logging
+import tempfile
+import threading
+
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.index')
+
+
+class StateIndex:
+
+    def __init__(self, db_path, commit_interval=1000):
+        """
+        Persistent SQLite index of the files that have been uploaded, used to skip unchanged files on
+        later runs without reading or hashing them
+        :param db_path: Path to the SQLite database (created if it doesn't exist)
+        :param commit_interval: Number of updates between commits. Default is 1000.
+        """
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+
+        try:
+            # The index is read by the scan stage and written by the verify stage
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                            "container TEXT NOT NULL, "
+                            "path TEXT NOT NULL, "
+                            "size INTEGER NOT NULL, "
+                            "mtime REAL NOT NULL, "
+                            "inode INTEGER NOT NULL, "
+                            "etag TEXT NOT NULL, "
+                            "PRIMARY KEY (container, path))")
+            self.db.commit()
+        except sqlite3.Error as ex:
+            raise LocalFileException("Unable to open state index \"%s\": %s" % (db_path, ex)) from None
+
+    def unchanged(self, container, record):
+        """
+        :param container: OpenStack Swift container the file is uploaded to
+        :param record: swiftarchive.files.FileRecord from the scan
+        :return: True if the file was uploaded to container with the same size, mtime and inode
+        """
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime, inode FROM files WHERE container = ? AND path = ?",
+                                  (container, record.path)).fetchone()
+
+        return row is not None and tuple(row) == (record.size, record.mtime, record.inode)
+
+    def update(self, container, record, etag):
+        """
+        Record that a file has been uploaded and verified
+        :param container: OpenStack Swift container the file was uploaded to
+        :param record: swiftarchive.files.FileRecord from the scan
+        :param etag: etag (md5 hash) returned by Swift
+        """
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO files (container, path, size, mtime, inode, etag) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (container, record.path, record.size, record.mtime, record.inode, etag))
+            self.uncommitted += 1
+
+            # Commit in batches; anything not committed after a crash is uploaded again on the next run
+            if self.uncommitted >= self.commit_interval:
+                self.db.commit()
+                self.uncommitted = 0
+
+    def close(self):
+        """
+        Commit any pending updates and close the database
+        """
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+class DedupIndex:
+
+    def __init__(self, db_path, commit_interval=1000):
+        """
+        Persistent SQLite index of the objects uploaded, keyed by the size and md5 hash of their files,
+        used to create the objects of duplicate files with a server-side copy instead of uploading them
+        :param db_path: Path to the SQLite database (created if it doesn't exist)
+        :param commit_interval: Number of updates between commits. Default is 1000.
+        """
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+
+        try:
+            # The index is read and written by every upload thread
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS objects ("
+                            "size INTEGER NOT NULL, "
+                            "etag TEXT NOT NULL, "
+                            "container TEXT NOT NULL, "
+                            "name TEXT NOT NULL, "
+                            "PRIMARY KEY (size, etag))")
+            self.db.commit()
+        except sqlite3.Error as ex:
+            raise LocalFileException("Unable to open dedup index \"%s\": %s" % (db_path, ex)) from None
+
+    def lookup(self, size, etag):
+        """
+        :param size: size of the file in bytes
+        :param etag: md5 hash of the file, as calculated by swiftarchive.swift.Swift.local_etag
+        :return: Tuple of the container and object name of an object with the same contents, or None
+        """
+        with self.lock:
+            row = self.db.execute("SELECT container, name FROM objects WHERE size = ? AND etag = ?",
+                                  (size, etag)).fetchone()
+
+        return tuple(row) if row is not None else None
+
+    def add(self, container, name, size, etag):
+        """
+        Record the object a file was uploaded to
+        :param container: OpenStack Swift container of the object
+        :param name: object name
+        :param size: size of the file in bytes
+        :param etag: md5 hash of the file
+        """
+        self._execute("INSERT OR REPLACE INTO objects (size, etag, container, name) VALUES (?, ?, ?, ?)",
+                      (size, etag, container, name))
+
+    def remove(self, size, etag):
+        """
+        Forget the object of a file, when it no longer exists or has been replaced
+        :param size: size of the file in bytes
+        :param etag: md5 hash of the file
+        """
+        self._execute("DELETE FROM objects WHERE size = ? AND etag = ?", (size, etag))
+
+    def _execute(self, sql, parameters):
+        with self.lock:
+            self.db.execute(sql, parameters)
+            self.uncommitted += 1
+
+            # Commit in batches; anything not committed after a crash is just uploaded again
+            if self.uncommitted >= self.commit_interval:
+                self.db.commit()
+                self.uncommitted = 0
+
+    def close(self):
+        """
+        Commit any pending updates and close the database
+        """
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+class SpillTable:
+
+    def __init__(self, columns, max_entries=1000000, directory=None):
+        """
+        Mapping of a text key to a tuple of values, kept in a dict until it holds max_entries entries and
+        then moved to a temporary SQLite database, so the per-file state of a large tree is bounded in
+        memory rather than growing with the number of files
+        :param columns: Number of values stored for each key
+        :param max_entries: Number of entries kept in memory before spilling to disk. Default is 1000000.
+        :param directory: Directory the temporary database is created in. Default is None (the system
+                          temporary directory).
+        """
+        self.columns = int(columns)
+        self.max_entries = int(max_entries)
+        self.directory = directory
+        self.entries = {}
+        self.db = None
+        self.db_path = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: text key
+        :return: Tuple of the values stored for key, or None
+        """
+        with self.lock:
+            if self.db is None:
+                return self.entries.get(key)
+
+            row = self.db.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+
+        return tuple(row[1:]) if row is not None else None
+
+    def set(self, key, values):
+        """
+        :param key: text key
+        :param values: Sequence of columns values (None, int, float, str or bytes)
+        """
+        with self.lock:
+            if self.db is None:
+                self.entries[key] = tuple(values)
+                if len(self.entries) > self.max_entries:
+                    self._spill()
+                return
+
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?%s)" % (", ?" * self.columns),
+                            (key,) + tuple(values))
+
+    def delete(self, key):
+        """
+        :param key: text key
+        """
+        with self.lock:
+            if self.db is None:
+                self.entries.pop(key, None)
+            else:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def items(self):
+        """
+        :return: Generator yielding a tuple of the key and the values of each entry
+        """
+        if self.db is None:
+            for key, values in list(self.entries.items()):
+                yield key, values
+            return
+
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM entries")
+
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(10000)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], tuple(row[1:])
+
+    def __len__(self):
+        with self.lock:
+            if self.db is None:
+                return len(self.entries)
+            return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _spill(self):
+        fd, self.db_path = tempfile.mkstemp(prefix="swift-archive-", suffix=".db", dir=self.directory)
+        os.close(fd)
+
+        logger.debug("spilling %s entries to %s", len(self.entries), self.db_path)
+
+        try:
+            # The database only lives as long as the run, so it doesn't need to survive a crash
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=OFF")
+            self.db.execute("PRAGMA synchronous=OFF")
+            self.db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY%s) WITHOUT ROWID" %
+                            "".join(", c%s" % column for column in range(self.columns)))
+            self.db.executemany("INSERT INTO entries VALUES (?%s)" % (", ?" * self.columns),
+                                ((key,) + values for key, values in self.entries.items()))
+        except sqlite3.Error as ex:
+            self._remove()
+            raise LocalFileException("Unable to create spill database \"%s\": %s" % (self.db_path, ex)) from None
+
+        self.entries = {}
+
+    def _remove(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if self.db_path is not None and os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        self.db_path = None
+
+    def close(self):
+        """
+        Drop the entries and remove the temporary database
+        """
+        with self.lock:
+            self.entries = {}
+            self._remove()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import errno
+import logging
+import threading
+
+import swiftarchive.index
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.journal')
+
+# States of a file in the order it reaches them
+PLANNED = "planned"
+UPLOADED = "uploaded"
+VERIFIED = "verified"
+DELETED = "deleted"
+
+STATES = (PLANNED, UPLOADED, VERIFIED, DELETED)
+
+
+class RunJournal:
+
+    def __init__(self, journal_path, container, archive_path, sync_interval=1.0, max_entries=1000000,
+                 spill_directory=None):
+        """
+        Append-only journal of the files of a run and how far each one got: planned, uploaded,
+        verified and deleted. A run that doesn't finish leaves the journal open, and the next run
+        with the same container and archive path resumes from it instead of starting over.
+        Each record is flushed to the operating system as it is written, so it survives the
+        process being killed, and is synced to disk every sync_interval seconds.
+        :param journal_path: Path to the journal (created if it doesn't exist)
+        :param container: OpenStack Swift container of the run
+        :param archive_path: Local path being archived
+        :param sync_interval: Seconds between syncs of the journal to disk. Default is 1.0.
+        :param max_entries: Number of files of an interrupted run kept in memory before they are spilled to a
+                            temporary SQLite database. Default is 1000000.
+        :param spill_directory: Directory the temporary database is created in. Default is None (the system
+                                temporary directory).
+        """
+        self.journal_path = journal_path
+        self.container = container
+        self.archive_path = archive_path
+        self.sync_interval = float(sync_interval)
+        self.max_entries = max_entries
+        self.spill_directory = spill_directory
+        self.lock = threading.Lock()
+
+        # File path -> (size, mtime, inode, state, etag) of the interrupted run being resumed
+        self.files = swiftarchive.index.SpillTable(5, max_entries, spill_directory)
+        self.resumed = False
+
+        self.load()
+
+        # Compact the journal to the files still of interest, so it doesn't grow across restarts
+        part_path = "%s.%s.tmp" % (journal_path, os.getpid())
+
+        try:
+            with open(part_path, "w") as journal:
+                self._write(journal, {"state": "started", "container": container, "archive_path": archive_path,
+                                      "time": time.time()})
+                for path, (size, mtime, inode, state, etag) in self.files.items():
+                    self._write(journal, {"state": PLANNED, "path": path, "size": size, "mtime": mtime,
+                                          "inode": inode})
+                    if state != PLANNED:
+                        self._write(journal, {"state": state, "path": path, "etag": etag})
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(part_path, journal_path)
+
+            self.journal = open(journal_path, "a")
+        except OSError as ex:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            self.files.close()
+            raise journal_exception(journal_path, ex) from None
+
+        self.synced = time.monotonic()
+
+    def load(self):
+        """
+        Read the journal left by an interrupted run of the same container and archive path
+        """
+        files = swiftarchive.index.SpillTable(5, self.max_entries, self.spill_directory)
+        run = None
+
+        try:
+            # Read a line at a time, the journal of a large run doesn't fit in memory
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line is torn if the run was killed while writing it
+                        logger.debug("ignoring partial journal line: %r", line)
+                        continue
+
+                    state = entry.get("state")
+
+                    if state == "started" or state == "finished":
+                        run = (entry.get("container"), entry.get("archive_path")) if state == "started" else None
+                        files.close()
+                        files = swiftarchive.index.SpillTable(5, self.max_entries, self.spill_directory)
+                    elif state == PLANNED:
+                        files.set(entry["path"], (entry["size"], entry["mtime"], entry["inode"], PLANNED, None))
+                    elif state in STATES:
+                        values = files.get(entry.get("path"))
+                        if values is not None:
+                            files.set(entry["path"], values[:3] + (state, entry.get("etag")))
+        except OSError as ex:
+            files.close()
+            if ex.errno == errno.ENOENT:
+                return
+            raise journal_exception(self.journal_path, ex) from None
+
+        if run is None:
+            files.close()
+            return
+
+        if run != (self.container, self.archive_path):
+            files.close()
+            logger.info("journal %s is for %s in container %s, starting a new run", self.journal_path, run[1], run[0])
+            return
+
+        # Deleted files won't be found again and planned files start over, so only keep the others
+        planned = 0
+        for path, values in files.items():
+            planned += 1
+            if values[3] in (UPLOADED, VERIFIED):
+                self.files.set(path, values)
+        files.close()
+        self.resumed = True
+
+        logger.info("resuming an interrupted run: %s of %s planned files were uploaded and not yet deleted",
+                    len(self.files), planned)
+
+    def resume(self, record):
+        """
+        :param record: swiftarchive.files.FileRecord from the scan
+        :return: etag (md5 hash) of the file if the interrupted run uploaded it and it hasn't changed since,
+                 otherwise None
+        """
+        entry = self.files.get(record.path)
+
+        if entry is not None and entry[:3] == (record.size, record.mtime, record.inode):
+            return entry[4]
+
+        return None
+
+    def planned(self, record):
+        """
+        :param record: swiftarchive.files.FileRecord queued for upload
+        """
+        self.record({"state": PLANNED, "path": record.path, "size": record.size, "mtime": record.mtime,
+                     "inode": record.inode})
+
+    def uploaded(self, record, etag):
+        """
+        :param record: swiftarchive.files.FileRecord uploaded to Swift
+        :param etag: etag (md5 hash) returned by Swift
+        """
+        self.record({"state": UPLOADED, "path": record.path, "etag": etag})
+
+    def verified(self, record, etag):
+        """
+        :param record: swiftarchive.files.FileRecord whose object in Swift matches its md5 hash
+        :param etag: etag (md5 hash) of the object
+        """
+        self.record({"state": VERIFIED, "path": record.path, "etag": etag})
+
+    def deleted(self, record):
+        """
+        :param record: swiftarchive.files.FileRecord deleted after it was verified
+        """
+        self.record({"state": DELETED, "path": record.path})
+
+    def record(self, entry):
+        """
+        Append an entry to the journal
+        :param entry: dict written as one JSON line
+        """
+        with self.lock:
+            try:
+                self._write(self.journal, entry)
+                self.journal.flush()
+
+                if time.monotonic() - self.synced >= self.sync_interval:
+                    os.fsync(self.journal.fileno())
+                    self.synced = time.monotonic()
+            except OSError as ex:
+                raise journal_exception(self.journal_path, ex) from None
+
+    def finish(self):
+        """
+        Mark the run as finished, so the next run starts over
+        """
+        self.record({"state": "finished", "time": time.time()})
+
+    def close(self):
+        """
+        Sync and close the journal
+        """
+        with self.lock:
+            try:
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+            except OSError as ex:
+                raise journal_exception(self.journal_path, ex) from None
+            finally:
+                self.journal.close()
+                self.files.close()
+
+    @staticmethod
+    def _write(journal, entry):
+        journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def journal_exception(journal_path, ex):
+    """
+    :param journal_path: Path to the journal
+    :param ex: OSError raised while reading or writing the journal
+    :return: LocalFileException describing the error
+    """
+    if ex.errno == errno.ENOENT:
+        return LocalFileException("File \"%s\" could not be found" % journal_path)
+    elif ex.errno == errno.EACCES:
+        return LocalFileException("Permission error with \"%s\"" % journal_path)
+    return LocalFileException("Unknown error with \"%s\": %s" % (journal_path, ex.strerror))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import time
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger('swiftarchive.limiter')
+
+
+class AdaptiveLimiter:
+
+    def __init__(self, maximum, minimum=1, initial=1, latency_factor=2.5, decrease=0.5, cooldown=1.0,
+                 reference_bytes=1048576):
+        """
+        Additive increase, multiplicative decrease (AIMD) limit on the number of uploads in flight.
+        The limit doubles every round of successful uploads until the first decrease (slow start) and
+        then grows by one per round. It is cut when Swift throttles a request (429, 498 or 503) or
+        when the latency of an upload spikes above the running average.
+        :param maximum: Highest limit, normally the size of the connection pool
+        :param minimum: Lowest limit. Default is 1.
+        :param initial: Starting limit. Default is 1.
+        :param latency_factor: Latency more than latency_factor times the average is a spike. Default is 2.5.
+        :param decrease: Factor the limit is multiplied by on throttling or a latency spike. Default is 0.5.
+        :param cooldown: Minimum seconds between decreases, so a burst of throttled requests that were all
+                         sent at the old limit only cuts it once. Default is 1.0.
+        :param reference_bytes: Latencies are normalised to uploads of this many bytes, so large and small
+                                uploads can be compared. Default is 1MiB.
+        """
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.limit = float(max(self.minimum, min(int(initial), self.maximum)))
+        self.latency_factor = float(latency_factor)
+        self.decrease = float(decrease)
+        self.cooldown = float(cooldown)
+        self.reference_bytes = int(reference_bytes)
+
+        self.active = 0
+        self.latency = None
+        self.slow_start = True
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Wait until there is room under the limit for another upload
+        """
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def success(self, seconds, length=0):
+        """
+        Record a successful upload
+        :param seconds: Time the upload took
+        :param length: Number of bytes uploaded. Default is 0.
+        """
+        latency = seconds / (1.0 + float(length) / self.reference_bytes)
+
+        with self.condition:
+            average = self.latency
+            # The average follows every upload, so a lasting change in latency stops counting as a spike
+            self.latency = latency if average is None else 0.9 * average + 0.1 * latency
+
+            if average is not None and latency > average * self.latency_factor:
+                self._decrease("latency spike %.3fs (average %.3fs)" % (latency, average))
+            elif self.slow_start:
+                self.limit = min(self.maximum, self.limit + 1.0)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self.condition.notify_all()
+
+    def throttled(self):
+        """
+        Record a request rejected because Swift is throttling
+        """
+        with self.condition:
+            self._decrease("throttled")
+
+    def _decrease(self, reason):
+        now = time.monotonic()
+
+        if now - self.last_decrease < self.cooldown:
+            return
+
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        logger.debug("%s, upload concurrency limit %s", reason, int(self.limit))
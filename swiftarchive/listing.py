@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import logging
+
+import swiftarchive.index
+
+logger = logging.getLogger('swiftarchive.listing')
+
+
+class RemoteListing:
+
+    def __init__(self, max_entries=1000000, spill_directory=None):
+        """
+        Compact lookup of the objects already in a container, built from the paged container listing
+        so deciding whether a file is archived doesn't need a HEAD request per object. The etags are
+        kept as 16 byte digests rather than 32 character strings, and listings of more than max_entries
+        objects are spilled to a temporary SQLite database.
+        :param max_entries: Number of objects kept in memory. Default is 1000000.
+        :param spill_directory: Directory the temporary database is created in. Default is None (the system
+                                temporary directory).
+        """
+        self.objects = swiftarchive.index.SpillTable(2, max_entries, spill_directory)
+
+    def load(self, swift, os_container, prefix=None):
+        """
+        Add every object in a container listing to the lookup
+        :param swift: swiftarchive.swift.Swift object
+        :param os_container: container name
+        :param prefix: only load objects whose names start with prefix
+        :return: Number of objects loaded
+        """
+        loaded = 0
+
+        for swift_object in swift.list_objects(os_container, prefix=prefix):
+            self.add(swift_object["name"], swift_object["bytes"], swift_object["hash"],
+                     slo_etag=swift_object.get("slo_etag"), content_type=swift_object.get("content_type"))
+            loaded += 1
+
+        logger.debug("loaded %s objects from the %s listing", loaded, os_container)
+
+        return loaded
+
+    def add(self, name, size, etag, slo_etag=None, content_type=None):
+        """
+        :param name: object name
+        :param size: object size in bytes
+        :param etag: object etag from the listing
+        :param slo_etag: etag of a Static Large Object from the listing. Default is None.
+        :param content_type: object content type from the listing. Default is None.
+        """
+        # The size and etag of a compressed object are those of the compressed bytes; the size and md5 hash of the
+        # original file are parameters of its content type, see swiftarchive.compress.content_type
+        original = dict(parameter.strip().partition("=")[::2] for parameter in (content_type or "").split(";")[1:])
+        if "swift_archive_original_size" in original and "swift_archive_original_md5" in original:
+            try:
+                size = int(original["swift_archive_original_size"])
+            except ValueError:
+                logger.debug("ignoring %s with content type %s", name, content_type)
+                return
+            etag = original["swift_archive_original_md5"]
+
+        # The hash of a Static Large Object is that of its manifest; its etag is listed as slo_etag, or by older
+        # Swift versions as a parameter after the hash, e.g. "hash; slo_etag=etag"
+        etag, _, parameters = etag.partition(";")
+        for parameter in parameters.split(";"):
+            key, _, value = parameter.strip().partition("=")
+            if key == "slo_etag" and slo_etag is None:
+                slo_etag = value
+        if slo_etag is not None:
+            etag = slo_etag
+        etag = etag.strip().strip('"')
+
+        try:
+            self.objects.set(name, (size, bytes.fromhex(etag)))
+        except ValueError:
+            # Not an md5 etag, so it can never match a local file
+            logger.debug("ignoring %s with etag %s", name, etag)
+
+    def lookup(self, name, size):
+        """
+        :param name: object name
+        :param size: size in bytes of the local file
+        :return: The etag of the object if an object with name and size exists, otherwise None
+        """
+        swift_object = self.objects.get(name)
+
+        if swift_object is None or swift_object[0] != size:
+            return None
+
+        return swift_object[1].hex()
+
+    def close(self):
+        """
+        Drop the listing and remove its temporary database
+        """
+        self.objects.close()
+
+    def __len__(self):
+        return len(self.objects)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import logging
+import resource
+
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.memory')
+
+# Bytes of memory used by each entry of a swiftarchive.index.SpillTable held in memory, with room for long paths
+ENTRY_BYTES = 512
+
+# Bytes of memory used by each file waiting in a pipeline queue
+RECORD_BYTES = 512
+
+# Size a pack is kept in memory up to before it is spooled to a temporary file, see swiftarchive.pack.PackWriter
+PACK_SPOOL_SIZE = 67108864
+
+
+def rss():
+    """
+    :return: Resident set size of the process in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Without /proc fall back to the peak resident set size, in bytes on macOS and KiB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def spill_entries(max_memory):
+    """
+    :param max_memory: Memory limit in bytes
+    :return: Number of entries the container listing and the run journal each keep in memory before spilling to
+             disk, so that together they use at most a quarter of max_memory
+    """
+    return max(1000, int(max_memory) // 8 // ENTRY_BYTES)
+
+
+def buffer_size(workers, queue_size, bulk_threshold=0, bulk_size=67108864, pack_threshold=0, pack_size=268435456):
+    """
+    :param workers: Number of upload workers
+    :param queue_size: Maximum number of files waiting between two pipeline stages
+    :param bulk_threshold: Files of at most bulk_threshold bytes are uploaded in batches. Default is 0.
+    :param bulk_size: Maximum number of bytes in a batch, which is built in memory. Default is 64MiB.
+    :param pack_threshold: Files of at most pack_threshold bytes are packed into pack objects. Default is 0.
+    :param pack_size: Size in bytes a pack object is filled to. Default is 256MiB.
+    :return: Maximum number of bytes the pipeline holds in its queues, bulk batches and packs
+    """
+    size = 2 * int(queue_size) * RECORD_BYTES
+
+    if int(bulk_threshold) > 0:
+        size += int(workers) * int(bulk_size)
+    if int(pack_threshold) > 0:
+        size += int(workers) * min(int(pack_size), PACK_SPOOL_SIZE)
+
+    return size
+
+
+class MemoryLimit:
+
+    def __init__(self, max_memory, interval=1.0):
+        """
+        Limit on the resident memory of the process. The memory used is read at most every interval
+        seconds, so checking it often is cheap.
+        :param max_memory: Maximum resident set size in bytes
+        :param interval: Seconds between reads of the resident set size. Default is 1.0.
+        """
+        self.max_memory = int(max_memory)
+        self.interval = float(interval)
+        self.checked = None
+
+    def check(self):
+        """
+        Raise a LocalFileException if the process uses more than max_memory bytes
+        """
+        now = time.monotonic()
+
+        if self.checked is not None and now - self.checked < self.interval:
+            return
+
+        self.checked = now
+        used = rss()
+
+        if used > self.max_memory:
+            raise LocalFileException("Memory use of %s bytes exceeds the limit of %s bytes" %
+                                     (used, self.max_memory)) from None
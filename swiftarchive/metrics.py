@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import errno
+import bisect
+import logging
+import threading
+import contextlib
+
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.metrics')
+
+PREFIX = "swift_archive_"
+
+COUNTERS = {
+    "files_scanned_total": "Files found by the scan.",
+    "files_uploaded_total": "Files uploaded and verified.",
+    "files_skipped_total": "Files skipped because they were unchanged or already in Swift.",
+    "files_resumed_total": "Files not uploaded again because an interrupted run had uploaded them.",
+    "bytes_uploaded_total": "Bytes of the files uploaded and verified.",
+    "files_deduplicated_total": "Files copied within Swift from an object with the same contents instead of uploaded.",
+    "bytes_deduplicated_total": "Bytes of the files copied within Swift instead of uploaded.",
+    "deletes_total": "Local files deleted after they were verified.",
+    "retries_total": "Uploads retried after a failed request.",
+}
+
+HISTOGRAMS = {
+    "scan_seconds": "Time spent finding each file.",
+    "hash_seconds": "Time spent hashing a local file without uploading it.",
+    "upload_seconds": "Latency of each upload of a file, batch or pack.",
+}
+
+GAUGES = {
+    "run_start_timestamp_seconds": "Unix time the run started.",
+    "run_duration_seconds": "Seconds since the run started.",
+    "last_success_timestamp_seconds": "Unix time the last successful run finished.",
+}
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Metrics:
+
+    def __init__(self, textfile=None, json_file=None, interval=60, labels=None):
+        """
+        Counters, gauges and histograms for a run, written as a Prometheus node exporter textfile
+        and/or as JSON at the end of the run and every interval seconds while it runs
+        :param textfile: Path of the Prometheus textfile to write. Default is None (not written).
+        :param json_file: Path of the JSON file to write. Default is None (not written).
+        :param interval: Seconds between writes while the run is in progress, 0 to only write at the end.
+                         Default is 60.
+        :param labels: dict of labels added to every metric, e.g. {"container": "archive"}. Default is None.
+        """
+        self.textfile = textfile
+        self.json_file = json_file
+        self.interval = float(interval)
+        self.labels = labels or {}
+
+        self.lock = threading.Lock()
+        self.counters = {name: 0 for name in COUNTERS}
+        self.gauges = {name: 0.0 for name in GAUGES}
+        self.histograms = {name: Histogram() for name in HISTOGRAMS}
+
+        self.started = time.time()
+        self.gauges["run_start_timestamp_seconds"] = self.started
+
+        # Keep the time of the last successful run from the files of the previous run, so a failed run doesn't
+        # reset it to 0 and alerts on its age keep working
+        self.gauges["last_success_timestamp_seconds"] = last_success(textfile, json_file)
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def inc(self, name, value=1):
+        """
+        :param name: counter name
+        :param value: amount to add to the counter. Default is 1.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """
+        :param name: gauge name
+        :param value: value of the gauge
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """
+        :param name: histogram name
+        :param value: observed value in seconds
+        """
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Observe the time spent in the with block in a histogram
+        :param name: histogram name
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """
+        :return: dict of the labels, counters, gauges and histograms
+        """
+        with self.lock:
+            self.gauges["run_duration_seconds"] = time.time() - self.started
+            return {"labels": dict(self.labels),
+                    "counters": dict(self.counters),
+                    "gauges": dict(self.gauges),
+                    "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()}}
+
+    def prometheus(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        labels = ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for name, value in sorted(snapshot["labels"].items()))
+        lines = []
+
+        def sample(name, value, extra=""):
+            label_set = ",".join(label for label in (labels, extra) if label)
+            lines.append("%s%s%s %s" % (PREFIX, name, "{%s}" % label_set if label_set else "", value))
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append("# HELP %s%s %s" % (PREFIX, name, COUNTERS.get(name, name)))
+            lines.append("# TYPE %s%s counter" % (PREFIX, name))
+            sample(name, value)
+
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append("# HELP %s%s %s" % (PREFIX, name, GAUGES.get(name, name)))
+            lines.append("# TYPE %s%s gauge" % (PREFIX, name))
+            sample(name, repr(float(value)))
+
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            lines.append("# HELP %s%s %s" % (PREFIX, name, HISTOGRAMS.get(name, name)))
+            lines.append("# TYPE %s%s histogram" % (PREFIX, name))
+            for bucket, count in histogram["buckets"]:
+                sample(name + "_bucket", count, 'le="%s"' % bucket)
+            sample(name + "_sum", repr(float(histogram["sum"])))
+            sample(name + "_count", histogram["count"])
+
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """
+        Write the textfile and JSON file. Each file is written to a temporary file and renamed so the
+        node exporter never reads a partial file.
+        """
+        if self.textfile is not None:
+            write_atomic(self.textfile, self.prometheus())
+
+        if self.json_file is not None:
+            write_atomic(self.json_file, json.dumps(self.snapshot(), indent=2, sort_keys=True) + "\n")
+
+    def start(self):
+        """
+        Write the metrics every interval seconds from a background thread
+        """
+        if self.interval <= 0 or (self.textfile is None and self.json_file is None):
+            return
+
+        self.thread = threading.Thread(target=self._writer, name="metrics", daemon=True)
+        self.thread.start()
+
+    def stop(self, success=False):
+        """
+        Stop the background writer and write the final metrics
+        :param success: True if the run finished successfully. Default is False.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if success is True:
+            self.set("last_success_timestamp_seconds", time.time())
+
+        self.write()
+
+    def _writer(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except LocalFileException as ex:
+                # A failed periodic write shouldn't stop the run; the final write reports the error
+                logger.debug("unable to write metrics: %s", ex)
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        Cumulative histogram with fixed upper bounds
+        :param buckets: Sorted upper bounds of the buckets. Default is BUCKETS.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        :param value: observed value
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        :return: dict of the cumulative [upper bound, count] buckets, the sum and the count
+        """
+        buckets = []
+        cumulative = 0
+
+        for bound, count in zip([repr(float(bound)) for bound in self.buckets] + ["+Inf"], self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+def last_success(textfile=None, json_file=None):
+    """
+    :param textfile: Path of the Prometheus textfile written by the previous run. Default is None.
+    :param json_file: Path of the JSON file written by the previous run. Default is None.
+    :return: Unix time the last successful run finished, 0.0 if neither file has it
+    """
+    name = PREFIX + "last_success_timestamp_seconds"
+
+    if json_file is not None:
+        try:
+            with open(json_file) as local:
+                return float(json.load(local)["gauges"]["last_success_timestamp_seconds"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    if textfile is not None:
+        try:
+            with open(textfile) as local:
+                for line in local:
+                    if line.startswith(name + " ") or line.startswith(name + "{"):
+                        return float(line.rsplit(" ", 1)[1])
+        except (OSError, ValueError, IndexError):
+            pass
+
+    return 0.0
+
+
+def write_atomic(file_path, contents):
+    """
+    :param file_path: Path of the file to write
+    :param contents: String written to the file
+    """
+    part_path = "%s.%s.tmp" % (file_path, os.getpid())
+
+    try:
+        with open(part_path, "w") as local:
+            local.write(contents)
+        os.replace(part_path, file_path)
+    except OSError as ex:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if ex.errno == errno.ENOENT:
+            raise LocalFileException("File \"%s\" could not be found" % file_path) from None
+        elif ex.errno == errno.EACCES:
+            raise LocalFileException("Permission error with \"%s\"" % file_path) from None
+        else:
+            raise LocalFileException("Unknown error with \"%s\": %s" % (file_path, ex.strerror)) from None
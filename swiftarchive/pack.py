@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import io
+import json
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+
+import swiftarchive.files
+from swiftarchive.exceptions import LocalFileException
+from swiftarchive.exceptions import SwiftException
+
+logger = logging.getLogger('swiftarchive.pack')
+
+
+class PackWriter:
+
+    def __init__(self, swift, container, strip_path="", pack_size=268435456, prefix="packs/"):
+        """
+        Pack many small files into large pack objects. Each pack is uploaded with a sidecar index
+        object listing the name, offset, length and md5 hash of every member, so a member can be
+        retrieved with an HTTP Range request against the pack.
+        :param swift: swiftarchive.swift.Swift object used for the uploads
+        :param container: OpenStack Swift container to upload to
+        :param strip_path: Remove the strip_path from the start of the file paths to get the member names
+        :param pack_size: A pack is uploaded once it holds at least pack_size bytes. Default is 256MiB.
+        :param prefix: Prefix of the pack and index object names. Default is "packs/".
+        """
+        self.swift = swift
+        self.container = container
+        self.strip_path = strip_path
+        self.pack_size = int(pack_size)
+        self.prefix = prefix
+
+        self.pack = None
+        self.members = []
+        self.records = []
+
+    def add(self, record):
+        """
+        Add a file to the current pack, uploading the pack if it is full
+        :param record: swiftarchive.files.FileRecord to pack
+        :return: List of (FileRecord, md5) tuples for the files in the pack if it was uploaded, otherwise
+                 an empty list
+        """
+        if self.pack is None:
+            # Packs are kept in memory until they are large enough to spill to a temporary file
+            self.pack = tempfile.SpooledTemporaryFile(max_size=67108864)
+
+        offset = self.pack.tell()
+
+        try:
+            with open(record.path, 'rb') as local:
+                reader = swiftarchive.files.HashingReader(local)
+                shutil.copyfileobj(reader, self.pack, 1048576)
+        except OSError as ex:
+            # Drop anything written for the file so the pack stays consistent with its index
+            self.pack.seek(offset)
+            self.pack.truncate()
+            if ex.errno == errno.ENOENT:
+                raise LocalFileException("File \"%s\" could not be found" % record.path) from None
+            elif ex.errno == errno.EACCES:
+                raise LocalFileException("Permission error with \"%s\"" % record.path) from None
+            else:
+                raise LocalFileException("Unknown error with \"%s\": %s" % (record.path, ex.strerror)) from None
+
+        self.members.append({"name": swiftarchive.files.object_name(record.path, self.strip_path),
+                             "offset": offset,
+                             "length": self.pack.tell() - offset,
+                             "md5": reader.hexdigest()})
+        self.records.append(record)
+
+        if self.pack.tell() >= self.pack_size:
+            return self.flush()
+
+        return []
+
+    def flush(self):
+        """
+        Upload the current pack and its index
+        :return: List of (FileRecord, md5) tuples for the files in the pack
+        """
+        if not self.members:
+            return []
+
+        pack_id = "%s-%s" % (time.strftime("%Y%m%d%H%M%S"), uuid.uuid4().hex)
+        pack_name = "%s%s.pack" % (self.prefix, pack_id)
+        index_name = "%s%s.idx" % (self.prefix, pack_id)
+
+        logger.debug("uploading %s with %s files", pack_name, len(self.members))
+
+        length = self.pack.tell()
+        self.pack.seek(0)
+        pack_md5 = self.swift.put_stream(self.container, pack_name, self.pack, length)
+
+        # The index is uploaded last, so every index refers to a complete pack
+        index = json.dumps({"pack": pack_name, "etag": pack_md5, "members": self.members}).encode()
+        self.swift.put_stream(self.container, index_name, io.BytesIO(index), len(index))
+
+        packed = [(record, member["md5"]) for record, member in zip(self.records, self.members)]
+
+        self.pack.close()
+        self.pack = None
+        self.members = []
+        self.records = []
+
+        return packed
+
+
+def load_index(swift, container, index_name):
+    """
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param index_name: name of the pack index object
+    :return: The pack index as a dict with the pack name, pack etag and a list of members
+    """
+    try:
+        return json.loads(swift.get_object(container, index_name).decode())
+    except ValueError:
+        raise SwiftException("Invalid pack index \"%s\"" % index_name) from None
+
+
+def find_member(swift, container, name, prefix="packs/"):
+    """
+    Search the pack indexes for a member
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param name: member name (the file path with the strip path removed)
+    :param prefix: Prefix of the pack and index object names. Default is "packs/".
+    :return: Tuple of the pack name and the member dict, or None if no pack holds the member
+    """
+    for swift_object in swift.list_objects(container, prefix=prefix):
+        if not swift_object["name"].endswith(".idx"):
+            continue
+
+        index = load_index(swift, container, swift_object["name"])
+
+        for member in index["members"]:
+            if member["name"] == name:
+                return index["pack"], member
+
+    return None
+
+
+def read_member(swift, container, pack_name, member):
+    """
+    Download a member of a pack with a Range request and verify its md5 hash
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param pack_name: name of the pack object
+    :param member: member dict from the pack index
+    :return: The contents of the member as bytes
+    """
+    contents = swift.get_object(container, pack_name, member["offset"], member["length"])
+
+    if hashlib.md5(contents).hexdigest() != member["md5"]:
+        raise SwiftException("md5 sum does not match for member \"%s\" of pack \"%s\" file: %s swift: %s" %
+                             (member["name"], pack_name, hashlib.md5(contents).hexdigest(), member["md5"])) from None
+
+    return contents
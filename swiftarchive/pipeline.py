@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import heapq
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
+
+import swiftarchive.pack
+import swiftarchive.files
+import swiftarchive.metrics
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.pipeline')
+
+# Marker placed on a queue to tell the next stage that no more work is coming
+DONE = object()
+
+# Order files are dispatched to the upload workers in, as the key files are sorted by, None for the order of the walk
+SCHEDULES = {
+    "walk": None,
+    "largest": lambda record: -record.size,
+    "oldest": lambda record: record.mtime,
+}
+
+
+class ScheduleQueue(queue.Queue):
+
+    def __init__(self, maxsize=0, key=None):
+        """
+        Bounded queue that hands out the item with the smallest key first rather than the oldest item. Only
+        the items in the queue are ordered, so a queue of maxsize items orders a sliding window of the scan.
+        :param maxsize: Maximum number of items in the queue. Default is 0 (unbounded).
+        :param key: Function of an item returning the value it is sorted by. Default is None (first in,
+                    first out).
+        """
+        self.key = key
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self.queue = []
+        self.sequence = itertools.count()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        # DONE is handed out after every file, and items with the same key in the order they were queued
+        if item is DONE:
+            rank = (1,)
+        else:
+            rank = (0, self.key(item)) if self.key is not None else (0,)
+        heapq.heappush(self.queue, (rank, next(self.sequence), item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+
+class Pipeline:
+
+    def __init__(self, swift, container, archive_path, delete=False, workers=4, queue_size=1000, index=None,
+                 remote=None, bulk_threshold=0, bulk_count=1000, bulk_size=67108864, pack_threshold=0,
+                 pack_size=268435456, metrics=None, hash_processes=0, journal=None, dedup=None, schedule="largest",
+                 memory_limit=None):
+        """
+        Archive files through three stages joined by bounded queues:
+        scan -> hash/upload (workers threads) -> verify/delete
+        :param swift: swiftarchive.swift.Swift object used for the uploads
+        :param container: OpenStack Swift container to upload to
+        :param archive_path: Local path being archived (stripped from the object names)
+        :param delete: Delete local files once they are uploaded and verified
+        :param workers: Number of concurrent hash/upload threads
+        :param queue_size: Maximum number of files waiting between two stages
+        :param index: swiftarchive.index.StateIndex used to skip files uploaded by previous runs
+        :param remote: swiftarchive.listing.RemoteListing used to skip files whose object already exists in
+                       Swift with the same size and md5 hash
+        :param bulk_threshold: Files of at most bulk_threshold bytes are uploaded in batches with the Swift
+                               bulk middleware. Default is 0 (disabled).
+        :param bulk_count: Maximum number of files in a batch. Default is 1000.
+        :param bulk_size: Maximum number of bytes in a batch. Default is 64MiB.
+        :param pack_threshold: Files of at most pack_threshold bytes are packed into pack objects with a sidecar
+                               index. Default is 0 (disabled).
+        :param pack_size: Size in bytes a pack object is filled to before it is uploaded. Default is 256MiB.
+        :param metrics: swiftarchive.metrics.Metrics the counters and timings of each stage are recorded in.
+                        Default is None (recorded in memory only).
+        :param hash_processes: Number of processes files are hashed in when they are hashed without being
+                               uploaded. Default is 0 (hash in the upload threads).
+        :param journal: swiftarchive.journal.RunJournal the progress of each file is recorded in, used to resume
+                        an interrupted run without uploading its files again. Default is None.
+        :param dedup: swiftarchive.index.DedupIndex used to copy files already uploaded with the same size and md5
+                      hash within Swift instead of uploading them. Files are hashed before they are uploaded.
+                      Default is None.
+        :param schedule: Order the files waiting to be uploaded are dispatched to the workers in, one of SCHEDULES:
+                         "largest" (largest first, so large files don't hold up the end of the run and small
+                         files fill the gaps), "oldest" (oldest modification time first) or "walk" (the order they
+                         were found in). Default is "largest".
+        :param memory_limit: swiftarchive.memory.MemoryLimit checked as files are scanned and while a stage waits
+                             for room in a queue, stopping the run if it is exceeded. Default is None.
+        """
+        if schedule not in SCHEDULES:
+            raise LocalFileException("Unknown schedule: %s" % schedule) from None
+
+        self.swift = swift
+        self.container = container
+        self.archive_path = archive_path
+        self.delete = delete
+        self.workers = max(1, int(workers))
+        self.index = index
+        self.remote = remote
+        self.bulk_threshold = int(bulk_threshold)
+        self.bulk_count = int(bulk_count)
+        self.bulk_size = int(bulk_size)
+        self.pack_threshold = int(pack_threshold)
+        self.pack_size = int(pack_size)
+        self.metrics = metrics if metrics is not None else swiftarchive.metrics.Metrics()
+        self.hash_processes = int(hash_processes)
+        self.hash_executor = None
+        self.journal = journal
+        self.dedup = dedup
+        self.memory_limit = memory_limit
+
+        # Files uploaded in bulk are named without a leading slash, see strip_path
+        self.bulk_archive_path = archive_path if archive_path.endswith("/") else archive_path + "/"
+
+        self.upload_queue = ScheduleQueue(maxsize=queue_size, key=SCHEDULES[schedule])
+        self.verify_queue = queue.Queue(maxsize=queue_size)
+
+        self.stop = threading.Event()
+        self.error = None
+        self.error_lock = threading.Lock()
+        self.archived = 0
+        self.skipped = 0
+        # skipped is counted by both the scan and verify stages
+        self.count_lock = threading.Lock()
+
+    def run(self, files):
+        """
+        Run all of the stages until files is exhausted or a stage fails
+        :param files: Iterable of swiftarchive.files.FileRecord to archive
+        :return: Number of files uploaded and verified
+        """
+        if self.hash_processes > 0:
+            # Spawn rather than fork the hashing processes, as the stages run in threads. Python 3.6 can only
+            # fork them.
+            if sys.version_info >= (3, 7):
+                self.hash_executor = concurrent.futures.ProcessPoolExecutor(
+                    self.hash_processes, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self.hash_executor = concurrent.futures.ProcessPoolExecutor(self.hash_processes)
+
+        threads = [threading.Thread(target=self._stage, args=(self.scan, files), name="scan")]
+
+        for worker in range(self.workers):
+            threads.append(threading.Thread(target=self._stage, args=(self.upload,), name="upload-%s" % worker))
+
+        threads.append(threading.Thread(target=self._stage, args=(self.verify,), name="verify"))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if self.hash_executor is not None:
+            self.hash_executor.shutdown()
+            self.hash_executor = None
+
+        if self.error is not None:
+            raise self.error
+
+        return self.archived
+
+    def _stage(self, target, *args):
+        """
+        Run a stage, recording the first exception raised by any stage and stopping the others
+        :param target: Stage function to run
+        :param args: Arguments passed to target
+        """
+        try:
+            target(*args)
+        except BaseException as ex:
+            with self.error_lock:
+                if self.error is None:
+                    self.error = ex
+            self.stop.set()
+
+    def _skip(self):
+        """
+        Count a file that didn't need to be uploaded
+        """
+        with self.count_lock:
+            self.skipped += 1
+        self.metrics.inc("files_skipped_total")
+
+    def _put(self, work_queue, item):
+        """
+        Put item on a bounded queue without blocking forever if the pipeline is stopped
+        :param work_queue: Queue to put item on
+        :param item: Item to put on the queue
+        :return: True if the item was queued, False if the pipeline was stopped
+        """
+        while not self.stop.is_set():
+            try:
+                work_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.memory_limit is not None:
+                    self.memory_limit.check()
+        return False
+
+    def _get(self, work_queue):
+        """
+        Get an item from a queue without blocking forever if the pipeline is stopped
+        :param work_queue: Queue to get an item from
+        :return: The next item on the queue or DONE if the pipeline was stopped
+        """
+        while not self.stop.is_set():
+            try:
+                return work_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def scan(self, files):
+        """
+        Scan stage: feed files into the upload queue as they are found
+        :param files: Iterable of swiftarchive.files.FileRecord to archive
+        """
+        files = iter(files)
+
+        while True:
+            started = time.perf_counter()
+            record = next(files, DONE)
+            if record is DONE:
+                break
+
+            self.metrics.observe("scan_seconds", time.perf_counter() - started)
+            self.metrics.inc("files_scanned_total")
+
+            if self.memory_limit is not None:
+                self.memory_limit.check()
+            logger.debug("file: %s", record.path)
+
+            if self.index is not None and self.index.unchanged(self.container, record):
+                logger.debug("unchanged: %s", record.path)
+                self._skip()
+                continue
+
+            if self.journal is not None:
+                # Files the interrupted run uploaded go straight to verify/delete
+                swift_md5 = self.journal.resume(record)
+                if swift_md5 is not None:
+                    logger.debug("resumed: %s", record.path)
+                    self.metrics.inc("files_resumed_total")
+                    if self._put(self.verify_queue, (record, swift_md5, False)) is False:
+                        return
+                    continue
+
+                self.journal.planned(record)
+
+            if self._put(self.upload_queue, record) is False:
+                return
+
+        for worker in range(self.workers):
+            self._put(self.upload_queue, DONE)
+
+    def upload(self):
+        """
+        Hash/upload stage: upload each file to Swift, hashing it from the bytes sent. put_object
+        raises a SwiftException if the md5 sum of the file does not match the etag from Swift.
+        Small files are packed into pack objects or collected into batches uploaded with put_archive.
+        """
+        batch = []
+        batch_size = 0
+        pack = swiftarchive.pack.PackWriter(self.swift, self.container, self.archive_path, self.pack_size)
+
+        while True:
+            record = self._get(self.upload_queue)
+
+            if record is DONE:
+                if not self.stop.is_set():
+                    if batch:
+                        self.upload_batch(batch)
+                    started = time.perf_counter()
+                    packed = pack.flush()
+                    if packed:
+                        self.metrics.observe("upload_seconds", time.perf_counter() - started)
+                    for packed_record, file_md5 in packed:
+                        self._uploaded(packed_record, file_md5)
+                self._put(self.verify_queue, DONE)
+                return
+
+            # Skip the upload if the object is already in Swift
+            if self.remote is not None:
+                swift_md5 = self.remote.lookup(swiftarchive.files.object_name(record.path, self.strip_path(record)),
+                                               record.size)
+
+                if swift_md5 is not None:
+                    with self.metrics.timer("hash_seconds"):
+                        file_md5 = self.swift.local_etag(record.path, record.size, self.hash_executor)
+
+                if swift_md5 is not None and file_md5 == swift_md5:
+                    logger.debug("already in swift: %s", record.path)
+                    self._put(self.verify_queue, (record, swift_md5, False))
+                    continue
+
+            if self.pack_threshold > 0 and record.size <= self.pack_threshold:
+                started = time.perf_counter()
+                packed = pack.add(record)
+                # Only the add that fills the pack uploads it; the others are a local copy
+                if packed:
+                    self.metrics.observe("upload_seconds", time.perf_counter() - started)
+                for packed_record, file_md5 in packed:
+                    self._uploaded(packed_record, file_md5)
+                continue
+
+            if self.bulk_threshold > 0 and record.size <= self.bulk_threshold:
+                batch.append(record)
+                batch_size += record.size
+
+                if len(batch) >= self.bulk_count or batch_size >= self.bulk_size:
+                    self.upload_batch(batch)
+                    batch = []
+                    batch_size = 0
+                continue
+
+            self.upload_file(record)
+
+    def strip_path(self, record):
+        """
+        :param record: swiftarchive.files.FileRecord
+        :return: Path removed from the start of the path of record to get its object name. The bulk middleware
+                 removes leading slashes from names, so the files uploaded in bulk are named without one (also
+                 when a file is retried on its own) when the archive path has no trailing slash. Every other
+                 object is named after its path relative to the archive path.
+        """
+        if self.bulk_threshold > 0 and record.size <= self.bulk_threshold and \
+                not (self.pack_threshold > 0 and record.size <= self.pack_threshold):
+            return self.bulk_archive_path
+        return self.archive_path
+
+    def upload_file(self, record):
+        """
+        Upload a single file to Swift, or copy the object of a file with the same contents
+        :param record: swiftarchive.files.FileRecord to upload
+        """
+        strip_path = self.strip_path(record)
+        object_name = swiftarchive.files.object_name(record.path, strip_path)
+        file_md5 = None
+
+        if self.dedup is not None:
+            with self.metrics.timer("hash_seconds"):
+                file_md5 = self.swift.local_etag(record.path, record.size, self.hash_executor)
+
+            source = self.dedup.lookup(record.size, file_md5)
+
+            if source is not None:
+                with self.metrics.timer("upload_seconds"):
+                    swift_md5 = self.swift.copy_object(source[0], source[1], self.container, object_name,
+                                                       record.size, file_md5)
+
+                if swift_md5 is not None:
+                    logger.debug("copied %s from %s/%s", record.path, source[0], source[1])
+                    self.metrics.inc("files_deduplicated_total")
+                    self.metrics.inc("bytes_deduplicated_total", record.size)
+                    self._uploaded(record, swift_md5)
+                    return
+
+                self.dedup.remove(record.size, file_md5)
+
+        with self.metrics.timer("upload_seconds"):
+            swift_md5 = self.swift.put_object(self.container, record.path, strip_path)
+        logger.debug("swift md5: %s", swift_md5)
+
+        # Unless the file changed after it was hashed, later copies of it can be copied from this object
+        if self.dedup is not None and swift_md5 == file_md5:
+            self.dedup.add(self.container, object_name, record.size, swift_md5)
+
+        self._uploaded(record, swift_md5)
+
+    def _uploaded(self, record, swift_md5):
+        """
+        Record a verified upload in the journal and pass the file on to the verify/delete stage
+        :param record: swiftarchive.files.FileRecord that was uploaded
+        :param swift_md5: etag (md5 hash) returned by Swift
+        """
+        if self.journal is not None:
+            self.journal.uploaded(record, swift_md5)
+
+        self._put(self.verify_queue, (record, swift_md5, True))
+
+    def upload_batch(self, batch):
+        """
+        Upload a batch of small files in one request. Files that fail are uploaded again on their own.
+        :param batch: List of swiftarchive.files.FileRecord to upload
+        """
+        logger.debug("bulk uploading %s files", len(batch))
+
+        with self.metrics.timer("upload_seconds"):
+            verified, failed = self.swift.put_archive(self.container, [record.path for record in batch],
+                                                      self.archive_path)
+
+        for record in batch:
+            if record.path in verified:
+                logger.debug("swift md5: %s", verified[record.path])
+                self._uploaded(record, verified[record.path])
+            else:
+                logger.debug("bulk upload of %s failed: %s", record.path, failed.get(record.path))
+                self.metrics.inc("retries_total")
+                self.upload_file(record)
+
+    def verify(self):
+        """
+        Verify/delete stage: delete the local files that have been uploaded and verified (or found in
+        Swift with a matching md5 hash) if requested, otherwise record them in the state index
+        """
+        workers_done = 0
+
+        while workers_done < self.workers:
+            item = self._get(self.verify_queue)
+
+            if item is DONE:
+                if self.stop.is_set():
+                    return
+                workers_done += 1
+                continue
+
+            record, swift_md5, uploaded = item
+
+            if self.journal is not None:
+                self.journal.verified(record, swift_md5)
+
+            if self.delete is True:
+                logger.debug("deleting: %s", record.path)
+                swiftarchive.files.delete(record.path)
+                self.metrics.inc("deletes_total")
+                if self.journal is not None:
+                    self.journal.deleted(record)
+            elif self.index is not None:
+                self.index.update(self.container, record, swift_md5)
+
+            if uploaded is True:
+                self.archived += 1
+                self.metrics.inc("files_uploaded_total")
+                self.metrics.inc("bytes_uploaded_total", record.size)
+            else:
+                self._skip()
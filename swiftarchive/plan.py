@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+import json
+import math
+import logging
+
+import swiftarchive.files
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.plan')
+
+# Upper bounds in bytes of the size histogram buckets, files larger than the last one are counted in a final bucket
+SIZE_BUCKETS = (1024, 16384, 262144, 1048576, 16777216, 268435456, 1073741824, 4294967296)
+
+
+def format_bytes(size):
+    """
+    :param size: Number of bytes
+    :return: size with a binary unit, e.g. "1.5 GiB"
+    """
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024.0
+
+    return "%d %s" % (size, unit) if unit == "B" else "%.1f %s" % (size, unit)
+
+
+def format_seconds(seconds):
+    """
+    :param seconds: Number of seconds
+    :return: seconds as hours, minutes and seconds, e.g. "2h 03m 04s"
+    """
+    minutes, seconds = divmod(int(math.ceil(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    if hours:
+        return "%dh %02dm %02ds" % (hours, minutes, seconds)
+    if minutes:
+        return "%dm %02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+
+def measured_rates(metrics_json):
+    """
+    Read the upload throughput and request latency of a previous run from its metrics
+    :param metrics_json: Path to the JSON metrics written by a previous run with --metrics-json
+    :return: Tuple of the bytes uploaded per second and the mean seconds per upload request, either is None if
+             the run didn't measure it
+    """
+    try:
+        with open(metrics_json) as metrics_file:
+            snapshot = json.load(metrics_file)
+    except OSError as ex:
+        raise LocalFileException("Unable to read metrics \"%s\": %s" % (metrics_json, ex.strerror)) from None
+    except ValueError:
+        raise LocalFileException("Invalid metrics \"%s\"" % metrics_json) from None
+
+    uploaded = snapshot.get("counters", {}).get("bytes_uploaded_total", 0)
+    duration = snapshot.get("gauges", {}).get("run_duration_seconds", 0)
+    upload_seconds = snapshot.get("histograms", {}).get("upload_seconds", {})
+
+    throughput = uploaded / duration if uploaded > 0 and duration > 0 else None
+    request_seconds = upload_seconds["sum"] / upload_seconds["count"] if upload_seconds.get("count") else None
+
+    return throughput, request_seconds
+
+
+class Plan:
+
+    def __init__(self, container, archive_path, index=None, remote=None, segment_size=1073741824,
+                 segment_threshold=3500000000, bulk_threshold=0, bulk_count=1000, bulk_size=67108864,
+                 pack_threshold=0, pack_size=268435456):
+        """
+        Dry run of an archive run: count the files the scan selects by how swiftarchive.pipeline.Pipeline would
+        upload them (packed, in a batch, segmented or as one object) and the bytes and requests that takes,
+        without reading, hashing or uploading any file. The files are counted in scan order, not in the order
+        the pipeline schedules them.
+        :param container: OpenStack Swift container the files would be uploaded to
+        :param archive_path: Local path the files are archived from
+        :param index: swiftarchive.index.StateIndex used to count unchanged files. Default is None.
+        :param remote: swiftarchive.listing.RemoteListing used to count the files already in the container.
+                       Only the name and size are compared, the md5 sum is checked when the run hashes the
+                       file. Default is None.
+        :param segment_size: Size in bytes of each Static Large Object segment. Default is 1GiB.
+        :param segment_threshold: Files larger than segment_threshold bytes are uploaded as Static Large Objects.
+                                  Default is 3500000000.
+        :param bulk_threshold: Files of at most bulk_threshold bytes are uploaded in batches. Default is 0.
+        :param bulk_count: Maximum number of files in a batch. Default is 1000.
+        :param bulk_size: Maximum number of bytes in a batch. Default is 64MiB.
+        :param pack_threshold: Files of at most pack_threshold bytes are packed into pack objects. Default is 0.
+        :param pack_size: Size in bytes a pack object is filled to before it is uploaded. Default is 256MiB.
+        """
+        self.container = container
+        self.archive_path = archive_path
+        self.index = index
+        self.remote = remote
+        self.segment_size = int(segment_size)
+        self.segment_threshold = int(segment_threshold)
+        self.bulk_threshold = int(bulk_threshold)
+        self.bulk_count = int(bulk_count)
+        self.bulk_size = int(bulk_size)
+        self.pack_threshold = int(pack_threshold)
+        self.pack_size = int(pack_size)
+
+        self.files = {"scanned": 0, "unchanged": 0, "in_swift": 0, "upload": 0}
+        self.bytes = {"scanned": 0, "unchanged": 0, "in_swift": 0, "upload": 0}
+        self.methods = {"object": 0, "segmented": 0, "bulk": 0, "pack": 0}
+        self.requests = {"object": 0, "segmented": 0, "bulk": 0, "pack": 0}
+        self.histogram = [[0, 0] for _ in range(len(SIZE_BUCKETS) + 1)]
+
+        self.batch_count = 0
+        self.batch_size = 0
+        self.pack_count = 0
+        self.pack_fill = 0
+
+    def add(self, record):
+        """
+        Count a file selected by the scan
+        :param record: swiftarchive.files.FileRecord
+        """
+        packed = self.pack_threshold > 0 and record.size <= self.pack_threshold
+        bulk = not packed and self.bulk_threshold > 0 and record.size <= self.bulk_threshold
+
+        # Named like swiftarchive.pipeline.Pipeline.strip_path: files uploaded in bulk never have a leading slash
+        object_name = swiftarchive.files.object_name(record.path, self.archive_path)
+        if bulk:
+            object_name = object_name.lstrip("/")
+
+        self._count("scanned", record.size)
+
+        bucket = self.histogram[next((i for i, bound in enumerate(SIZE_BUCKETS) if record.size <= bound),
+                                     len(SIZE_BUCKETS))]
+        bucket[0] += 1
+        bucket[1] += record.size
+
+        if self.index is not None and self.index.unchanged(self.container, record):
+            self._count("unchanged", record.size)
+            return
+
+        if self.remote is not None and self.remote.lookup(object_name, record.size) is not None:
+            self._count("in_swift", record.size)
+            return
+
+        self._count("upload", record.size)
+
+        # The same order of checks as Pipeline.upload
+        if packed:
+            self.methods["pack"] += 1
+            self.pack_count += 1
+            self.pack_fill += record.size
+            if self.pack_fill >= self.pack_size:
+                self._flush_pack()
+        elif bulk:
+            self.methods["bulk"] += 1
+            self.batch_count += 1
+            self.batch_size += record.size
+            if self.batch_count >= self.bulk_count or self.batch_size >= self.bulk_size:
+                self._flush_batch()
+        elif record.size > self.segment_threshold:
+            # One request per segment and one for the manifest
+            self.methods["segmented"] += 1
+            self.requests["segmented"] += int(math.ceil(record.size / float(self.segment_size))) + 1
+        else:
+            self.methods["object"] += 1
+            self.requests["object"] += 1
+
+    def finish(self):
+        """
+        Count the requests of the last, partly filled, batch and pack
+        """
+        if self.batch_count:
+            self._flush_batch()
+        if self.pack_count:
+            self._flush_pack()
+
+    def _count(self, name, size):
+        self.files[name] += 1
+        self.bytes[name] += size
+
+    def _flush_batch(self):
+        self.requests["bulk"] += 1
+        self.batch_count = 0
+        self.batch_size = 0
+
+    def _flush_pack(self):
+        # The pack object and its sidecar index
+        self.requests["pack"] += 2
+        self.pack_count = 0
+        self.pack_fill = 0
+
+    def estimate(self, throughput=None, request_seconds=None, workers=4):
+        """
+        Estimate the duration of the run as the longer of the time to send the bytes at throughput and the time
+        to make the requests, workers at a time
+        :param throughput: Bytes uploaded per second. Default is None (not limited by throughput).
+        :param request_seconds: Mean seconds per upload request. Default is None (not limited by requests).
+        :param workers: Number of concurrent uploads. Default is 4.
+        :return: Estimated seconds, or None if neither throughput nor request_seconds is known
+        """
+        if not throughput and not request_seconds:
+            return None
+
+        seconds = 0.0
+        if throughput:
+            seconds = max(seconds, self.bytes["upload"] / float(throughput))
+        if request_seconds:
+            seconds = max(seconds, sum(self.requests.values()) * request_seconds / max(int(workers), 1))
+
+        return seconds
+
+    def report(self, throughput=None, request_seconds=None, workers=4):
+        """
+        :param throughput: Bytes uploaded per second, see estimate. Default is None.
+        :param request_seconds: Mean seconds per upload request, see estimate. Default is None.
+        :param workers: Number of concurrent uploads. Default is 4.
+        :return: dict with the file counts, bytes, size histogram, requests and estimated seconds of the run
+        """
+        histogram = []
+        for i, (count, size) in enumerate(self.histogram):
+            histogram.append({"le": SIZE_BUCKETS[i] if i < len(SIZE_BUCKETS) else None, "files": count,
+                              "bytes": size})
+
+        return {"container": self.container,
+                "archive_path": self.archive_path,
+                "files": dict(self.files),
+                "bytes": dict(self.bytes),
+                "methods": dict(self.methods),
+                "requests": dict(self.requests, total=sum(self.requests.values())),
+                "histogram": histogram,
+                "throughput": throughput,
+                "request_seconds": request_seconds,
+                "workers": workers,
+                "seconds": self.estimate(throughput, request_seconds, workers)}
+
+    @staticmethod
+    def format(report):
+        """
+        :param report: dict returned by report
+        :return: report as human readable text
+        """
+        lines = ["Plan for archiving %s to %s" % (report["archive_path"], report["container"]),
+                 "  %-22s %10s %12s" % ("", "files", "bytes")]
+
+        for name, label in (("scanned", "selected by the scan"), ("unchanged", "unchanged since upload"),
+                            ("in_swift", "in swift (same size)"), ("upload", "to upload")):
+            lines.append("  %-22s %10d %12s" % (label, report["files"][name], format_bytes(report["bytes"][name])))
+
+        lines.append("Size histogram:")
+        bound = 0
+        for bucket in report["histogram"]:
+            if bucket["le"] is None:
+                label = "> %s" % format_bytes(bound)
+            else:
+                label = "%s - %s" % (format_bytes(bound), format_bytes(bucket["le"]))
+                bound = bucket["le"]
+            lines.append("  %-22s %10d %12s" % (label, bucket["files"], format_bytes(bucket["bytes"])))
+
+        lines.append("Upload requests:")
+        for name, label in (("object", "single objects"), ("segmented", "static large objects"),
+                            ("bulk", "bulk batches"), ("pack", "packs")):
+            lines.append("  %-22s %10d files %8d requests" % (label, report["methods"][name],
+                                                              report["requests"][name]))
+        lines.append("  %-22s %27d requests" % ("total", report["requests"]["total"]))
+
+        if report["seconds"] is None:
+            lines.append("Estimated duration: unknown, set --plan-throughput or --plan-request-seconds or write "
+                         "--metrics-json from a previous run")
+        else:
+            rates = []
+            if report["throughput"]:
+                rates.append("%s/s" % format_bytes(report["throughput"]))
+            if report["request_seconds"]:
+                rates.append("%.3fs per request with %d workers" % (report["request_seconds"], report["workers"]))
+            lines.append("Estimated duration: %s (%s)" % (format_seconds(report["seconds"]), ", ".join(rates)))
+
+        return "\n".join(lines)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import errno
+import logging
+import tempfile
+import concurrent.futures
+
+import swiftarchive.arguments
+import swiftarchive.swift
+import swiftarchive.pack
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.restore')
+
+
+def restore_path(restore_root, object_name):
+    """
+    Map an object name back to a local path, the reverse of removing the archive path on upload
+    :param restore_root: Local path to restore the objects to
+    :param object_name: object name
+    :return: Path of the restored file under restore_root
+    """
+    root = os.path.normpath(restore_root)
+    file_path = os.path.normpath(os.path.join(root, object_name.lstrip("/")))
+
+    # Never write outside of the restore path, whatever the object name contains
+    if file_path == root or os.path.commonpath([root, file_path]) != root:
+        raise LocalFileException("Object \"%s\" would be restored outside of \"%s\"" %
+                                 (object_name, restore_root)) from None
+
+    return file_path
+
+
+def restore_object(swift, container, object_name, restore_root):
+    """
+    Download a single object and verify its etag while it is written to disk
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param object_name: object name
+    :param restore_root: Local path to restore the objects to
+    :return: Path of the restored file
+    """
+    file_path = restore_path(restore_root, object_name)
+    swift.download_object(container, object_name, file_path)
+    logger.debug("restored %s to %s", object_name, file_path)
+    return file_path
+
+
+def restore_member(swift, container, pack_name, member, restore_root):
+    """
+    Download a single member of a pack object with a Range request
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param pack_name: name of the pack object
+    :param member: member dict from the pack index
+    :param restore_root: Local path to restore the objects to
+    :return: Path of the restored file
+    """
+    file_path = restore_path(restore_root, member["name"])
+    contents = swiftarchive.pack.read_member(swift, container, pack_name, member)
+    directory = os.path.dirname(file_path)
+    part_path = None
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix=".swift-archive-", delete=False) as local:
+            part_path = local.name
+            local.write(contents)
+        os.replace(part_path, file_path)
+    except OSError as ex:
+        if part_path is not None and os.path.exists(part_path):
+            os.remove(part_path)
+        if ex.errno == errno.ENOENT:
+            raise LocalFileException("File \"%s\" could not be found" % file_path) from None
+        elif ex.errno == errno.EACCES:
+            raise LocalFileException("Permission error with \"%s\"" % file_path) from None
+        else:
+            raise LocalFileException("Unknown error with \"%s\": %s" % (file_path, ex.strerror)) from None
+
+    logger.debug("restored %s from %s to %s", member["name"], pack_name, file_path)
+    return file_path
+
+
+def restore(swift, container, restore_root, prefix=None, packs=False, workers=4):
+    """
+    Restore the objects in a container to a local path, downloading workers objects at a time
+    :param swift: swiftarchive.swift.Swift object
+    :param container: OpenStack Swift container
+    :param restore_root: Local path to restore the objects to
+    :param prefix: Only restore objects whose names start with prefix. Default is None.
+    :param packs: Also restore the members of pack objects. Default is False.
+    :param workers: Number of concurrent downloads. Default is 4.
+    :return: Number of files restored
+    """
+    pack_prefix = "packs/"
+    restored = 0
+
+    def tasks():
+        for swift_object in swift.list_objects(container, prefix=prefix):
+            # Pack objects are restored from their indexes rather than as files
+            if packs and swift_object["name"].startswith(pack_prefix):
+                continue
+            yield restore_object, (swift, container, swift_object["name"], restore_root)
+
+        if packs:
+            for swift_object in swift.list_objects(container, prefix=pack_prefix):
+                if not swift_object["name"].endswith(".idx"):
+                    continue
+
+                index = swiftarchive.pack.load_index(swift, container, swift_object["name"])
+
+                for member in index["members"]:
+                    if prefix is None or member["name"].startswith(prefix):
+                        yield restore_member, (swift, container, index["pack"], member, restore_root)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+
+        # Keep at most two downloads per worker queued so the listing is streamed rather than loaded
+        for function, arguments in tasks():
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    restored += 1
+
+            pending.add(executor.submit(function, *arguments))
+
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+            restored += 1
+
+    return restored
+
+
+def main():
+    """
+    :return: 0 if successful otherwise return an error message as a string
+    """
+    args = swiftarchive.arguments.parse_restore_arguments(sys.argv[1:])
+
+    log_level = logging.INFO
+
+    if args.debug is True:
+        log_level = logging.DEBUG
+
+    logger = logging.getLogger('swiftarchive')
+    logger.setLevel(level=log_level)
+    log_handler = logging.StreamHandler()
+    log_formatter = logging.Formatter('%(asctime)s %(levelname)s %(filename)s:%(lineno)d %(message)s')
+    log_handler.setFormatter(log_formatter)
+    logger.addHandler(log_handler)
+
+    logger.debug("os_username: %s", args.os_username)
+    logger.debug("os_password: %s", args.os_password)
+    logger.debug("os_project_name: %s", args.os_project_name)
+    logger.debug("os_auth_url: %s", args.os_auth_url)
+    logger.debug("token_cache: %s", args.token_cache)
+    logger.debug("container: %s", args.container)
+    logger.debug("restore_path: %s", args.restore_path)
+    logger.debug("prefix: %s", args.prefix)
+    logger.debug("packs: %s", args.packs)
+    logger.debug("workers: %s", args.workers)
+
+    if args.os_username is None or args.os_password is None or \
+        args.os_project_name is None or args.os_auth_url is None or \
+            args.container is None or args.restore_path is None:
+        return ('''
+swift-restore requires OS_USERNAME, OS_PASSWORD, OS_PROJECT_NAME,
+OS_AUTH_URL, CONTAINER, and RESTORE_PATH to be set or overridden with
+--os-username, --os-password, --os-project-name, --os-auth-url,
+--container, or --restore-path.''')
+
+    # Size the connection pool to the download concurrency
+    swift = swiftarchive.swift.Swift(args.os_username, args.os_password, args.os_project_name, args.os_auth_url,
+                                     pool_size=args.workers,
+                                     token_cache=args.token_cache)
+
+    try:
+        restored = restore(swift, args.container, args.restore_path,
+                           prefix=args.prefix,
+                           packs=str(args.packs).lower() == "true",
+                           workers=args.workers)
+        logger.debug("restored: %s", restored)
+    finally:
+        swift.close()
+
+    return 0
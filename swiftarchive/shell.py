@@ -1,11 +1,95 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import time
 import logging
+import itertools
 import swiftarchive.arguments
+import swiftarchive.exceptions
 import swiftarchive.files
-import swiftarchive.swift
-from swiftarchive.exceptions import SwiftException
+import swiftarchive.index
+import swiftarchive.journal
+import swiftarchive.listing
+import swiftarchive.memory
+import swiftarchive.metrics
+import swiftarchive.plan
+
+# Swift (keystoneauth1, swiftclient and requests), Pipeline and Watcher are imported in main once they are needed,
+# so a run with nothing to archive doesn't pay to load them
+
+
+def scan(args):
+    """
+    :param args: Commandline arguments parsed by swiftarchive.arguments.parse_arguments
+    :return: Generator yielding a swiftarchive.files.FileRecord for each file in the archive path to archive
+    """
+    if args.scan_workers > 1:
+        return swiftarchive.files.scan_files_parallel(args.archive_path,
+                                                      seconds_since_updated=args.seconds_since_updated,
+                                                      workers=args.scan_workers,
+                                                      queue_size=args.queue_size)
+
+    return swiftarchive.files.scan_files(args.archive_path, seconds_since_updated=args.seconds_since_updated)
+
+
+def plan(args, max_entries=1000000):
+    """
+    Print the files, bytes and requests a run would upload and its estimated duration. Files are selected
+    and counted by upload method as they would be by a run, but nothing is hashed, uploaded, deleted or written.
+    :param args: Commandline arguments parsed by swiftarchive.arguments.parse_arguments
+    :param max_entries: Number of objects of the container listing kept in memory. Default is 1000000.
+    :return: 0 if successful
+    """
+    # Rates that aren't set are measured from the metrics of the previous run
+    throughput = args.plan_throughput
+    request_seconds = args.plan_request_seconds
+    if args.metrics_json is not None and os.path.exists(args.metrics_json):
+        measured_throughput, measured_request_seconds = swiftarchive.plan.measured_rates(args.metrics_json)
+        throughput = throughput or measured_throughput
+        request_seconds = request_seconds or measured_request_seconds
+
+    swift = None
+    remote = None
+    if str(args.skip_existing).lower() == "true":
+        from swiftarchive.swift import Swift
+
+        swift = Swift(args.os_username, args.os_password, args.os_project_name, args.os_auth_url,
+                      pool_size=1, token_cache=args.token_cache, max_retries=args.max_retries)
+        remote = swiftarchive.listing.RemoteListing(max_entries)
+        remote.load(swift, args.container)
+
+    # A state index that doesn't exist yet would be created by opening it, and can't skip anything
+    index = None
+    if args.state_db is not None and os.path.exists(args.state_db):
+        index = swiftarchive.index.StateIndex(args.state_db)
+
+    run_plan = swiftarchive.plan.Plan(args.container, args.archive_path,
+                                      index=index,
+                                      remote=remote,
+                                      segment_size=args.segment_size,
+                                      segment_threshold=args.segment_threshold,
+                                      bulk_threshold=args.bulk_threshold,
+                                      bulk_count=args.bulk_count,
+                                      bulk_size=args.bulk_size,
+                                      pack_threshold=args.pack_threshold,
+                                      pack_size=args.pack_size)
+
+    try:
+        for record in scan(args):
+            run_plan.add(record)
+        run_plan.finish()
+    finally:
+        if swift is not None:
+            swift.close()
+        if remote is not None:
+            remote.close()
+        if index is not None:
+            index.close()
+
+    print(swiftarchive.plan.Plan.format(run_plan.report(throughput, request_seconds, args.workers)))
+
+    return 0
 
 
 def main():
@@ -30,10 +114,42 @@ def main():
     logger.debug("os_password: %s", args.os_password)
     logger.debug("os_project_name: %s", args.os_project_name)
     logger.debug("os_auth_url: %s", args.os_auth_url)
+    logger.debug("token_cache: %s", args.token_cache)
     logger.debug("container: %s", args.container)
     logger.debug("archive_path: %s", args.archive_path)
     logger.debug("delete: %s", args.delete)
     logger.debug("seconds_since_updated: %s", args.seconds_since_updated)
+    logger.debug("skip_existing: %s", args.skip_existing)
+    logger.debug("state_db: %s", args.state_db)
+    logger.debug("journal: %s", args.journal)
+    logger.debug("dedup_db: %s", args.dedup_db)
+    logger.debug("workers: %s", args.workers)
+    logger.debug("bulk_threshold: %s", args.bulk_threshold)
+    logger.debug("bulk_count: %s", args.bulk_count)
+    logger.debug("bulk_size: %s", args.bulk_size)
+    logger.debug("pack_threshold: %s", args.pack_threshold)
+    logger.debug("pack_size: %s", args.pack_size)
+    logger.debug("scan_workers: %s", args.scan_workers)
+    logger.debug("segment_size: %s", args.segment_size)
+    logger.debug("segment_threshold: %s", args.segment_threshold)
+    logger.debug("schedule: %s", args.schedule)
+    logger.debug("queue_size: %s", args.queue_size)
+    logger.debug("metrics_textfile: %s", args.metrics_textfile)
+    logger.debug("metrics_json: %s", args.metrics_json)
+    logger.debug("metrics_interval: %s", args.metrics_interval)
+    logger.debug("watch: %s", args.watch)
+    logger.debug("rescan_interval: %s", args.rescan_interval)
+    logger.debug("hash_buffer_size: %s", args.hash_buffer_size)
+    logger.debug("hash_processes: %s", args.hash_processes)
+    logger.debug("max_retries: %s", args.max_retries)
+    logger.debug("adaptive_concurrency: %s", args.adaptive_concurrency)
+    logger.debug("compress: %s", args.compress)
+    logger.debug("compress_level: %s", args.compress_level)
+    logger.debug("compress_sample_size: %s", args.compress_sample_size)
+    logger.debug("plan: %s", args.plan)
+    logger.debug("plan_throughput: %s", args.plan_throughput)
+    logger.debug("plan_request_seconds: %s", args.plan_request_seconds)
+    logger.debug("max_memory: %s", args.max_memory)
 
     if args.os_username is None or args.os_password is None or \
         args.os_project_name is None or args.os_auth_url is None or \
@@ -44,31 +160,145 @@ OS_AUTH_URL, CONTAINER, and ARCHIVE_PATH to be set or overridden with
 --os-username, --os-password, --os-project-name, --os-auth-url,
 --container, or --archive-path.''')
 
-    # Create the Swift object and authenticate to the server
-    swift = swiftarchive.swift.Swift(args.os_username, args.os_password, args.os_project_name, args.os_auth_url)
+    # Size the per-file state kept in memory to the memory limit, and refuse buffers that can't fit in it
+    max_entries = 1000000
+    memory_limit = None
+    if args.max_memory is not None:
+        buffers = swiftarchive.memory.buffer_size(args.workers, args.queue_size, args.bulk_threshold, args.bulk_size,
+                                                  args.pack_threshold, args.pack_size)
+        if buffers > args.max_memory // 2:
+            return ("--max-memory of %s bytes is too small for the %s bytes buffered with --workers, --queue-size, "
+                    "--bulk-size and --pack-size, which can use at most half of it" % (args.max_memory, buffers))
+        max_entries = swiftarchive.memory.spill_entries(args.max_memory)
+        memory_limit = swiftarchive.memory.MemoryLimit(args.max_memory)
+
+    if str(args.plan).lower() == "true":
+        return plan(args, max_entries)
+
+    # Collect the metrics of the run, written periodically and when the run finishes
+    metrics = swiftarchive.metrics.Metrics(args.metrics_textfile, args.metrics_json, args.metrics_interval,
+                                           labels={"container": args.container})
+
+    watch = str(args.watch).lower() == "true"
 
-    # Create the Files object and get the list of files to upload to Swift
-    file_list = swiftarchive.files.get_files(args.archive_path, seconds_since_updated=args.seconds_since_updated)
-    logger.debug("\n".join("{}: {}".format(*k) for k in enumerate(file_list)))
+    file_list = None
+    if not watch:
+        # Stream the files to upload from the archive path; uploads start while the walk is still running
+        file_list = scan(args)
 
-    # Upload files in file_list
-    for file_path in file_list:
-        logger.debug("file: %s", file_path)
+        # Exit before authenticating when no file qualifies, which is the common case for frequent cron runs
+        file_list = iter(file_list)
+        first = next(file_list, None)
+        if first is None:
+            logger.info("No files to archive in %s", args.archive_path)
+            metrics.stop(True)
+            return 0
+        file_list = itertools.chain([first], file_list)
 
-        # Calculate the md5 sum for file_path
-        file_md5 = swiftarchive.files.md5(file_path)
-        logger.debug(" file md5: %s", file_md5)
+    from swiftarchive.swift import Swift
+    from swiftarchive.pipeline import Pipeline
 
-        # Upload file_path to Swift
-        swift_md5 = swift.put_object(args.container, file_path, args.archive_path)
-        logger.debug("swift md5: %s", swift_md5)
+    # Create the Swift object, which authenticates on its first request. Size the connection pool to the upload
+    # concurrency
+    swift = Swift(args.os_username, args.os_password, args.os_project_name, args.os_auth_url,
+                  pool_size=args.workers,
+                  token_cache=args.token_cache,
+                  segment_size=args.segment_size,
+                  segment_threshold=args.segment_threshold,
+                  metrics=metrics,
+                  hash_buffer_size=args.hash_buffer_size,
+                  max_retries=args.max_retries,
+                  adaptive=str(args.adaptive_concurrency).lower() == "true",
+                  compression=args.compress,
+                  compression_level=args.compress_level,
+                  compression_sample_size=args.compress_sample_size)
 
-        if file_md5 == swift_md5:
-            if str(args.delete).lower() == "true":
-                logger.debug("deleting: %s", file_path)
-                swiftarchive.files.delete(file_path)
+    # Load the container listing used to skip files that are already in Swift
+    remote = None
+    if str(args.skip_existing).lower() == "true":
+        remote = swiftarchive.listing.RemoteListing(max_entries)
+        remote.load(swift, args.container)
+
+    # Open the state index used to skip files that are unchanged since they were uploaded
+    index = None
+    if args.state_db is not None:
+        index = swiftarchive.index.StateIndex(args.state_db)
+
+    # Open the dedup index used to copy files with the same contents as an uploaded file within Swift
+    dedup = None
+    if args.dedup_db is not None:
+        dedup = swiftarchive.index.DedupIndex(args.dedup_db)
+
+    # Open the run journal, resuming the previous run if it was interrupted
+    journal = None
+    if args.journal is not None:
+        journal = swiftarchive.journal.RunJournal(args.journal, args.container, args.archive_path,
+                                                  max_entries=max_entries)
+
+    def archive(file_list):
+        """
+        Hash, upload, verify and delete the files in file_list
+        :param file_list: Iterable of swiftarchive.files.FileRecord to archive
+        """
+        pipeline = Pipeline(swift, args.container, args.archive_path,
+                            delete=str(args.delete).lower() == "true",
+                            workers=args.workers,
+                            queue_size=args.queue_size,
+                            index=index,
+                            remote=remote,
+                            bulk_threshold=args.bulk_threshold,
+                            bulk_count=args.bulk_count,
+                            bulk_size=args.bulk_size,
+                            pack_threshold=args.pack_threshold,
+                            pack_size=args.pack_size,
+                            metrics=metrics,
+                            hash_processes=args.hash_processes,
+                            journal=journal,
+                            dedup=dedup,
+                            schedule=args.schedule,
+                            memory_limit=memory_limit)
+        archived = pipeline.run(file_list)
+        logger.debug("archived: %s", archived)
+        logger.debug("skipped: %s", pipeline.skipped)
+
+    metrics.start()
+    success = False
+    try:
+        if watch:
+            from swiftarchive.watch import Watcher
+
+            # Walk once, then archive the files inotify reports once they are quiet, reusing the Swift session
+            watcher = Watcher(args.archive_path,
+                              seconds_since_updated=args.seconds_since_updated,
+                              rescan_interval=args.rescan_interval)
+            try:
+                for batch in watcher.batches():
+                    archive(batch)
+                    metrics.set("last_success_timestamp_seconds", time.time())
+            finally:
+                watcher.close()
         else:
-            raise SwiftException("md5 sum does not match for file \"%s\" file: %s swift: %s" %
-                                 (file_path, file_md5, swift_md5)) from None
+            archive(file_list)
+        success = True
+
+        if journal is not None:
+            journal.finish()
+    finally:
+        swift.close()
+        if remote is not None:
+            remote.close()
+        if index is not None:
+            index.close()
+        if dedup is not None:
+            dedup.close()
+        if journal is not None:
+            journal.close()
+        try:
+            metrics.stop(success)
+        except swiftarchive.exceptions.LocalFileException as ex:
+            if success:
+                raise
+            # Don't replace the exception that failed the run with the one from writing its metrics
+            logger.error("Unable to write metrics: %s", ex)
 
     return 0
@@ -1,49 +1,198 @@
 #!/usr/bin/env python
 
+import io
 import os
+import json
+import queue
+import tarfile
+import tempfile
+import time
 import errno
+import random
+import hashlib
 import logging
+import threading
+import contextlib
+import concurrent.futures
+from urllib.parse import quote, unquote
 from keystoneauth1 import session
 from keystoneauth1.identity import v3
 from swiftclient import Connection
 
+import swiftarchive.files
+import swiftarchive.compress
+import swiftarchive.limiter
+import swiftarchive.metrics
+import swiftarchive.tokencache
 from swiftarchive.exceptions import AuthException
 from swiftarchive.exceptions import SwiftException
 
+import requests.exceptions
 import keystoneauth1.exceptions
 import swiftclient.exceptions
 
 logger = logging.getLogger('swiftarchive.swift')
 
+# Responses worth retrying: timeouts, rate limiting and server errors
+RETRY_STATUSES = (408, 429, 498, 499, 500, 502, 503, 504)
+
+# Responses that mean Swift is throttling the account
+THROTTLE_STATUSES = (429, 498, 503)
+
+
+class ConnectionPool:
+
+    def __init__(self, keystone_session, size=4):
+        """
+        Thread-safe pool of swiftclient connections. Connections are reused between requests so the
+        HTTP keep-alive connection (and its TCP/TLS setup) is shared by every request made through it.
+        :param keystone_session: Authenticated keystoneauth1 session
+        :param size: Maximum number of connections in use at the same time
+        """
+        self.keystone_session = keystone_session
+        self.size = max(1, int(size))
+        self.idle = queue.LifoQueue()
+        self.available = threading.BoundedSemaphore(self.size)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool, blocking while all of the connections are in use
+        :return: swiftclient Connection, returned to the pool when the with block exits
+        """
+        self.available.acquire()
+
+        try:
+            swift_conn = self.idle.get_nowait()
+        except queue.Empty:
+            # Swift retries requests itself, with jittered backoff, so swiftclient doesn't
+            swift_conn = Connection(session=self.keystone_session, retries=0)
+
+        try:
+            yield swift_conn
+        except swiftclient.exceptions.ClientException:
+            # The request completed with an error status, so the connection can still be reused
+            self.idle.put(swift_conn)
+            raise
+        except BaseException:
+            # The request may have been interrupted part way through, so don't reuse the connection
+            swift_conn.close()
+            raise
+        else:
+            self.idle.put(swift_conn)
+        finally:
+            self.available.release()
+
+    def close(self):
+        """
+        Close all of the idle connections in the pool
+        """
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 
 class Swift:
 
-    def __init__(self, os_username, os_password, os_project_name, os_auth_url):
+    def __init__(self, os_username, os_password, os_project_name, os_auth_url, pool_size=4,
+                 segment_size=1073741824, segment_threshold=3500000000, metrics=None, hash_buffer_size=1048576,
+                 max_retries=5, adaptive=False, compression=None, compression_level=None,
+                 compression_sample_size=65536, token_cache=None):
         """
+        Nothing is sent to Keystone until the first request to Swift, which authenticates (or uses the
+        cached token) and the token is renewed whenever it is about to expire.
         :param os_username: OpenStack username
         :param os_password: OpenStack password
         :param os_project_name: OpenStack project name
         :param os_auth_url: Keystone v3 auth url
+        :param pool_size: Number of pooled connections; should match the upload concurrency
+        :param segment_size: Size in bytes of each segment of a Static Large Object. Default is 1GiB.
+        :param segment_threshold: Files larger than segment_threshold bytes are uploaded as Static Large
+                                  Objects. Default is 3.5GB.
+        :param metrics: swiftarchive.metrics.Metrics the retries are counted in. Default is None.
+        :param hash_buffer_size: Number of bytes read per call when hashing a local file. Default is 1MiB.
+        :param max_retries: Number of times a throttled or failed request is retried. Default is 5.
+        :param adaptive: Adapt the number of uploads in flight to throttling and latency, up to pool_size.
+                         Default is False (always allow pool_size uploads).
+        :param compression: Codec (gzip or zstd) files are compressed with while they are uploaded, if a sample
+                            of the file compresses well. Default is None (not compressed).
+        :param compression_level: Compression level. Default is None (the codec's default level).
+        :param compression_sample_size: Number of bytes from the start of each file compressed to decide whether
+                                        the file is compressed. Default is 64KiB.
+        :param token_cache: Path to a file the Keystone token is cached in between runs. Default is None
+                            (authenticate on every run).
         """
         self.keystone_session = None
+        self.pool = None
+        self.segment_size = int(segment_size)
+        self.segment_threshold = int(segment_threshold)
+        self.metrics = metrics if metrics is not None else swiftarchive.metrics.Metrics()
+        self.hash_buffer_size = int(hash_buffer_size)
+        self.max_retries = int(max_retries)
+        self.limiter = swiftarchive.limiter.AdaptiveLimiter(pool_size) if adaptive else None
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_sample_size = int(compression_sample_size)
 
-        try:
-            auth = v3.Password(auth_url=os_auth_url,
-                               username=os_username,
-                               password=os_password,
-                               project_name=os_project_name,
-                               user_domain_name='default',
-                               project_domain_name='default')
-            self.keystone_session = session.Session(auth=auth)
+        if compression is not None:
+            swiftarchive.compress.check_codec(compression)
 
-            # Test that the credentials are valid
-            self.keystone_session.get(os_auth_url)
+        # Containers known to exist, so they are only checked (or created) once per run
+        self.containers = set()
+        self.containers_lock = threading.Lock()
 
+        self.auth = v3.Password(auth_url=os_auth_url,
+                                username=os_username,
+                                password=os_password,
+                                project_name=os_project_name,
+                                user_domain_name='default',
+                                project_domain_name='default')
+        self.keystone_session = session.Session(auth=self.auth)
+        self.pool = ConnectionPool(self.keystone_session, pool_size)
+
+        self.token_cache = None
+        self.cached_auth_ref = None
+        self.token_lock = threading.Lock()
+
+        if token_cache is not None:
+            self.token_cache = swiftarchive.tokencache.TokenCache(token_cache)
+            if self.token_cache.load(self.auth):
+                self.cached_auth_ref = self.auth.auth_ref
+
+    def authenticate(self):
+        """
+        Authenticate with Keystone if there is no token yet or the token is about to expire, caching any
+        new token
+        :return: A valid token
+        """
+        try:
+            token = self.keystone_session.get_token()
         except keystoneauth1.exceptions.http.Unauthorized:
             raise AuthException("Unauthorized") from None
         except keystoneauth1.exceptions.connection.ConnectFailure:
             raise AuthException("Unable to establish connection") from None
 
+        if self.token_cache is not None and self.auth.auth_ref is not self.cached_auth_ref:
+            with self.token_lock:
+                if self.auth.auth_ref is not self.cached_auth_ref:
+                    self.token_cache.save(self.auth)
+                    self.cached_auth_ref = self.auth.auth_ref
+
+        return token
+
+    def _refresh_token(self, swift_conn):
+        """
+        Give a pooled connection the current token; swiftclient keeps using the token it first got until it
+        is rejected, which would fail an upload that can't be rewound
+        :param swift_conn: swiftclient Connection
+        """
+        token = self.authenticate()
+
+        if swift_conn.token is not None and swift_conn.token != token:
+            swift_conn.token = token
+
     def head(self, os_container, os_object=None):
         """
         Get header information for container or object
@@ -53,54 +202,92 @@ class Swift:
                  will be returned. If an object is specified then the etag (md5 hash) will be
                  returned. If the container or object isn't found then None is returned.
         """
-        swift_conn = Connection(session=self.keystone_session)
-
         try:
             if os_object is None:
-                return swift_conn.head_container(os_container)["x-container-object-count"]
+                return self._call("head_container", os_container)["x-container-object-count"]
             else:
-                return swift_conn.head_object(os_container, os_object)["etag"]
+                return self._call("head_object", os_container, os_object)["etag"]
         except swiftclient.exceptions.ClientException:
             return None
 
+    def list_objects(self, os_container, prefix=None, limit=10000, marker=None, end_marker=None):
+        """
+        Stream the container listing one page at a time
+        :param os_container: container name
+        :param prefix: only list objects whose names start with prefix
+        :param limit: number of objects requested per page. Default is 10000.
+        :param marker: only list objects whose names sort after marker. Default is None.
+        :param end_marker: only list objects whose names sort before end_marker. Default is None.
+        :return: Generator yielding a dict (name, bytes, hash, ...) for each object in the container.
+                 Nothing is yielded if the container doesn't exist.
+        """
+        marker = marker or ""
+        options = {"end_marker": end_marker} if end_marker is not None else {}
+
+        while True:
+            try:
+                headers, page = self._call("get_container", os_container, marker=marker, limit=limit, prefix=prefix,
+                                           **options)
+            except swiftclient.exceptions.ClientException as ex:
+                if ex.http_status == 404:
+                    return
+                raise SwiftException("Swift Client Exception listing \"%s\": %s" % (os_container, ex.msg)) from None
+
+            if not page:
+                return
+
+            for swift_object in page:
+                yield swift_object
+
+            marker = page[-1]["name"]
+
     def put_container(self, os_container):
         """
         Create a container
         :param os_container: name of container to create
         :return: True if container was created; false if an exception occurred
         """
-        swift_conn = Connection(session=self.keystone_session)
-
         try:
-            swift_conn.put_container(os_container)
-            swift_conn.close()
+            self._call("put_container", os_container)
             return True
         except swiftclient.exceptions.ClientException:
-            swift_conn.close()
             return False
 
     def put_object(self, os_container, os_object, strip_path=""):
         """
-        Upload an object
+        Upload an object, calculating the md5 hash of the file from the bytes sent to Swift. Files larger
+        than segment_threshold are uploaded in parallel segments as a Static Large Object. If compression
+        is enabled and a sample of the file compresses well, the file is compressed while it is uploaded.
         :param os_container:
         :param os_object: path of the object to uploaded (The path will be replicated on Swift)
         :param strip_path: Remove the strip_path from the start of the os_object path when uploading to Swift
-        :return: The etag (md5 hash) will be returned if the upload was successful.
+        :return: The etag (md5 hash) will be returned if the upload was successful and the etag
+                 matches the md5 hash of the uploaded file. For a Static Large Object the etag is the
+                 md5 hash of the segment etags. For a compressed object the md5 hash of the original file
+                 is returned once the etag has been checked against the compressed bytes.
         """
-        if os.path.getsize(os_object) > 3500000000:
-            raise SwiftException("Upload of \"%s\" failed. Files over 3.5GB not supported" %
-                                 os_object) from None
+        file_size = os.path.getsize(os_object)
 
-        swift_conn = Connection(session=self.keystone_session)
+        if file_size > self.segment_threshold:
+            upload = self._put_segmented
+        else:
+            upload = self._put_file
 
-        if self.head(os_container) is None:
-            logger.debug("swift container %s missing, creating container" % os_container)
-            if self.put_container(os_container) is False:
-                raise SwiftException("Container \"%s\" could not be created" % os_container) from None
+        self.ensure_container(os_container)
 
         try:
-            with open(os_object, 'rb') as local:
-                return swift_conn.put_object(os_container, os_object[len(strip_path):], contents=local)
+            try:
+                file_md5, swift_md5 = upload(os_container, os_object, strip_path, file_size)
+            except swiftclient.exceptions.ClientException as ex:
+                if ex.http_status != 404:
+                    raise
+                # The container was removed after it was cached; create it again and retry the upload once
+                logger.debug("swift container %s missing, creating container" % os_container)
+                self.metrics.inc("retries_total")
+                self.invalidate_container(os_container)
+                self.invalidate_container(self.segment_container(os_container))
+                self.ensure_container(os_container)
+                file_md5, swift_md5 = upload(os_container, os_object, strip_path, file_size)
         except OSError as ex:
             if ex.errno == errno.ENOENT:
                 raise SwiftException("File \"%s\" could not be found" % os_object) from None
@@ -110,3 +297,632 @@ class Swift:
                 raise SwiftException("Unknown error with \"%s\": %s" % (os_object, ex.strerror)) from None
         except swiftclient.exceptions.ClientException as ex:
             raise SwiftException("Swift Client Exception with \"%s\": %s" % (os_object, ex.msg)) from None
+
+        if file_md5 != swift_md5:
+            raise SwiftException("md5 sum does not match for file \"%s\" file: %s swift: %s" %
+                                 (os_object, file_md5, swift_md5)) from None
+
+        return swift_md5
+
+    def put_stream(self, os_container, object_name, stream, length):
+        """
+        Upload the contents of a binary file object, calculating the md5 hash from the bytes sent
+        :param os_container: container name
+        :param object_name: object name
+        :param stream: binary file object positioned at the start of the data to upload
+        :param length: number of bytes to upload from stream
+        :return: The etag (md5 hash) will be returned if the upload was successful and the etag
+                 matches the md5 hash of the bytes sent.
+        """
+        self.ensure_container(os_container)
+
+        try:
+            reader = swiftarchive.files.HashingReader(stream, stream.tell())
+            swift_md5 = self._call("put_object", os_container, object_name, contents=reader, content_length=length)
+        except swiftclient.exceptions.ClientException as ex:
+            raise SwiftException("Swift Client Exception with \"%s\": %s" % (object_name, ex.msg)) from None
+
+        if reader.hexdigest() != swift_md5:
+            raise SwiftException("md5 sum does not match for object \"%s\" local: %s swift: %s" %
+                                 (object_name, reader.hexdigest(), swift_md5)) from None
+
+        return swift_md5
+
+    def copy_object(self, source_container, source_object, os_container, object_name, file_size, file_md5):
+        """
+        Create an object as a server-side copy of an object already in Swift, so a duplicate file doesn't have
+        to be uploaded again. A Static Large Object is copied as a new manifest of the same segments, which are
+        marked as shared so they are kept when the source is replaced.
+        :param source_container: container name of the object to copy
+        :param source_object: object name of the object to copy
+        :param os_container: container name of the new object
+        :param object_name: object name of the new object
+        :param file_size: size of the local file in bytes
+        :param file_md5: md5 hash of the local file, as calculated by local_etag
+        :return: file_md5 if the copy was successful and its etag (or the md5 hash of the original file of a
+                 compressed object) matches file_md5, or None if the object to copy no longer exists or no
+                 longer matches the file
+        """
+        self.ensure_container(os_container)
+
+        query_string = None
+        headers = {"X-Copy-From": "/%s/%s" % (quote(source_container), quote(source_object))}
+
+        if file_size > self.segment_threshold:
+            query_string = "multipart-manifest=get"
+
+            # Mark the segments shared before the copy references them, so replacing the source doesn't delete them
+            try:
+                for segment_path in self._manifest_segments(source_container, source_object):
+                    segment_container, segment_name = segment_path[1:].split("/", 1)
+                    self._call("post_object", segment_container, segment_name,
+                               headers={"X-Object-Meta-Swift-Archive-Shared": "true"})
+            except swiftclient.exceptions.ClientException as ex:
+                raise SwiftException("Swift Client Exception with \"%s\": %s" % (object_name, ex.msg)) from None
+
+        try:
+            swift_md5 = self._call("put_object", os_container, object_name, contents=None, content_length=0,
+                                   headers=headers, query_string=query_string)
+        except swiftclient.exceptions.ClientException as ex:
+            if ex.http_status == 404:
+                logger.debug("unable to copy %s/%s: not found", source_container, source_object)
+                return None
+            raise SwiftException("Swift Client Exception with \"%s\": %s" % (object_name, ex.msg)) from None
+
+        if swift_md5 != file_md5:
+            # A compressed object is checked against the md5 hash of the original file in its metadata
+            try:
+                metadata = self._call("head_object", os_container, object_name)
+            except swiftclient.exceptions.ClientException as ex:
+                raise SwiftException("Swift Client Exception with \"%s\": %s" % (object_name, ex.msg)) from None
+
+            if metadata.get("x-object-meta-swift-archive-original-md5") != file_md5:
+                # The object was replaced since it was indexed; put_object overwrites the copy
+                logger.debug("copy of %s/%s has etag %s, expected %s", source_container, source_object, swift_md5,
+                             file_md5)
+                return None
+
+        return file_md5
+
+    def get_object(self, os_container, os_object, offset=None, length=None):
+        """
+        Download an object, or a byte range of an object with an HTTP Range request
+        :param os_container: container name
+        :param os_object: object name
+        :param offset: position of the first byte to download. Default is None (the whole object)
+        :param length: number of bytes to download from offset
+        :return: The contents of the object (or range) as bytes
+        """
+        headers = None
+
+        if offset is not None:
+            if length == 0:
+                return b""
+            headers = {"Range": "bytes=%s-%s" % (offset, offset + length - 1)}
+
+        try:
+            response_headers, contents = self._call("get_object", os_container, os_object, headers=headers)
+        except swiftclient.exceptions.ClientException as ex:
+            raise SwiftException("Swift Client Exception with \"%s\": %s" % (os_object, ex.msg)) from None
+
+        return contents
+
+    def download_object(self, os_container, os_object, file_path):
+        """
+        Download an object to a file, calculating the md5 hash from the bytes written. The object is
+        written to a temporary file that is renamed to file_path once the download is verified. A
+        compressed object is decompressed as it is written and also checked against the md5 hash of the
+        original file.
+        :param os_container: container name
+        :param os_object: object name
+        :param file_path: path of the file to write
+        :return: The etag (md5 hash) will be returned if the download was successful and the etag
+                 matches the md5 hash of the bytes written.
+        """
+        directory = os.path.dirname(file_path) or "."
+        part_path = None
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            with tempfile.NamedTemporaryFile(dir=directory, prefix=".swift-archive-", delete=False) as local:
+                part_path = local.name
+
+                with self.pool.connection() as swift_conn:
+                    self._refresh_token(swift_conn)
+                    headers, body = swift_conn.get_object(os_container, os_object, resp_chunk_size=1048576)
+
+                    segment_size = None
+                    if headers.get("x-static-large-object", "").lower() == "true":
+                        segment_size = int(headers.get("x-object-meta-swift-archive-segment-size", 0)) or None
+
+                    # A compressed object is hashed as downloaded and again once it is decompressed
+                    codec = headers.get("x-object-meta-swift-archive-codec")
+                    if codec is not None:
+                        original = swiftarchive.files.HashingWriter(local)
+                        decompressing = swiftarchive.compress.DecompressingWriter(original, codec)
+                        writer = swiftarchive.files.HashingWriter(decompressing, segment_size)
+                    else:
+                        writer = swiftarchive.files.HashingWriter(local, segment_size)
+
+                    for chunk in body:
+                        writer.write(chunk)
+
+                    if codec is not None:
+                        decompressing.flush()
+
+            swift_md5 = headers.get("etag", "").strip('"')
+
+            if headers.get("x-static-large-object", "").lower() != "true":
+                file_md5 = writer.hexdigest()
+            elif segment_size is not None:
+                file_md5 = writer.slo_hexdigest()
+            else:
+                # A Static Large Object uploaded by another tool; the segment boundaries aren't known
+                logger.debug("unable to verify static large object %s", os_object)
+                file_md5 = swift_md5
+
+            if file_md5 != swift_md5:
+                raise SwiftException("md5 sum does not match for object \"%s\" file: %s swift: %s" %
+                                     (os_object, file_md5, swift_md5)) from None
+
+            original_md5 = headers.get("x-object-meta-swift-archive-original-md5")
+            if codec is not None and original_md5 is not None and original.hexdigest() != original_md5:
+                raise SwiftException("md5 sum does not match for decompressed object \"%s\" file: %s swift: %s" %
+                                     (os_object, original.hexdigest(), original_md5)) from None
+
+            os.replace(part_path, file_path)
+        except BaseException as ex:
+            if part_path is not None and os.path.exists(part_path):
+                os.remove(part_path)
+
+            if isinstance(ex, OSError):
+                if ex.errno == errno.ENOENT:
+                    raise SwiftException("File \"%s\" could not be found" % file_path) from None
+                elif ex.errno == errno.EACCES:
+                    raise SwiftException("Permission error with \"%s\"" % file_path) from None
+                else:
+                    raise SwiftException("Unknown error with \"%s\": %s" % (file_path, ex.strerror)) from None
+            elif isinstance(ex, swiftclient.exceptions.ClientException):
+                raise SwiftException("Swift Client Exception with \"%s\": %s" % (os_object, ex.msg)) from None
+            raise
+
+        return swift_md5
+
+    def put_archive(self, os_container, os_objects, strip_path=""):
+        """
+        Upload many small files in one request as a tar archive extracted by the Swift bulk middleware
+        (extract-archive), so each file still ends up as an individual object. The objects created are
+        verified against the md5 hash of each file with a container listing, which may lag behind the
+        upload; files that fail or can't be verified should be uploaded again with put_object.
+        :param os_container: container name
+        :param os_objects: paths of the files to upload (The paths will be replicated on Swift)
+        :param strip_path: Remove the strip_path from the start of the os_object paths when uploading to Swift
+        :return: Tuple of a dict of the verified file paths to their etag (md5 hash) and a dict of the
+                 failed file paths to the reason they failed
+        """
+        members = {}
+        archive = io.BytesIO()
+
+        with tarfile.open(fileobj=archive, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for os_object in os_objects:
+                try:
+                    with open(os_object, 'rb') as local:
+                        data = local.read()
+                except OSError as ex:
+                    if ex.errno == errno.ENOENT:
+                        raise SwiftException("File \"%s\" could not be found" % os_object) from None
+                    elif ex.errno == errno.EACCES:
+                        raise SwiftException("Permission error with \"%s\"" % os_object) from None
+                    else:
+                        raise SwiftException("Unknown error with \"%s\": %s" % (os_object, ex.strerror)) from None
+
+                # The bulk middleware removes leading slashes from the names, which an archive path given without a
+                # trailing slash leaves on every name
+                object_name = swiftarchive.files.object_name(os_object, strip_path).lstrip("/")
+                members[object_name] = (os_object, len(data), hashlib.md5(data).hexdigest())
+
+                tar_info = tarfile.TarInfo(object_name)
+                tar_info.size = len(data)
+                tar_info.mtime = os.path.getmtime(os_object)
+                tar.addfile(tar_info, io.BytesIO(data))
+
+        archive_size = archive.tell()
+        self.ensure_container(os_container)
+
+        attempt = 0
+
+        while True:
+            # Send the archive itself rather than a copy, which would double the memory held by each batch
+            archive.seek(0)
+
+            # Like the uploads made by _call, the archive is admitted by the adaptive limiter (if enabled),
+            # which is told about throttling and latency
+            with contextlib.ExitStack() as stack:
+                if self.limiter is not None:
+                    stack.enter_context(self.limiter.slot())
+
+                started = time.perf_counter()
+
+                try:
+                    response = self.keystone_session.put("/" + quote(os_container),
+                                                         endpoint_filter={"service_type": "object-store",
+                                                                          "interface": "public"},
+                                                         params={"extract-archive": "tar"},
+                                                         headers={"Accept": "application/json"},
+                                                         data=archive,
+                                                         raise_exc=False)
+                except keystoneauth1.exceptions.ClientException as ex:
+                    raise SwiftException("Bulk upload to \"%s\" failed: %s" % (os_container, ex)) from None
+
+                if self.limiter is not None:
+                    if response.status_code in THROTTLE_STATUSES:
+                        self.limiter.throttled()
+                    elif 200 <= response.status_code < 300:
+                        self.limiter.success(time.perf_counter() - started, archive_size)
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                break
+
+            attempt += 1
+            logger.debug("bulk upload failed with %s, retrying", response.status_code)
+            self._backoff(attempt)
+
+        if response.status_code < 200 or response.status_code >= 300:
+            raise SwiftException("Bulk upload to \"%s\" failed: %s %s" %
+                                 (os_container, response.status_code, response.reason)) from None
+
+        try:
+            result = response.json()
+        except ValueError:
+            raise SwiftException("Bulk upload to \"%s\" failed: invalid response" % os_container) from None
+
+        failed = {}
+
+        # Errors are listed as [quoted path, status], where the path may include the account and container
+        for error_path, status in result.get("Errors", []):
+            error_path = "/" + unquote(error_path).lstrip("/")
+            for name in members:
+                if error_path == "/" + name or error_path.endswith("/" + os_container + "/" + name):
+                    failed[members[name][0]] = status
+
+        if not failed and not result.get("Response Status", "201").startswith("2"):
+            raise SwiftException("Bulk upload to \"%s\" failed: %s" %
+                                 (os_container, result.get("Response Status"))) from None
+
+        # Verify the objects that were created with one listing of the names in the archive
+        verified = {}
+        created = sorted(name for name in members if members[name][0] not in failed)
+
+        if created:
+            # Both markers are exclusive, so list from the name just before the first one created to just after the
+            # last, rather than every object sharing their prefix
+            for swift_object in self.list_objects(os_container, prefix=os.path.commonprefix(created),
+                                                  marker=created[0][:-1], end_marker=created[-1] + "\x01"):
+                if swift_object["name"] > created[-1]:
+                    break
+
+                member = members.get(swift_object["name"])
+
+                if member is not None and member[0] not in failed and \
+                        (swift_object["bytes"], swift_object["hash"]) == member[1:]:
+                    verified[member[0]] = member[2]
+
+        for name in created:
+            if members[name][0] not in verified:
+                failed[members[name][0]] = "md5 sum could not be verified"
+
+        return verified, failed
+
+    def local_etag(self, os_object, file_size, executor=None):
+        """
+        Calculate the etag Swift would return for a file uploaded by put_object, without uploading it
+        :param os_object: path of the file
+        :param file_size: size of the file in bytes
+        :param executor: concurrent.futures executor the file (or each segment of the file) is hashed
+                         in. Default is None (hash in the calling thread).
+        :return: md5 hash of the file, or the md5 hash of the segment md5 hashes if the file would be
+                 uploaded as a Static Large Object
+        """
+        if file_size <= self.segment_threshold:
+            regions = [(0, None)]
+        else:
+            regions = [(offset, min(self.segment_size, file_size - offset))
+                       for offset in range(0, file_size, self.segment_size)]
+
+        if executor is None:
+            md5s = [swiftarchive.files.md5(os_object, offset, length, self.hash_buffer_size)
+                    for offset, length in regions]
+        else:
+            futures = [executor.submit(swiftarchive.files.md5, os_object, offset, length, self.hash_buffer_size)
+                       for offset, length in regions]
+            md5s = [future.result() for future in futures]
+
+        if file_size <= self.segment_threshold:
+            return md5s[0]
+
+        return hashlib.md5("".join(md5s).encode()).hexdigest()
+
+    def _put_file(self, os_container, os_object, strip_path, file_size):
+        """
+        Stream a file to Swift through a HashingReader, or through a CompressingReader if the file is
+        compressible
+        :param os_container: container name
+        :param os_object: path of the file to upload
+        :param strip_path: Remove the strip_path from the start of the os_object path when uploading to Swift
+        :param file_size: size of the file in bytes
+        :return: Tuple of the md5 hash of the bytes sent and the etag returned by Swift
+        """
+        with open(os_object, 'rb') as local:
+            if self.compression is not None and file_size > 0 and \
+                    swiftarchive.compress.compressible(local.read(self.compression_sample_size), self.compression,
+                                                       self.compression_level):
+                return self._put_compressed(os_container, os_object,
+                                            swiftarchive.files.object_name(os_object, strip_path), local, file_size)
+
+            local.seek(0)
+            reader = swiftarchive.files.HashingReader(local)
+            swift_md5 = self._call("put_object", os_container, swiftarchive.files.object_name(os_object, strip_path),
+                                   contents=reader, content_length=file_size)
+
+        return reader.hexdigest(), swift_md5
+
+    def _put_compressed(self, os_container, os_object, object_name, local, file_size):
+        """
+        Compress a file while it is uploaded with chunked transfer encoding. The etag is checked against
+        the compressed bytes, then the codec and the size and md5 hash of the original file are added to
+        the object metadata and content type (they are only known once the whole file has been read).
+        :param os_container: container name
+        :param os_object: path of the file to upload
+        :param object_name: object name
+        :param local: binary file object of os_object
+        :param file_size: size of the file in bytes
+        :return: Tuple of the md5 hash of the original file, twice
+        """
+        codec_header = {"X-Object-Meta-Swift-Archive-Codec": self.compression}
+        reader = swiftarchive.compress.CompressingReader(local, self.compression, self.compression_level)
+        swift_md5 = self._call("put_object", os_container, object_name, contents=reader, headers=codec_header,
+                               upload_size=file_size)
+
+        if reader.hexdigest() != swift_md5:
+            raise SwiftException("md5 sum does not match for compressed file \"%s\" file: %s swift: %s" %
+                                 (os_object, reader.hexdigest(), swift_md5)) from None
+
+        if reader.original_size != file_size:
+            raise SwiftException("File \"%s\" changed size while it was uploaded" % os_object) from None
+
+        logger.debug("compressed %s from %s to %s bytes", os_object, file_size, reader.size)
+
+        self._call("post_object", os_container, object_name,
+                   headers=dict(codec_header, **{
+                       "X-Object-Meta-Swift-Archive-Original-Size": str(reader.original_size),
+                       "X-Object-Meta-Swift-Archive-Original-Md5": reader.original_hexdigest(),
+                       "Content-Type": swiftarchive.compress.content_type(self.compression, reader.original_size,
+                                                                          reader.original_hexdigest())}))
+
+        return reader.original_hexdigest(), reader.original_hexdigest()
+
+    def _put_segmented(self, os_container, os_object, strip_path, file_size):
+        """
+        Upload a file as a Static Large Object. The segments are uploaded in parallel over the pooled
+        connections and each one is verified before the manifest is uploaded. Once the manifest is stored
+        the segments of the manifest it replaced are deleted, and the segments of a failed upload are
+        deleted when it fails.
+        :param os_container: container name
+        :param os_object: path of the file to upload
+        :param strip_path: Remove the strip_path from the start of the os_object path when uploading to Swift
+        :param file_size: size of the file in bytes
+        :return: Tuple of the md5 hash of the segment md5 hashes and the manifest etag returned by Swift
+        """
+        object_name = swiftarchive.files.object_name(os_object, strip_path)
+        segment_container = self.segment_container(os_container)
+        segment_prefix = "%s/slo/%s/%s/%s/" % (object_name, os.path.getmtime(os_object), file_size, self.segment_size)
+
+        self.ensure_container(segment_container)
+
+        segments = []
+        for offset in range(0, file_size, self.segment_size):
+            segments.append((segment_prefix + "%08d" % len(segments), offset, min(self.segment_size, file_size - offset)))
+
+        # The segment prefix includes the mtime, so the segments of an earlier upload of the file would be left
+        # behind by the manifest this upload replaces
+        previous = self._manifest_segments(os_container, object_name, "/%s/%s/slo/" % (segment_container, object_name))
+        uploaded = ["/%s/%s" % (segment_container, segment_name) for segment_name, offset, length in segments]
+
+        logger.debug("uploading %s in %s segments", os_object, len(segments))
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.pool.size, len(segments))) as executor:
+                futures = [executor.submit(self._put_segment, segment_container, os_object, *segment)
+                           for segment in segments]
+
+                try:
+                    segment_md5s = [future.result() for future in futures]
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            manifest = [{"path": path, "etag": segment_md5, "size_bytes": length}
+                        for path, (segment_name, offset, length), segment_md5 in zip(uploaded, segments, segment_md5s)]
+
+            # The segment size is kept in the metadata so a download can be verified against the etag
+            swift_md5 = self._call("put_object", os_container, object_name, contents=json.dumps(manifest),
+                                   query_string="multipart-manifest=put",
+                                   headers={"X-Object-Meta-Swift-Archive-Segment-Size": str(self.segment_size)},
+                                   upload_size=file_size)
+        except Exception:
+            # Segments an upload of the same mtime and size shares with the stored manifest are still in use
+            self._delete_segments([path for path in uploaded if path not in previous])
+            raise
+
+        self._delete_segments([path for path in previous if path not in uploaded])
+
+        # The etag of a Static Large Object is the md5 hash of its segment etags
+        return hashlib.md5("".join(segment_md5s).encode()).hexdigest(), swift_md5
+
+    def _manifest_segments(self, os_container, object_name, prefix=""):
+        """
+        :param os_container: container name
+        :param object_name: object name
+        :param prefix: only return the segments whose path starts with prefix. Default is "" (all segments).
+        :return: list of the segment paths ("/container/object") of the Static Large Object stored at object_name,
+                 empty if there is no such object or it isn't a Static Large Object
+        """
+        try:
+            metadata = self._call("head_object", os_container, object_name)
+            if metadata.get("x-static-large-object", "").lower() != "true":
+                return []
+            headers, contents = self._call("get_object", os_container, object_name,
+                                           query_string="multipart-manifest=get")
+            return [segment["name"] for segment in json.loads(contents) if segment["name"].startswith(prefix)]
+        except swiftclient.exceptions.ClientException as ex:
+            if ex.http_status != 404:
+                raise
+        except (ValueError, KeyError, TypeError):
+            logger.warning("unable to read the manifest of %s", object_name)
+
+        return []
+
+    def _delete_segments(self, segment_paths):
+        """
+        Delete Static Large Object segments, except those shared with a copy made by copy_object. A segment that
+        can't be deleted is logged rather than failing the upload.
+        :param segment_paths: list of segment paths ("/container/object")
+        """
+        for segment_path in segment_paths:
+            segment_container, segment_name = segment_path[1:].split("/", 1)
+            try:
+                if self._call("head_object", segment_container, segment_name).get("x-object-meta-swift-archive-shared"):
+                    logger.debug("keeping segment %s shared with a copy", segment_path)
+                    continue
+                self._call("delete_object", segment_container, segment_name)
+            except swiftclient.exceptions.ClientException as ex:
+                if ex.http_status != 404:
+                    logger.warning("unable to delete segment %s: %s", segment_path, ex.msg)
+
+    def _put_segment(self, segment_container, os_object, segment_name, offset, length):
+        """
+        Upload and verify one segment of a Static Large Object
+        :param segment_container: container name for the segments
+        :param os_object: path of the file being uploaded
+        :param segment_name: object name of the segment
+        :param offset: position of the segment in the file
+        :param length: size of the segment in bytes
+        :return: The etag (md5 hash) of the segment
+        """
+        with open(os_object, 'rb') as local:
+            local.seek(offset)
+            reader = swiftarchive.files.HashingReader(local, offset)
+            swift_md5 = self._call("put_object", segment_container, segment_name, contents=reader,
+                                   content_length=length)
+
+        if reader.hexdigest() != swift_md5:
+            raise SwiftException("md5 sum does not match for segment \"%s\" of file \"%s\" file: %s swift: %s" %
+                                 (segment_name, os_object, reader.hexdigest(), swift_md5)) from None
+
+        return swift_md5
+
+    @staticmethod
+    def segment_container(os_container):
+        """
+        :param os_container: container name
+        :return: name of the container holding the Static Large Object segments for os_container
+        """
+        return os_container + "_segments"
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Make a request on a pooled connection, retrying timeouts, throttled requests, server errors and
+        connection failures up to max_retries times with full jitter exponential backoff. Uploads are
+        admitted by the adaptive limiter (if enabled), which is told about throttling and latency.
+        :param method: name of the swiftclient.Connection method to call
+        :param args: positional arguments for the method
+        :param kwargs: keyword arguments for the method, and upload_size: the number of bytes stored by an upload
+                       without a content_length (a chunked upload or a Static Large Object manifest), which the
+                       adaptive limiter normalises the latency by. Default is the content_length.
+        :return: The return value of the method
+        """
+        upload_size = kwargs.pop("upload_size", None)
+        if upload_size is None:
+            upload_size = kwargs.get("content_length") or 0
+        contents = kwargs.get("contents")
+        limiter = self.limiter if method == "put_object" else None
+        attempt = 0
+
+        while True:
+            with contextlib.ExitStack() as stack:
+                if limiter is not None:
+                    stack.enter_context(limiter.slot())
+
+                started = time.perf_counter()
+
+                try:
+                    with self.pool.connection() as swift_conn:
+                        self._refresh_token(swift_conn)
+                        result = getattr(swift_conn, method)(*args, **kwargs)
+                except swiftclient.exceptions.ClientException as ex:
+                    if limiter is not None and ex.http_status in THROTTLE_STATUSES:
+                        limiter.throttled()
+                    if ex.http_status not in RETRY_STATUSES or attempt >= self.max_retries:
+                        raise
+                    logger.debug("%s failed with %s, retrying", method, ex.http_status)
+                except requests.exceptions.RequestException as ex:
+                    if attempt >= self.max_retries:
+                        raise swiftclient.exceptions.ClientException(str(ex)) from None
+                    logger.debug("%s failed with %s, retrying", method, ex)
+                else:
+                    if limiter is not None:
+                        limiter.success(time.perf_counter() - started, upload_size)
+                    return result
+
+            attempt += 1
+            self._backoff(attempt)
+
+            # Rewind a HashingReader so the retry sends (and hashes) the data from the start again
+            if hasattr(contents, "reset"):
+                contents.reset()
+
+    def _backoff(self, attempt):
+        """
+        Sleep before retrying a request
+        :param attempt: Number of the retry, starting at 1
+        """
+        self.metrics.inc("retries_total")
+        time.sleep(random.uniform(0, min(32.0, 0.5 * 2 ** attempt)))
+
+    def ensure_container(self, os_container):
+        """
+        Make sure a container exists, creating it if needed. The result is cached so the container is
+        only checked once until invalidate_container is called.
+        :param os_container: container name
+        :return: None, raises a SwiftException if the container could not be created
+        """
+        if os_container in self.containers:
+            return
+
+        with self.containers_lock:
+            if os_container in self.containers:
+                return
+
+            if self.head(os_container) is None:
+                logger.debug("swift container %s missing, creating container" % os_container)
+                if self.put_container(os_container) is False:
+                    raise SwiftException("Container \"%s\" could not be created" % os_container) from None
+
+            self.containers.add(os_container)
+
+    def invalidate_container(self, os_container):
+        """
+        Forget that a container exists so the next ensure_container checks it again
+        :param os_container: container name
+        """
+        with self.containers_lock:
+            self.containers.discard(os_container)
+
+    def close(self):
+        """
+        Close the pooled connections
+        """
+        if self.pool is not None:
+            self.pool.close()
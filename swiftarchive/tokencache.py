@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import os
+import json
+import stat
+import logging
+
+logger = logging.getLogger('swiftarchive.tokencache')
+
+
+class TokenCache:
+
+    def __init__(self, cache_path):
+        """
+        File the scoped Keystone token and service catalog are kept in between runs, so a run doesn't have
+        to authenticate while the token is still valid. Tokens are stored by the cache id of the auth
+        plugin (a hash of its credentials and scope), so one file can be shared by several accounts.
+        The file is only readable by its owner and is ignored if anyone else can read or write it.
+        :param cache_path: Path to the cache file (created if it doesn't exist)
+        """
+        self.cache_path = cache_path
+
+    def load(self, auth):
+        """
+        Install the cached token for auth, if there is one. keystoneauth authenticates again if the token
+        has expired or is about to.
+        :param auth: keystoneauth1 identity plugin
+        :return: True if a cached token was installed
+        """
+        cache_id = auth.get_cache_id()
+        state = self.read().get(cache_id) if cache_id is not None else None
+
+        if state is None:
+            return False
+
+        try:
+            auth.set_auth_state(state)
+        except (ValueError, KeyError, TypeError) as ex:
+            logger.debug("ignoring cached token: %s", ex)
+            auth.set_auth_state(None)
+            return False
+
+        logger.debug("using cached token from %s", self.cache_path)
+        return True
+
+    def save(self, auth):
+        """
+        Store the current token of auth
+        :param auth: keystoneauth1 identity plugin
+        """
+        cache_id = auth.get_cache_id()
+        state = auth.get_auth_state()
+
+        if cache_id is None or state is None:
+            return
+
+        tokens = self.read()
+        tokens[cache_id] = state
+
+        part_path = "%s.%s.tmp" % (self.cache_path, os.getpid())
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", mode=0o700, exist_ok=True)
+
+            # Create the file with owner only permissions rather than restricting it after it is written
+            fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as cache:
+                json.dump(tokens, cache)
+            os.replace(part_path, self.cache_path)
+        except OSError as ex:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            # The cache only saves time, so failing to write it doesn't fail the run
+            logger.info("Unable to write token cache \"%s\": %s", self.cache_path, ex.strerror)
+
+    def read(self):
+        """
+        :return: dict of cache id to token state, empty if the cache doesn't exist or can't be trusted
+        """
+        try:
+            with open(self.cache_path) as cache:
+                cache_stat = os.fstat(cache.fileno())
+
+                if cache_stat.st_uid != os.getuid() or stat.S_IMODE(cache_stat.st_mode) & 0o077:
+                    logger.info("Ignoring token cache \"%s\": it can be accessed by other users", self.cache_path)
+                    return {}
+
+                tokens = json.load(cache)
+        except OSError as ex:
+            if os.path.exists(self.cache_path):
+                logger.info("Unable to read token cache \"%s\": %s", self.cache_path, ex.strerror)
+            return {}
+        except ValueError:
+            logger.debug("ignoring corrupt token cache %s", self.cache_path)
+            return {}
+
+        return tokens if isinstance(tokens, dict) else {}
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+import os
+import stat
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import itertools
+
+import swiftarchive.files
+from swiftarchive.exceptions import LocalFileException
+
+logger = logging.getLogger('swiftarchive.watch')
+
+# inotify event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+
+    def __init__(self):
+        """
+        Minimal inotify binding through ctypes
+        """
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            raise LocalFileException("inotify is not available") from None
+
+        if self.fd < 0:
+            raise LocalFileException("Unable to initialize inotify: %s" % os.strerror(ctypes.get_errno())) from None
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        :param path: Path to the directory to watch
+        :param mask: inotify events to watch for. Default is WATCH_MASK.
+        :return: The watch descriptor of path
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise LocalFileException("Unable to watch \"%s\": the inotify watch limit was reached" % path) from None
+            raise OSError(error, os.strerror(error), path)
+
+        return wd
+
+    def read(self, timeout):
+        """
+        Wait for events and read every event queued
+        :param timeout: Seconds to wait for events
+        :return: List of (watch descriptor, mask, name) tuples
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+
+        if not readable:
+            return []
+
+        events = []
+
+        while True:
+            try:
+                data = os.read(self.fd, 1048576)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+
+    def __init__(self, path, seconds_since_updated=0, rescan_interval=600, poll_interval=1.0):
+        """
+        Walk path once and then follow new and rewritten files with inotify, releasing each file once
+        it hasn't been written to for seconds_since_updated. If inotify isn't available, its event
+        queue overflows or the watch limit is reached, the tree is rescanned for files changed since
+        the previous scan instead. The files found by a walk are passed on as it finds them; only
+        those still being written to are held until they are quiet.
+        :param path: Path to the files
+        :param seconds_since_updated: Number of seconds since the file was updated. Default is 0.
+        :param rescan_interval: Seconds between rescans when inotify can't be used. Default is 600.
+        :param poll_interval: Maximum seconds to wait for events before checking the pending files.
+                              Default is 1.0.
+        """
+        self.path = path
+        self.seconds_since_updated = swiftarchive.files.parse_seconds_since_updated(seconds_since_updated)
+        self.rescan_interval = float(rescan_interval)
+        self.poll_interval = float(poll_interval)
+
+        # Watch descriptor -> directory path
+        self.directories = {}
+        # File path -> time it was last written to, for the files not yet quiet
+        self.pending = {}
+
+        # The first scan takes every file; later scans only the files changed since the scan before
+        self.scanned = None
+        self.next_rescan = 0.0
+
+        try:
+            self.inotify = Inotify()
+        except LocalFileException as ex:
+            logger.info("%s, rescanning every %s seconds", ex, self.rescan_interval)
+            self.inotify = None
+
+    def batches(self):
+        """
+        :return: Generator yielding an iterable of FileRecords each time files have been quiet long enough
+        """
+        while True:
+            if time.time() >= self.next_rescan:
+                scanned = self.rescan()
+                first = next(scanned, None)
+                if first is not None:
+                    yield itertools.chain([first], scanned)
+
+            self.read_events(self.poll_interval)
+
+            ready = self.ready()
+            if ready:
+                yield ready
+
+    def rescan(self):
+        """
+        Walk the whole tree, watching every directory. The files changed since the previous scan are
+        yielded as they are found, or added to the pending files if they aren't quiet yet.
+        :return: Generator yielding a FileRecord for each file that is ready
+        """
+        started = time.time()
+        logger.debug("scanning %s", self.path)
+
+        for record in self.walk(self.path, changed_since=self.scanned):
+            if time.time() - record.mtime > self.seconds_since_updated:
+                self.pending.pop(record.path, None)
+                yield record
+            else:
+                self.pending[record.path] = max(self.pending.get(record.path, 0), record.mtime)
+
+        # Files are compared against the start of the walk so nothing written during it is missed
+        self.scanned = started
+        self.next_rescan = started + self.rescan_interval if self.inotify is None else float("inf")
+
+    def walk(self, path, changed_since=None):
+        """
+        Walk a tree like swiftarchive.files.scan_files, watching each directory before it is listed
+        :param path: Path to the directory to walk
+        :param changed_since: Only yield files whose inode changed after this unix time, see
+                              swiftarchive.files.scan_directory. Default is None (every file).
+        :return: Generator yielding a FileRecord for each file
+        """
+        directories = [path]
+
+        while directories:
+            directory = directories.pop()
+            subdirectories = []
+
+            # Watch the directory before listing it so no file created in between is missed
+            self.watch(directory)
+
+            for record in swiftarchive.files.scan_directory(directory, float("-inf"), subdirectories, changed_since):
+                yield record
+
+            directories.extend(subdirectories)
+
+    def watch(self, directory):
+        """
+        :param directory: Path to the directory to watch
+        """
+        if self.inotify is None:
+            return
+
+        try:
+            self.directories[self.inotify.add_watch(directory)] = directory
+        except LocalFileException as ex:
+            logger.info("%s, rescanning every %s seconds", ex, self.rescan_interval)
+            self.stop_inotify()
+        except OSError as ex:
+            # The directory was removed before it could be watched
+            logger.debug("unable to watch %s: %s", directory, ex.strerror)
+
+    def stop_inotify(self):
+        """
+        Fall back to periodic rescans
+        """
+        self.inotify.close()
+        self.inotify = None
+        self.directories = {}
+        self.next_rescan = time.time()
+
+    def read_events(self, timeout):
+        """
+        Wait up to timeout seconds for inotify events and mark the files they refer to as written
+        :param timeout: Seconds to wait for events
+        """
+        if self.inotify is None:
+            time.sleep(timeout)
+            return
+
+        now = time.time()
+
+        for wd, mask, name in self.inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so find the files they referred to with a rescan
+                logger.info("inotify event queue overflowed, rescanning %s", self.path)
+                self.next_rescan = 0.0
+                continue
+
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have been written to the new directory before it was watched
+                    for record in self.walk(path):
+                        self.pending[record.path] = max(self.pending.get(record.path, 0), record.mtime)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE):
+                self.pending[path] = now
+
+        # Unless events were dropped, every file written before the whole queue was read has been seen, so a
+        # rescan after a later overflow only has to look for the files written since
+        if self.scanned is not None and self.next_rescan == float("inf"):
+            self.scanned = max(self.scanned, now)
+
+    def ready(self):
+        """
+        :return: List of FileRecords for the pending files that are older than seconds_since_updated
+        """
+        now = time.time()
+        ready = []
+
+        for path, written in list(self.pending.items()):
+            if now - written <= self.seconds_since_updated:
+                continue
+
+            try:
+                file_stat = os.lstat(path)
+            except OSError:
+                # Removed or renamed since it was written; a rename is seen as a new file
+                del self.pending[path]
+                continue
+
+            if not stat.S_ISREG(file_stat.st_mode):
+                del self.pending[path]
+            elif now - file_stat.st_mtime > self.seconds_since_updated:
+                del self.pending[path]
+                ready.append(swiftarchive.files.FileRecord(path, file_stat.st_size, file_stat.st_mtime,
+                                                           file_stat.st_ino))
+            else:
+                self.pending[path] = file_stat.st_mtime
+
+        return ready
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -2,6 +2,7 @@
 
 import unittest
 import swiftarchive.arguments as arguments
+from mock import patch
 
 
 class ArgumentsTestCase(unittest.TestCase):
@@ -12,3 +13,39 @@ class ArgumentsTestCase(unittest.TestCase):
     def test_parse_arguments(self):
         args = arguments.parse_arguments(["--debug"])
         self.assertTrue(args.debug)
+
+    def test_parse_arguments_workers(self):
+        args = arguments.parse_arguments([])
+        self.assertEqual(args.workers, 4)
+        self.assertEqual(args.queue_size, 1000)
+        self.assertEqual(args.scan_workers, 1)
+
+        args = arguments.parse_arguments(["--workers", "16", "--queue-size", "10", "--scan-workers", "8"])
+        self.assertEqual(args.workers, 16)
+        self.assertEqual(args.scan_workers, 8)
+        self.assertEqual(args.queue_size, 10)
+
+    def test_parse_arguments_plan(self):
+        self.assertFalse(arguments.parse_arguments([]).plan)
+        self.assertTrue(arguments.parse_arguments(["--plan"]).plan)
+
+        with patch.dict("os.environ", {"ARCHIVE_PLAN": "1"}):
+            self.assertTrue(arguments.parse_arguments([]).plan)
+
+    def test_parse_restore_arguments(self):
+        args = arguments.parse_restore_arguments(["--debug", "--restore-path", "/restore", "--prefix", "a/"])
+        self.assertTrue(args.debug)
+        self.assertEqual(args.restore_path, "/restore")
+        self.assertEqual(args.prefix, "a/")
+        self.assertEqual(args.workers, 4)
+        self.assertFalse(args.packs)
+
+        #
+        # Test the restore options are read from their own environment variables, not those of swift-archive
+        #
+        with patch.dict("os.environ", {"WORKERS": "16", "RESTORE_WORKERS": "8", "RESTORE_PREFIX": "b/",
+                                       "RESTORE_PACKS": "1"}):
+            args = arguments.parse_restore_arguments([])
+        self.assertEqual(args.workers, 8)
+        self.assertEqual(args.prefix, "b/")
+        self.assertTrue(args.packs)
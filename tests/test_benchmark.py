@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+import swiftarchive.restore
+
+from benchmarks.benchmark import generate_tree, parse_distribution, run_benchmark
+from benchmarks.fake_swift import FakeSwiftServer
+from benchmarks.startup import import_times, measure_startup
+from swiftarchive.pipeline import Pipeline
+from swiftarchive.swift import Swift
+from swiftarchive.files import scan_files
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_generate_tree(self):
+        total = generate_tree(self.directory, 25, "uniform:0:100", files_per_directory=10)
+
+        paths = [record.path for record in scan_files(self.directory)]
+        self.assertEqual(len(paths), 25)
+        self.assertEqual(sum(os.path.getsize(path) for path in paths), total)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["0000", "0001", "0002"])
+
+        with self.assertRaises(ValueError):
+            parse_distribution("normal:1")
+
+    def test_run_benchmark(self):
+        #
+        # Test shell.main archives every file to the fake Swift server and the run is timed
+        #
+        result = run_benchmark(files=50, distribution="fixed:1000",
+                               archive_args=["--bulk-threshold", "500", "--workers", "2"])
+
+        self.assertEqual(result["files"], 50)
+        self.assertEqual(result["bytes"], 50000)
+        self.assertGreater(result["files_per_second"], 0)
+        self.assertEqual(result["phases"]["upload"]["calls"], 50)
+        self.assertGreater(result["phases"]["auth"]["calls"], 0)
+
+        #
+        # Test the files are hashed while they are uploaded
+        #
+        result = run_benchmark(files=5, distribution="fixed:1000")
+
+        self.assertGreater(result["phases"]["hash"]["calls"], 0)
+
+    def test_startup(self):
+        self.assertEqual(import_times("import time: self [us] | cumulative | imported package\n"
+                                      "import time:       220 |        362 |   swiftarchive\n"),
+                         {"swiftarchive": (220, 362)})
+
+        #
+        # Test a run with nothing to archive exits without importing keystoneauth1, swiftclient or requests
+        #
+        result = measure_startup(runs=1)
+
+        self.assertIn("swiftarchive.shell", result["modules"])
+        self.assertIn("swiftarchive.files", result["modules"])
+        self.assertNotIn("swiftarchive.swift", result["modules"])
+        self.assertEqual(result["heavy_modules"], [])
+        self.assertGreater(result["import_us"], 0)
+
+    def test_archive_restore(self):
+        archive_path = os.path.join(self.directory, "archive") + "/"
+        restore_path = os.path.join(self.directory, "restore")
+        generate_tree(archive_path, 12, "uniform:0:5000", files_per_directory=5)
+
+        #
+        # Test files archived as single objects, Static Large Objects and packs are restored unchanged
+        #
+        with FakeSwiftServer() as server:
+            swift = Swift("username", "password", "project", server.auth_url, segment_size=1024,
+                          segment_threshold=3000)
+            pipeline = Pipeline(swift, "container", archive_path, pack_threshold=1000, pack_size=4096)
+            self.assertEqual(pipeline.run(scan_files(archive_path)), 12)
+
+            swiftarchive.restore.restore(swift, "container", restore_path, packs=True, workers=2)
+            swift.close()
+
+        for record in scan_files(archive_path):
+            with open(record.path, "rb") as original, \
+                    open(os.path.join(restore_path, record.path[len(archive_path):]), "rb") as restored:
+                self.assertEqual(hashlib.md5(original.read()).hexdigest(), hashlib.md5(restored.read()).hexdigest())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import io
+import os
+import gzip
+import hashlib
+import unittest
+import swiftarchive.compress
+import swiftarchive.exceptions
+
+from swiftarchive.compress import CompressingReader, DecompressingWriter
+
+
+class CompressTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.text = b"".join(b"2019-01-01 00:00:%02d INFO request %d completed\n" % (i % 60, i) for i in range(20000))
+
+    def test_compressible(self):
+        #
+        # Test text compresses well and random or already compressed data doesn't
+        #
+        self.assertTrue(swiftarchive.compress.compressible(self.text[:65536], "gzip"))
+        self.assertFalse(swiftarchive.compress.compressible(os.urandom(65536), "gzip"))
+        self.assertFalse(swiftarchive.compress.compressible(gzip.compress(self.text)[:65536], "gzip"))
+        self.assertFalse(swiftarchive.compress.compressible(b"\x89PNG" + self.text[:65536], "gzip"))
+        self.assertFalse(swiftarchive.compress.compressible(b"", "gzip"))
+
+    def test_check_codec(self):
+        self.assertEqual(swiftarchive.compress.check_codec("gzip"), "gzip")
+
+        #
+        # Test exception is raised for an unknown codec
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            swiftarchive.compress.check_codec("lzma")
+
+        the_exception = lfe.exception
+        self.assertEqual(str(the_exception), "Unknown compression codec: lzma")
+
+    def test_compress_round_trip(self):
+        for codec in swiftarchive.compress.available_codecs():
+            #
+            # Test the compressed stream decompresses to the original bytes and both are hashed
+            #
+            reader = CompressingReader(io.BytesIO(self.text), codec, chunk_size=4096)
+            compressed = b""
+            while True:
+                chunk = reader.read(1000)
+                if not chunk:
+                    break
+                compressed += chunk
+
+            self.assertLess(len(compressed), len(self.text) / 5)
+            self.assertEqual(reader.size, len(compressed))
+            self.assertEqual(reader.hexdigest(), hashlib.md5(compressed).hexdigest())
+            self.assertEqual(reader.original_hexdigest(), hashlib.md5(self.text).hexdigest())
+            self.assertEqual(reader.original_size, len(self.text))
+
+            #
+            # Test reset rewinds the stream and restarts the compression and hashes
+            #
+            reader.reset()
+            self.assertEqual(reader.read(), compressed)
+            self.assertEqual(reader.hexdigest(), hashlib.md5(compressed).hexdigest())
+
+            output = io.BytesIO()
+            writer = DecompressingWriter(output, codec)
+            for position in range(0, len(compressed), 777):
+                writer.write(compressed[position:position + 777])
+            writer.flush()
+
+            self.assertEqual(output.getvalue(), self.text)
+
+        #
+        # Test gzip objects can be read with the gzip module
+        #
+        self.assertEqual(gzip.decompress(CompressingReader(io.BytesIO(self.text), "gzip").read()), self.text)
+
+    def test_decompress_exception(self):
+        #
+        # Test exception is raised for corrupt compressed data
+        #
+        writer = DecompressingWriter(io.BytesIO(), "gzip")
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            writer.write(b"not compressed")
+
+        the_exception = lfe.exception
+        self.assertRegex(str(the_exception), "^Unable to decompress: ")
+
+
+if __name__ == '__main__':
+    unittest.main()
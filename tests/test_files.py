@@ -1,123 +1,196 @@
 #!/usr/bin/env python
 
+import io
 import os
 import time
 import errno
+import shutil
+import hashlib
+import tempfile
 import unittest
-from mock import patch
+from mock import MagicMock, patch
 import swiftarchive.exceptions
 import swiftarchive.files
 
 
-def side_effect_islink(file_path):
-    if file_path == "/tmp/symlink":
-        return True
-    else:
-        return False
-
-
 class FilesTestCase(unittest.TestCase):
 
     def setUp(self):
         pass
 
-    @patch('swiftarchive.files.check_modified_time')
-    @patch('os.path.islink')
-    @patch('os.walk')
-    def test_get_files(self, mock_walk, mock_islink, mock_modified):
-        #
-        # Test get_files when check_modified_time is always True
-        #
-        mock_modified.return_value = True
+    def create_tree(self):
+        """
+        Create a temporary directory tree with old files, a new file, an empty directory and symlinks
+        :return: Path to the tree
+        """
+        tree = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tree)
+
+        os.makedirs(os.path.join(tree, "backup", "empty"))
+
+        for name in ['20190101-00.gz', '20190101-01.gz', 'a.txt', 'backup/20190101-00.gz', 'backup/20190101-01.gz']:
+            with open(os.path.join(tree, name), "wb") as local:
+                local.write(name.encode())
+            os.utime(os.path.join(tree, name), (time.time() - 600, time.time() - 600))
 
-        mock_walk.return_value = [
-            ('/tmp', ('backup',), ('20190101-00.gz', '20190101-01.gz', '20190101-02.gz', 'a.txt', 'b.txt', 'symlink')),
-            ('/tmp/backup', (), ('20190101-00.gz', '20190101-01.gz', '20190101-02.gz')),
-        ]
+        with open(os.path.join(tree, "new.txt"), "wb") as local:
+            local.write(b"new")
 
-        mock_islink.side_effect = side_effect_islink
+        os.symlink(os.path.join(tree, "a.txt"), os.path.join(tree, "symlink"))
+        os.symlink(os.path.join(tree, "backup"), os.path.join(tree, "symlink_dir"))
 
-        tmp = swiftarchive.files.get_files("/tmp/")
+        return tree
 
-        self.assertEqual(tmp, [
-            '/tmp/20190101-00.gz',
-            '/tmp/20190101-01.gz',
-            '/tmp/20190101-02.gz',
-            '/tmp/a.txt',
-            '/tmp/b.txt',
-            '/tmp/backup/20190101-00.gz',
-            '/tmp/backup/20190101-01.gz',
-            '/tmp/backup/20190101-02.gz'
+    def test_scan_files(self):
+        tree = self.create_tree()
+
+        tmp = swiftarchive.files.scan_files(tree, 300)
+
+        # Files are yielded lazily as the scan progresses
+        record = next(tmp)
+        self.assertIsInstance(record, swiftarchive.files.FileRecord)
+        self.assertEqual(record.size, os.path.getsize(record.path))
+        self.assertEqual(record.mtime, os.path.getmtime(record.path))
+        self.assertEqual(record.inode, os.stat(record.path).st_ino)
+
+        records = [record] + list(tmp)
+        self.assertEqual(sorted(r.path[len(tree):] for r in records), [
+            '/20190101-00.gz',
+            '/20190101-01.gz',
+            '/a.txt',
+            '/backup/20190101-00.gz',
+            '/backup/20190101-01.gz',
         ])
 
         #
-        # Test get_files when check_modified_time is always False
+        # Test every file except symlinks is found when seconds_since_updated is 0
         #
-        mock_modified.return_value = False
+        self.assertEqual(sorted(r.path for r in swiftarchive.files.scan_files(tree + "/")), [
+            tree + '/20190101-00.gz',
+            tree + '/20190101-01.gz',
+            tree + '/a.txt',
+            tree + '/backup/20190101-00.gz',
+            tree + '/backup/20190101-01.gz',
+            tree + '/new.txt',
+        ])
 
-        tmp = swiftarchive.files.get_files("/tmp/")
+        #
+        # Test no file is found when every file was modified less than 3600 seconds ago
+        #
+        self.assertEqual(list(swiftarchive.files.scan_files(tree + "/", 3600)), [])
 
-        self.assertEqual(tmp, [])
+        #
+        # Test a directory that can't be listed is skipped
+        #
+        self.assertEqual(list(swiftarchive.files.scan_files(os.path.join(tree, "missing"))), [])
 
-    @patch('os.path.getmtime')
-    def test_check_modified_time(self, mock_mtime):
         #
-        # Test a file modified 600 seconds ago returns True when seconds_since_updated is 300
+        # Test a string seconds_since_updated value raises LocalFileException (failing test)
         #
-        mock_mtime.return_value = time.time() - 600
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            list(swiftarchive.files.scan_files(tree, "string"))
 
-        self.assertEqual(swiftarchive.files.check_modified_time("old_file", 300), True)
+        the_exception = lfe.exception
+        self.assertEqual(str(the_exception), "Invalid seconds_since_updated: string")
+
+    def test_scan_files_parallel(self):
+        tree = self.create_tree()
+
+        # Add a wide and deep set of directories so the workers have work to steal
+        for i in range(20):
+            directory = os.path.join(tree, "wide", str(i), "deep", "deeper")
+            os.makedirs(directory)
+            with open(os.path.join(directory, "file.txt"), "wb") as local:
+                local.write(b"file")
+            os.utime(os.path.join(directory, "file.txt"), (time.time() - 600, time.time() - 600))
 
         #
-        # Test a file modified 10 seconds ago returns False when seconds_since_updated is 300
+        # Test the merged stream matches the sequential scan
         #
-        mock_mtime.return_value = time.time() - 10
+        for workers in [1, 4]:
+            parallel = swiftarchive.files.scan_files_parallel(tree, 300, workers=workers, queue_size=2)
+            sequential = swiftarchive.files.scan_files(tree, 300)
 
-        self.assertEqual(swiftarchive.files.check_modified_time("new_file", 300), False)
+            self.assertEqual(sorted(parallel), sorted(sequential))
+
+        #
+        # Test the consumer can stop before the walk is finished
+        #
+        parallel = swiftarchive.files.scan_files_parallel(tree, workers=4, queue_size=1)
+        self.assertIsInstance(next(parallel), swiftarchive.files.FileRecord)
+        parallel.close()
+
+        #
+        # Test a missing path yields nothing
+        #
+        self.assertEqual(list(swiftarchive.files.scan_files_parallel(os.path.join(tree, "missing"))), [])
+
+        #
+        # Test a string seconds_since_updated value raises LocalFileException (failing test)
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            swiftarchive.files.scan_files_parallel(tree, "string")
+
+        the_exception = lfe.exception
+        self.assertEqual(str(the_exception), "Invalid seconds_since_updated: string")
+
+    @patch('os.scandir')
+    def test_scan_files_stat_error(self, mock_scandir):
+        entry = MagicMock()
+        entry.path = "/tmp/stat_error"
+        entry.is_symlink.return_value = False
+        entry.is_dir.return_value = False
+        mock_scandir.return_value.__iter__.return_value = [entry]
 
         #
         # Test FileNotFoundError raises LocalFileException (failing test)
         #
-        mock_mtime.side_effect = OSError(errno.ENOENT, os.strerror(errno.ENOENT), "missing_file")
+        entry.stat.side_effect = OSError(errno.ENOENT, os.strerror(errno.ENOENT), "stat_error")
 
         with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
-            swiftarchive.files.check_modified_time("missing_file", 300)
+            list(swiftarchive.files.scan_files("/tmp"))
 
         the_exception = lfe.exception
-        self.assertEqual(str(the_exception), "File \"missing_file\" could not be found")
+        self.assertEqual(str(the_exception), "File \"/tmp/stat_error\" could not be found")
 
         #
         # Test PermissionError raises LocalFileException (failing test)
         #
-        mock_mtime.side_effect = OSError(errno.EACCES, os.strerror(errno.EACCES), "permission_file")
+        entry.stat.side_effect = OSError(errno.EACCES, os.strerror(errno.EACCES), "stat_error")
 
         with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
-            swiftarchive.files.check_modified_time("permission_file", 300)
+            list(swiftarchive.files.scan_files("/tmp"))
 
         the_exception = lfe.exception
-        self.assertEqual(str(the_exception), "Permission error with \"permission_file\"")
+        self.assertEqual(str(the_exception), "Permission error with \"/tmp/stat_error\"")
 
         #
         # Test Input/Output Error raises Unknown LocalFileException (failing test)
         #
-        mock_mtime.side_effect = OSError(errno.EIO, os.strerror(errno.EIO), "io_error")
+        entry.stat.side_effect = OSError(errno.EIO, os.strerror(errno.EIO), "stat_error")
 
         with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
-            swiftarchive.files.check_modified_time("io_error", 300)
+            list(swiftarchive.files.scan_files("/tmp"))
 
         the_exception = lfe.exception
-        self.assertEqual(str(the_exception), "Unknown error with \"io_error\": Input/output error")
+        self.assertEqual(str(the_exception), "Unknown error with \"/tmp/stat_error\": Input/output error")
 
         #
-        # Test a string seconds_since_updated value raises LocalFileException (failing test)
+        # Test a worker exception is raised by the parallel scan (failing test)
         #
-        mock_mtime.side_effect = None
-
         with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
-            swiftarchive.files.check_modified_time("string_seconds_since_updated", "string")
+            list(swiftarchive.files.scan_files_parallel("/tmp", workers=2))
 
         the_exception = lfe.exception
-        self.assertEqual(str(the_exception), "Invalid seconds_since_updated: string")
+        self.assertEqual(str(the_exception), "Unknown error with \"/tmp/stat_error\": Input/output error")
+
+    def test_object_name(self):
+        #
+        # Test the archive path is removed from the start of the object name, with or without a trailing slash
+        #
+        self.assertEqual(swiftarchive.files.object_name("/archive/dir/file.txt", "/archive/"), "dir/file.txt")
+        self.assertEqual(swiftarchive.files.object_name("/archive/dir/file.txt", "/archive"), "/dir/file.txt")
+        self.assertEqual(swiftarchive.files.object_name("dir/file.txt"), "dir/file.txt")
 
     def test_md5_hash(self):
         # Test the md5 hash calculation on an actual file
@@ -127,6 +200,60 @@ class FilesTestCase(unittest.TestCase):
 
         self.assertEqual(calculated_md5_hash, computed_md5_hash)
 
+        # Test the md5 hash calculation on part of an actual file
+        with open("./tests/test_files/md5_check", "rb") as local:
+            data = local.read()
+
+        self.assertEqual(swiftarchive.files.md5("./tests/test_files/md5_check", 3, 5),
+                         hashlib.md5(data[3:8]).hexdigest())
+        self.assertEqual(swiftarchive.files.md5("./tests/test_files/md5_check", 3),
+                         hashlib.md5(data[3:]).hexdigest())
+
+    def test_md5_hash_buffers(self):
+        data = os.urandom(300000)
+        local = tempfile.NamedTemporaryFile(delete=False)
+        local.write(data)
+        local.close()
+        self.addCleanup(os.remove, local.name)
+
+        # Test reading into a small buffer and hashing from a memory map give the same md5 hash
+        for mmap_threshold in (0, 1):
+            for offset, length in ((0, None), (5000, 100000), (4096, 0), (299999, 10), (400000, None)):
+                expected = hashlib.md5(data[offset:None if length is None else offset + length]).hexdigest()
+                self.assertEqual(swiftarchive.files.md5(local.name, offset, length, buffer_size=1000,
+                                                        mmap_threshold=mmap_threshold), expected)
+
+    def test_hashing_reader(self):
+        # Test the md5 hash calculated while reading matches swiftarchive.files.md5
+        with open("./tests/test_files/md5_check", "rb") as local:
+            reader = swiftarchive.files.HashingReader(local)
+            while reader.read(7):
+                pass
+
+            self.assertEqual(reader.hexdigest(), "0d8591aa95f4d56cd91d58d92a700a18")
+
+            # Test reset rewinds the file and restarts the hash
+            reader.reset()
+            self.assertEqual(reader.hexdigest(), "d41d8cd98f00b204e9800998ecf8427e")
+
+            reader.read()
+            self.assertEqual(reader.hexdigest(), "0d8591aa95f4d56cd91d58d92a700a18")
+
+    def test_hashing_writer(self):
+        data = b"0123456789"
+        stream = io.BytesIO()
+
+        # Test the md5 hash calculated while writing and the md5 hash of the 4 byte segments
+        writer = swiftarchive.files.HashingWriter(stream, segment_size=4)
+        for i in range(0, len(data), 3):
+            self.assertEqual(writer.write(data[i:i + 3]), len(data[i:i + 3]))
+
+        segment_md5s = [hashlib.md5(data[i:i + 4]).hexdigest() for i in range(0, 10, 4)]
+
+        self.assertEqual(stream.getvalue(), data)
+        self.assertEqual(writer.hexdigest(), hashlib.md5(data).hexdigest())
+        self.assertEqual(writer.slo_hexdigest(), hashlib.md5("".join(segment_md5s).encode()).hexdigest())
+
     @patch('swiftarchive.files.open', create=True)
     def test_md5_hash_mock(self, mock_open):
         mock_open.mock_open(read_data=b'aaa')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import swiftarchive.exceptions
+
+from swiftarchive.files import FileRecord
+from swiftarchive.index import StateIndex, DedupIndex, SpillTable
+
+
+class IndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.db_path = os.path.join(self.directory, "state.db")
+
+    def test_state_index(self):
+        record = FileRecord('/tmp/a.txt', 100, 1546300800.5, 1234)
+
+        index = StateIndex(self.db_path, commit_interval=1)
+
+        #
+        # Test a file that has never been uploaded is changed
+        #
+        self.assertFalse(index.unchanged("container", record))
+
+        #
+        # Test an uploaded file is unchanged until its size, mtime or inode change
+        #
+        index.update("container", record, "abcdefghijklmnopqrstuvwxyz123456")
+
+        self.assertTrue(index.unchanged("container", record))
+        self.assertFalse(index.unchanged("container", record._replace(size=101)))
+        self.assertFalse(index.unchanged("container", record._replace(mtime=1546300801.5)))
+        self.assertFalse(index.unchanged("container", record._replace(inode=4321)))
+
+        #
+        # Test the file is only unchanged in the container it was uploaded to
+        #
+        self.assertFalse(index.unchanged("container2", record))
+
+        index.close()
+
+        #
+        # Test the index persists across runs, including uncommitted updates flushed by close
+        #
+        index = StateIndex(self.db_path)
+        index.update("container", record._replace(path='/tmp/b.txt'), "abcdefghijklmnopqrstuvwxyz123456")
+        index.close()
+
+        index = StateIndex(self.db_path)
+        self.assertTrue(index.unchanged("container", record))
+        self.assertTrue(index.unchanged("container", record._replace(path='/tmp/b.txt')))
+        index.close()
+
+    def test_state_index_exception(self):
+        #
+        # Test a database that can't be opened raises LocalFileException (failing test)
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            StateIndex(os.path.join(self.directory, "missing", "state.db"))
+
+        self.assertRegex(str(lfe.exception), "^Unable to open state index")
+
+    def test_dedup_index(self):
+        index = DedupIndex(self.db_path, commit_interval=1)
+
+        #
+        # Test a file is only found by the size and md5 hash of an uploaded file
+        #
+        self.assertIsNone(index.lookup(100, "abcdefghijklmnopqrstuvwxyz123456"))
+
+        index.add("container", "a.txt", 100, "abcdefghijklmnopqrstuvwxyz123456")
+
+        self.assertEqual(index.lookup(100, "abcdefghijklmnopqrstuvwxyz123456"), ("container", "a.txt"))
+        self.assertIsNone(index.lookup(101, "abcdefghijklmnopqrstuvwxyz123456"))
+        self.assertIsNone(index.lookup(100, "123456abcdefghijklmnopqrstuvwxyz"))
+
+        #
+        # Test the index persists across runs and a removed object is forgotten
+        #
+        index.close()
+        index = DedupIndex(self.db_path)
+
+        self.assertEqual(index.lookup(100, "abcdefghijklmnopqrstuvwxyz123456"), ("container", "a.txt"))
+
+        index.remove(100, "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertIsNone(index.lookup(100, "abcdefghijklmnopqrstuvwxyz123456"))
+        index.close()
+
+        #
+        # Test a database that can't be opened raises LocalFileException (failing test)
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            DedupIndex(os.path.join(self.directory, "missing", "dedup.db"))
+
+        self.assertRegex(str(lfe.exception), "^Unable to open dedup index")
+
+    def test_spill_table(self):
+        table = SpillTable(2, max_entries=2, directory=self.directory)
+
+        #
+        # Test entries are kept in memory up to max_entries
+        #
+        table.set("a", (1, b"\x01"))
+        table.set("b", (2.5, None))
+        table.set("a", (3, b"\x03"))
+
+        self.assertEqual(len(table), 2)
+        self.assertIsNone(table.db)
+        self.assertEqual(table.get("a"), (3, b"\x03"))
+        self.assertIsNone(table.get("c"))
+
+        #
+        # Test the entries are moved to a temporary database once there are more than max_entries
+        #
+        table.set("c", ("three", b"\x03"))
+
+        self.assertEqual(table.entries, {})
+        self.assertTrue(os.path.exists(table.db_path))
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.get("a"), (3, b"\x03"))
+        self.assertEqual(table.get("b"), (2.5, None))
+        self.assertEqual(table.get("c"), ("three", b"\x03"))
+
+        table.set("b", (4, b"\x04"))
+        table.delete("a")
+        table.delete("missing")
+
+        self.assertIsNone(table.get("a"))
+        self.assertEqual(sorted(table.items()), [("b", (4, b"\x04")), ("c", ("three", b"\x03"))])
+
+        #
+        # Test closing the table removes the temporary database
+        #
+        db_path = table.db_path
+        table.close()
+
+        self.assertFalse(os.path.exists(db_path))
+        self.assertEqual(len(table), 0)
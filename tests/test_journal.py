@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import swiftarchive.exceptions
+
+from swiftarchive.files import FileRecord
+from swiftarchive.journal import RunJournal
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.journal_path = os.path.join(self.directory, "run.journal")
+
+    def read_states(self):
+        with open(self.journal_path) as journal:
+            return [json.loads(line)["state"] for line in journal]
+
+    def test_run_journal(self):
+        planned = FileRecord('/tmp/planned.txt', 1, 1546300800.5, 1)
+        uploaded = FileRecord('/tmp/uploaded.txt', 2, 1546300800.5, 2)
+        verified = FileRecord('/tmp/verified.txt', 3, 1546300800.5, 3)
+        deleted = FileRecord('/tmp/deleted.txt', 4, 1546300800.5, 4)
+
+        #
+        # Test a new journal has nothing to resume
+        #
+        journal = RunJournal(self.journal_path, "container", "/tmp/")
+        self.assertFalse(journal.resumed)
+
+        for record in (planned, uploaded, verified, deleted):
+            journal.planned(record)
+        for record in (uploaded, verified, deleted):
+            journal.uploaded(record, "abcdefghijklmnopqrstuvwxyz123456")
+        for record in (verified, deleted):
+            journal.verified(record, "abcdefghijklmnopqrstuvwxyz123456")
+        journal.deleted(deleted)
+
+        self.assertIsNone(journal.resume(uploaded))
+        journal.close()
+
+        # Simulate the run being killed while writing a line
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.write('{"state":"uplo')
+
+        #
+        # Test an interrupted run resumes the uploaded and verified files that haven't changed
+        #
+        journal = RunJournal(self.journal_path, "container", "/tmp/")
+        self.assertTrue(journal.resumed)
+
+        self.assertIsNone(journal.resume(planned))
+        self.assertEqual(journal.resume(uploaded), "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertEqual(journal.resume(verified), "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertIsNone(journal.resume(deleted))
+        self.assertIsNone(journal.resume(uploaded._replace(size=5)))
+        self.assertIsNone(journal.resume(uploaded._replace(mtime=1546300801.5)))
+        self.assertIsNone(journal.resume(uploaded._replace(inode=5)))
+
+        # Test the journal is compacted to the files that can be resumed
+        self.assertEqual(self.read_states(), ["started", "planned", "uploaded", "planned", "verified"])
+
+        journal.finish()
+        journal.close()
+
+        #
+        # Test a finished run is not resumed
+        #
+        journal = RunJournal(self.journal_path, "container", "/tmp/")
+        self.assertFalse(journal.resumed)
+        self.assertIsNone(journal.resume(uploaded))
+        self.assertEqual(self.read_states(), ["started"])
+
+        journal.uploaded(uploaded, "abcdefghijklmnopqrstuvwxyz123456")
+        journal.planned(uploaded)
+        journal.uploaded(uploaded, "abcdefghijklmnopqrstuvwxyz123456")
+        journal.close()
+
+        #
+        # Test a run of another container or archive path is not resumed
+        #
+        journal = RunJournal(self.journal_path, "container2", "/tmp/")
+        self.assertFalse(journal.resumed)
+        self.assertIsNone(journal.resume(uploaded))
+        journal.close()
+
+    def test_run_journal_spill(self):
+        records = [FileRecord('/tmp/%s.txt' % i, i, 1546300800.5, i) for i in range(10)]
+
+        journal = RunJournal(self.journal_path, "container", "/tmp/")
+        for record in records:
+            journal.planned(record)
+        for record in records[:6]:
+            journal.uploaded(record, "%032x" % record.size)
+        journal.deleted(records[0])
+        journal.close()
+
+        #
+        # Test an interrupted run with more files than max_entries is resumed from a spilled table
+        #
+        journal = RunJournal(self.journal_path, "container", "/tmp/", max_entries=2, spill_directory=self.directory)
+        self.assertTrue(journal.resumed)
+        self.assertEqual(len(journal.files), 5)
+
+        self.assertEqual(journal.resume(records[5]), "%032x" % 5)
+        self.assertIsNone(journal.resume(records[6]))
+        self.assertEqual(self.read_states(), ["started"] + ["planned", "uploaded"] * 5)
+        journal.close()
+
+        # Test the temporary databases are removed
+        self.assertEqual(os.listdir(self.directory), ["run.journal"])
+
+    def test_run_journal_exception(self):
+        #
+        # Test exception is raised when the journal can't be written
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            RunJournal(os.path.join(self.directory, "missing", "run.journal"), "container", "/tmp/")
+
+        the_exception = lfe.exception
+        self.assertRegex(str(the_exception), "^File \".*run.journal\" could not be found$")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+
+from swiftarchive.limiter import AdaptiveLimiter
+
+
+class LimiterTestCase(unittest.TestCase):
+
+    def test_increase(self):
+        limiter = AdaptiveLimiter(8)
+
+        #
+        # Test the limit grows by one per success during slow start, up to the maximum
+        #
+        for i in range(3):
+            limiter.success(0.1)
+
+        self.assertEqual(limiter.limit, 4.0)
+
+        for i in range(10):
+            limiter.success(0.1)
+
+        self.assertEqual(limiter.limit, 8.0)
+
+    def test_decrease(self):
+        limiter = AdaptiveLimiter(16, initial=16, cooldown=60)
+
+        #
+        # Test throttling halves the limit once per cooldown and ends slow start
+        #
+        limiter.throttled()
+        limiter.throttled()
+
+        self.assertEqual(limiter.limit, 8.0)
+        self.assertFalse(limiter.slow_start)
+
+        # Test the limit grows by about one per round of successes after slow start
+        for i in range(8):
+            limiter.success(0.1)
+
+        self.assertAlmostEqual(limiter.limit, 9.0, delta=0.1)
+
+        #
+        # Test a latency spike cuts the limit, with latency normalised to the upload size
+        #
+        limiter = AdaptiveLimiter(16, initial=16)
+
+        limiter.success(0.1)
+        limiter.success(10.0, length=1048576 * 199)
+
+        self.assertEqual(limiter.limit, 16.0)
+
+        limiter.success(1.0)
+
+        self.assertEqual(limiter.limit, 8.0)
+
+        #
+        # Test the limit never drops below the minimum
+        #
+        limiter = AdaptiveLimiter(16, minimum=2, initial=2, cooldown=0)
+        limiter.throttled()
+
+        self.assertEqual(limiter.limit, 2.0)
+
+    def test_slot(self):
+        limiter = AdaptiveLimiter(2, initial=2)
+        in_use = []
+        max_in_use = []
+        lock = threading.Lock()
+        release = threading.Event()
+
+        #
+        # Test no more than limit slots are held at the same time
+        #
+        def upload():
+            with limiter.slot():
+                with lock:
+                    in_use.append(1)
+                    max_in_use.append(len(in_use))
+                release.wait(1)
+                with lock:
+                    in_use.pop()
+
+        threads = [threading.Thread(target=upload) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(max(max_in_use), 2)
+        self.assertEqual(limiter.active, 0)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import unittest
+from mock import MagicMock
+
+from swiftarchive.listing import RemoteListing
+
+
+class ListingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_remote_listing(self):
+        swift = MagicMock()
+        swift.list_objects.return_value = iter([
+            {"name": "a.txt", "bytes": 100, "hash": "abcdefabcdefabcdefabcdefabcdef12"},
+            {"name": "backup/slo.gz", "bytes": 9000000000,
+             "hash": "fedcba0987654321fedcba0987654321; slo_etag=\"1234567890abcdef1234567890abcdef\""},
+            {"name": "backup/slo2.gz", "bytes": 9000000000, "hash": "fedcba0987654321fedcba0987654321",
+             "slo_etag": "\"abcdef1234567890abcdef1234567890\""},
+            {"name": "not_md5.txt", "bytes": 10, "hash": "not-an-md5"},
+            {"name": "backup/text.log", "bytes": 100, "hash": "00000000000000000000000000000000",
+             "content_type": "application/gzip; swift_archive_original_size=5000; "
+                             "swift_archive_original_md5=11111111111111111111111111111111"},
+            {"name": "backup/plain.txt", "bytes": 100, "hash": "22222222222222222222222222222222",
+             "content_type": "text/plain;charset=UTF-8"},
+        ])
+
+        listing = RemoteListing()
+
+        #
+        # Test loading a container listing
+        #
+        self.assertEqual(listing.load(swift, "container", prefix="backup/"), 6)
+        swift.list_objects.assert_called_once_with("container", prefix="backup/")
+        self.assertEqual(len(listing), 5)
+
+        #
+        # Test looking up an object with a matching name and size
+        #
+        self.assertEqual(listing.lookup("a.txt", 100), "abcdefabcdefabcdefabcdefabcdef12")
+        #
+        # Test a Static Large Object is looked up by its etag rather than the hash of its manifest
+        #
+        self.assertEqual(listing.lookup("backup/slo.gz", 9000000000), "1234567890abcdef1234567890abcdef")
+        self.assertEqual(listing.lookup("backup/slo2.gz", 9000000000), "abcdef1234567890abcdef1234567890")
+
+        #
+        # Test a compressed object is looked up by the size and md5 of the original file in its content type
+        #
+        self.assertEqual(listing.lookup("backup/text.log", 5000), "11111111111111111111111111111111")
+        self.assertIsNone(listing.lookup("backup/text.log", 100))
+        self.assertEqual(listing.lookup("backup/plain.txt", 100), "22222222222222222222222222222222")
+
+        #
+        # Test looking up a missing object or an object with a different size
+        #
+        self.assertIsNone(listing.lookup("b.txt", 100))
+        self.assertIsNone(listing.lookup("a.txt", 101))
+        self.assertIsNone(listing.lookup("not_md5.txt", 10))
+
+    def test_remote_listing_spill(self):
+        swift = MagicMock()
+        swift.list_objects.return_value = iter([{"name": "%s.txt" % i, "bytes": i, "hash": "%032x" % i}
+                                                for i in range(10)])
+
+        #
+        # Test a listing larger than max_entries is spilled to disk and can still be looked up
+        #
+        listing = RemoteListing(max_entries=4)
+
+        self.assertEqual(listing.load(swift, "container"), 10)
+        self.assertEqual(len(listing), 10)
+        self.assertIsNotNone(listing.objects.db)
+        self.assertEqual(listing.lookup("7.txt", 7), "%032x" % 7)
+        self.assertIsNone(listing.lookup("7.txt", 8))
+
+        listing.close()
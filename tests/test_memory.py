@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import unittest
+import swiftarchive.exceptions
+from mock import patch
+
+from swiftarchive.memory import MemoryLimit, buffer_size, rss, spill_entries
+
+
+class MemoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_rss(self):
+        self.assertGreater(rss(), 1048576)
+
+        #
+        # Test the peak resident set size is used without /proc
+        #
+        with patch('swiftarchive.memory.open', side_effect=OSError, create=True):
+            self.assertGreater(rss(), 1048576)
+
+    def test_budget(self):
+        #
+        # Test the spill tables get a quarter of the memory limit between them
+        #
+        self.assertEqual(spill_entries(4294967296), 1048576)
+        self.assertEqual(spill_entries(1048576), 1000)
+
+        #
+        # Test the buffers of the queues, bulk batches and packs
+        #
+        self.assertEqual(buffer_size(4, 1000), 1024000)
+        self.assertEqual(buffer_size(4, 1000, bulk_threshold=1024, bulk_size=1000000), 5024000)
+        self.assertEqual(buffer_size(4, 1000, pack_threshold=1024, pack_size=1000000), 5024000)
+        self.assertEqual(buffer_size(4, 1000, pack_threshold=1024), 1024000 + 4 * 67108864)
+
+    def test_memory_limit(self):
+        MemoryLimit(rss() * 100).check()
+
+        #
+        # Test exceeding the limit raises LocalFileException
+        #
+        memory_limit = MemoryLimit(1048576, interval=60)
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            memory_limit.check()
+
+        self.assertRegex(str(lfe.exception), "^Memory use of [0-9]+ bytes exceeds the limit of 1048576 bytes$")
+
+        #
+        # Test the memory use is read at most once per interval
+        #
+        with patch('swiftarchive.memory.rss') as mock_rss:
+            memory_limit.check()
+            mock_rss.assert_not_called()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import swiftarchive.exceptions
+
+from swiftarchive.metrics import Histogram, Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        # Test the buckets are cumulative and include their upper bound
+        self.assertEqual(histogram.snapshot(), {"buckets": [["0.1", 2], ["1.0", 3], ["+Inf", 4]],
+                                                "sum": 2.65, "count": 4})
+
+    def test_prometheus(self):
+        metrics = Metrics(labels={"container": "archive"})
+        metrics.inc("files_uploaded_total")
+        metrics.inc("bytes_uploaded_total", 1024)
+        metrics.observe("upload_seconds", 0.2)
+
+        with metrics.timer("hash_seconds"):
+            pass
+
+        text = metrics.prometheus()
+
+        self.assertIn("# TYPE swift_archive_files_uploaded_total counter\n", text)
+        self.assertIn('swift_archive_files_uploaded_total{container="archive"} 1\n', text)
+        self.assertIn('swift_archive_bytes_uploaded_total{container="archive"} 1024\n', text)
+        self.assertIn('swift_archive_retries_total{container="archive"} 0\n', text)
+        self.assertIn('swift_archive_upload_seconds_bucket{container="archive",le="0.25"} 1\n', text)
+        self.assertIn('swift_archive_upload_seconds_bucket{container="archive",le="0.1"} 0\n', text)
+        self.assertIn('swift_archive_upload_seconds_count{container="archive"} 1\n', text)
+        self.assertIn('swift_archive_hash_seconds_count{container="archive"} 1\n', text)
+        self.assertIn("# TYPE swift_archive_run_duration_seconds gauge\n", text)
+
+    def test_write(self):
+        textfile = os.path.join(self.directory, "swift_archive.prom")
+        json_file = os.path.join(self.directory, "swift_archive.json")
+
+        #
+        # Test the metrics are written periodically while running and when stopped
+        #
+        metrics = Metrics(textfile, json_file, interval=0.01)
+        metrics.inc("files_scanned_total", 3)
+        metrics.start()
+
+        for attempt in range(100):
+            if os.path.exists(textfile):
+                break
+            time.sleep(0.01)
+
+        self.assertTrue(os.path.exists(textfile))
+
+        metrics.stop(success=True)
+
+        with open(json_file) as local:
+            snapshot = json.load(local)
+
+        self.assertEqual(snapshot["counters"]["files_scanned_total"], 3)
+        self.assertGreater(snapshot["gauges"]["last_success_timestamp_seconds"], 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["swift_archive.json", "swift_archive.prom"])
+
+        last_success = snapshot["gauges"]["last_success_timestamp_seconds"]
+
+        #
+        # Test a failed run keeps the last success time of the previous run
+        #
+        metrics = Metrics(textfile, json_file)
+        metrics.stop(success=False)
+
+        with open(json_file) as local:
+            self.assertEqual(json.load(local)["gauges"]["last_success_timestamp_seconds"], last_success)
+
+        os.remove(json_file)
+        metrics = Metrics(textfile)
+        metrics.stop(success=False)
+
+        with open(textfile) as local:
+            self.assertIn("swift_archive_last_success_timestamp_seconds %r\n" % last_success, local.read())
+
+        #
+        # Test the last success time is 0 without the files of a previous run
+        #
+        metrics = Metrics(json_file=os.path.join(self.directory, "first.json"))
+        metrics.stop(success=False)
+
+        with open(os.path.join(self.directory, "first.json")) as local:
+            self.assertEqual(json.load(local)["gauges"]["last_success_timestamp_seconds"], 0)
+
+        #
+        # Test an unwritable path raises LocalFileException (failing test)
+        #
+        metrics = Metrics(textfile=os.path.join(self.directory, "missing", "swift_archive.prom"))
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as le:
+            metrics.write()
+
+        self.assertRegex(str(le.exception), "^File .* could not be found$")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+from mock import MagicMock
+import swiftarchive.exceptions
+import swiftarchive.pack
+
+from swiftarchive.files import FileRecord
+from swiftarchive.pack import PackWriter
+
+
+class FakeSwift:
+    """
+    Stand in for swiftarchive.swift.Swift that keeps the uploaded objects in a dict
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_stream(self, container, object_name, stream, length):
+        self.objects[object_name] = stream.read(length)
+        return hashlib.md5(self.objects[object_name]).hexdigest()
+
+    def get_object(self, container, object_name, offset=None, length=None):
+        if offset is None:
+            return self.objects[object_name]
+        return self.objects[object_name][offset:offset + length]
+
+    def list_objects(self, container, prefix=None):
+        return iter([{"name": name} for name in sorted(self.objects) if name.startswith(prefix)])
+
+
+class PackTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.records = []
+
+        for i in range(5):
+            path = os.path.join(self.directory, "%s.txt" % i)
+            with open(path, "wb") as local:
+                local.write(("file %s" % i).encode() * (i + 1))
+            self.records.append(FileRecord(path, os.path.getsize(path), 0, 0))
+
+    def test_pack_writer(self):
+        swift = FakeSwift()
+        pack = PackWriter(swift, "container", self.directory + "/", pack_size=30)
+
+        #
+        # Test files are added until the pack is full and then the pack and its index are uploaded
+        #
+        packed = []
+        for record in self.records:
+            packed.extend(pack.add(record))
+
+        packed.extend(pack.flush())
+
+        self.assertEqual([record for record, file_md5 in packed], self.records)
+
+        indexes = [name for name in swift.objects if name.endswith(".idx")]
+        # The files are 6, 12, 18, 24 and 30 bytes, so the first pack is full after 3 files
+        self.assertEqual(len(indexes), 2)
+        self.assertEqual(len(swift.objects), 4)
+
+        for index_name in indexes:
+            index = json.loads(swift.objects[index_name].decode())
+            self.assertEqual(index["etag"], hashlib.md5(swift.objects[index["pack"]]).hexdigest())
+            self.assertTrue(index["pack"].startswith("packs/"))
+
+        #
+        # Test every member can be found and read back with a range request
+        #
+        for record, file_md5 in packed:
+            with open(record.path, "rb") as local:
+                data = local.read()
+
+            pack_name, member = swiftarchive.pack.find_member(swift, "container", os.path.basename(record.path))
+
+            self.assertEqual(member["md5"], file_md5)
+            self.assertEqual(swiftarchive.pack.read_member(swift, "container", pack_name, member), data)
+
+        self.assertIsNone(swiftarchive.pack.find_member(swift, "container", "missing.txt"))
+
+        #
+        # Test flushing an empty pack uploads nothing
+        #
+        self.assertEqual(pack.flush(), [])
+        self.assertEqual(len(swift.objects), 4)
+
+    def test_pack_writer_exceptions(self):
+        swift = FakeSwift()
+        pack = PackWriter(swift, "container", self.directory + "/")
+
+        pack.add(self.records[0])
+
+        #
+        # Test a missing file raises LocalFileException and is left out of the pack (failing test)
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            pack.add(FileRecord(os.path.join(self.directory, "missing.txt"), 1, 0, 0))
+
+        the_exception = lfe.exception
+        missing = os.path.join(self.directory, "missing.txt")
+        self.assertEqual(str(the_exception), "File \"%s\" could not be found" % missing)
+
+        self.assertEqual(pack.flush(), [(self.records[0], hashlib.md5(b"file 0").hexdigest())])
+
+        #
+        # Test a member that does not match its md5 raises SwiftException (failing test)
+        #
+        swift = MagicMock()
+        swift.get_object.return_value = b"corrupt"
+
+        with self.assertRaises(swiftarchive.exceptions.SwiftException) as se:
+            swiftarchive.pack.read_member(swift, "container", "packs/1.pack",
+                                          {"name": "0.txt", "offset": 0, "length": 7, "md5": "0" * 32})
+
+        self.assertRegex(str(se.exception), "^md5 sum does not match for member \"0.txt\"")
+
+        #
+        # Test an invalid index raises SwiftException (failing test)
+        #
+        swift.get_object.return_value = b"not json"
+
+        with self.assertRaises(swiftarchive.exceptions.SwiftException) as se:
+            swiftarchive.pack.load_index(swift, "container", "packs/1.idx")
+
+        the_exception = se.exception
+        self.assertEqual(str(the_exception), "Invalid pack index \"packs/1.idx\"")
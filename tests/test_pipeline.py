@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+import unittest
+import concurrent.futures
+from mock import MagicMock, patch
+import swiftarchive.exceptions
+
+from swiftarchive.files import FileRecord
+from swiftarchive.pipeline import DONE, SCHEDULES, Pipeline, ScheduleQueue
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.swift = MagicMock()
+        self.swift.put_object.return_value = "abcdefghijklmnopqrstuvwxyz123456"
+
+    @patch('swiftarchive.files.delete')
+    def test_run(self, mock_delete):
+        files = [FileRecord('/tmp/%s.txt' % i, i, 0, 0) for i in range(50)]
+        paths = sorted(record.path for record in files)
+
+        #
+        # Test every file is uploaded and nothing is deleted
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=4, queue_size=2)
+
+        self.assertEqual(pipeline.run(iter(files)), 50)
+        self.assertEqual(self.swift.put_object.call_count, 50)
+        self.assertEqual(sorted(c[0][1] for c in self.swift.put_object.call_args_list), paths)
+        mock_delete.assert_not_called()
+
+        # Test the counters and timings of each stage are recorded
+        self.assertEqual(pipeline.metrics.counters["files_scanned_total"], 50)
+        self.assertEqual(pipeline.metrics.counters["files_uploaded_total"], 50)
+        self.assertEqual(pipeline.metrics.counters["bytes_uploaded_total"], sum(range(50)))
+        self.assertEqual(pipeline.metrics.histograms["scan_seconds"].count, 50)
+        self.assertEqual(pipeline.metrics.histograms["upload_seconds"].count, 50)
+
+        #
+        # Test every file is deleted once verified
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", delete=True, workers=4, queue_size=2)
+
+        self.assertEqual(pipeline.run(iter(files)), 50)
+        self.assertEqual(sorted(c[0][0] for c in mock_delete.call_args_list), paths)
+        self.assertEqual(pipeline.metrics.counters["deletes_total"], 50)
+
+        #
+        # Test an empty file list
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/")
+
+        self.assertEqual(pipeline.run(iter([])), 0)
+
+    def test_schedule(self):
+        files = [FileRecord('/tmp/a.txt', 10, 300, 0), FileRecord('/tmp/b.txt', 3000, 100, 0),
+                 FileRecord('/tmp/c.txt', 10, 200, 0), FileRecord('/tmp/d.txt', 200, 400, 0)]
+
+        def dispatched(schedule):
+            work_queue = ScheduleQueue(maxsize=10, key=SCHEDULES[schedule])
+            for record in files + [DONE]:
+                work_queue.put(record)
+            return [work_queue.get() for _ in range(len(files) + 1)]
+
+        #
+        # Test the queued files are handed out largest first, oldest first or in the order they were found,
+        # with files of the same size in the order they were found and DONE last
+        #
+        self.assertEqual(dispatched("largest"), [files[1], files[3], files[0], files[2], DONE])
+        self.assertEqual(dispatched("oldest"), [files[1], files[2], files[0], files[3], DONE])
+        self.assertEqual(dispatched("walk"), files + [DONE])
+
+        #
+        # Test every file is uploaded with each schedule
+        #
+        for schedule in SCHEDULES:
+            self.swift.put_object.reset_mock()
+            pipeline = Pipeline(self.swift, "container", "/tmp/", workers=2, queue_size=2, schedule=schedule)
+
+            self.assertEqual(pipeline.run(iter(files)), 4)
+            self.assertEqual(self.swift.put_object.call_count, 4)
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            Pipeline(self.swift, "container", "/tmp/", schedule="smallest")
+
+    def test_run_memory_limit(self):
+        files = [FileRecord('/tmp/%s.txt' % i, i, 0, 0) for i in range(10)]
+
+        #
+        # Test the memory limit is checked as files are scanned
+        #
+        memory_limit = MagicMock()
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=2, memory_limit=memory_limit)
+
+        self.assertEqual(pipeline.run(iter(files)), 10)
+        self.assertEqual(memory_limit.check.call_count, 10)
+
+        #
+        # Test exceeding the memory limit stops the run
+        #
+        memory_limit.check.side_effect = swiftarchive.exceptions.LocalFileException(
+            "Memory use of 2097152 bytes exceeds the limit of 1048576 bytes")
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=2, memory_limit=memory_limit)
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            pipeline.run(iter(files))
+
+    @patch('swiftarchive.files.delete')
+    def test_run_md5_mismatch(self, mock_delete):
+        self.swift.put_object.side_effect = swiftarchive.exceptions.SwiftException(
+            "md5 sum does not match for file \"/tmp/mock.txt\" file: 123456abcdefghijklmnopqrstuvwxyz "
+            "swift: abcdefghijklmnopqrstuvwxyz123456")
+
+        pipeline = Pipeline(self.swift, "container", "/tmp/", delete=True, workers=2)
+
+        with self.assertRaises(swiftarchive.exceptions.SwiftException) as se:
+            pipeline.run(iter([FileRecord('/tmp/mock.txt', 1, 0, 0)]))
+
+        the_exception = se.exception
+        self.assertEqual(str(the_exception), "md5 sum does not match for file \"/tmp/mock.txt\" file: "
+                                             "123456abcdefghijklmnopqrstuvwxyz swift: "
+                                             "abcdefghijklmnopqrstuvwxyz123456")
+        mock_delete.assert_not_called()
+
+    def test_run_scan_exception(self):
+        def files():
+            yield FileRecord('/tmp/a.txt', 1, 0, 0)
+            raise swiftarchive.exceptions.LocalFileException("File \"/tmp/b.txt\" could not be found")
+
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=2, queue_size=1)
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as lfe:
+            pipeline.run(files())
+
+        the_exception = lfe.exception
+        self.assertEqual(str(the_exception), "File \"/tmp/b.txt\" could not be found")
+
+    def test_run_index(self):
+        index = MagicMock()
+        index.unchanged.side_effect = lambda container, record: record.path == '/tmp/unchanged.txt'
+
+        files = [FileRecord('/tmp/unchanged.txt', 1, 0, 0), FileRecord('/tmp/changed.txt', 1, 0, 0)]
+
+        #
+        # Test unchanged files are skipped and uploaded files are recorded in the index
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", index=index)
+
+        self.assertEqual(pipeline.run(iter(files)), 1)
+        self.assertEqual(pipeline.skipped, 1)
+        self.swift.put_object.assert_called_once_with("container", '/tmp/changed.txt', "/tmp/")
+        index.update.assert_called_once_with("container", files[1], "abcdefghijklmnopqrstuvwxyz123456")
+
+    @patch('swiftarchive.files.delete')
+    def test_run_journal(self, mock_delete):
+        journal = MagicMock()
+        journal.resume.side_effect = lambda record: "123456abcdefghijklmnopqrstuvwxyz" \
+            if record.path == '/tmp/uploaded.txt' else None
+
+        files = [FileRecord('/tmp/uploaded.txt', 1, 0, 0), FileRecord('/tmp/new.txt', 1, 0, 0)]
+
+        #
+        # Test files uploaded by an interrupted run are deleted without being uploaded again
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", delete=True, journal=journal)
+
+        self.assertEqual(pipeline.run(iter(files)), 1)
+        self.assertEqual(pipeline.skipped, 1)
+        self.assertEqual(pipeline.metrics.counters["files_resumed_total"], 1)
+        self.swift.put_object.assert_called_once_with("container", '/tmp/new.txt', "/tmp/")
+        self.assertEqual(sorted(c[0][0] for c in mock_delete.call_args_list), ['/tmp/new.txt', '/tmp/uploaded.txt'])
+
+        # Test the progress of each file is journaled
+        journal.planned.assert_called_once_with(files[1])
+        journal.uploaded.assert_called_once_with(files[1], "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertEqual(sorted(c[0] for c in journal.verified.call_args_list),
+                         [(files[1], "abcdefghijklmnopqrstuvwxyz123456"),
+                          (files[0], "123456abcdefghijklmnopqrstuvwxyz")])
+        self.assertEqual(journal.deleted.call_count, 2)
+
+    def test_run_dedup(self):
+        dedup = MagicMock()
+        dedup.lookup.side_effect = lambda size, etag: ("container", "original.txt") \
+            if etag == "abcdefghijklmnopqrstuvwxyz123456" else None
+        self.swift.local_etag.side_effect = lambda path, size, executor: "abcdefghijklmnopqrstuvwxyz123456" \
+            if path in ('/tmp/copy.txt', '/tmp/moved.txt') else "123456abcdefghijklmnopqrstuvwxyz"
+        self.swift.put_object.return_value = "123456abcdefghijklmnopqrstuvwxyz"
+        self.swift.copy_object.side_effect = lambda source_container, source_object, container, name, size, etag: \
+            None if name == "moved.txt" else etag
+
+        files = [FileRecord('/tmp/copy.txt', 10, 0, 0), FileRecord('/tmp/new.txt', 20, 0, 0),
+                 FileRecord('/tmp/moved.txt', 30, 0, 0)]
+
+        #
+        # Test a duplicate file is copied within Swift and a unique file is uploaded and indexed
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=1, dedup=dedup)
+
+        self.assertEqual(pipeline.run(iter(files)), 3)
+        self.swift.copy_object.assert_any_call("container", "original.txt", "container", "copy.txt", 10,
+                                               "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertEqual(pipeline.metrics.counters["files_deduplicated_total"], 1)
+        self.assertEqual(pipeline.metrics.counters["bytes_deduplicated_total"], 10)
+        dedup.add.assert_called_once_with("container", "new.txt", 20, "123456abcdefghijklmnopqrstuvwxyz")
+
+        #
+        # Test a file whose indexed object is gone is uploaded and the stale entry is removed
+        #
+        dedup.remove.assert_called_once_with(30, "abcdefghijklmnopqrstuvwxyz123456")
+        self.assertEqual(sorted(c[0][1] for c in self.swift.put_object.call_args_list),
+                         ['/tmp/moved.txt', '/tmp/new.txt'])
+
+    @patch('swiftarchive.files.delete')
+    def test_run_remote(self, mock_delete):
+        remote = MagicMock()
+        remote.lookup.side_effect = lambda name, size: "abcdefghijklmnopqrstuvwxyz123456" if name != "new.txt" else None
+        self.swift.local_etag.side_effect = lambda path, size, executor: "abcdefghijklmnopqrstuvwxyz123456" \
+            if path == "/tmp/same.txt" else "123456abcdefghijklmnopqrstuvwxyz"
+
+        files = [FileRecord('/tmp/same.txt', 1, 0, 0), FileRecord('/tmp/changed.txt', 1, 0, 0),
+                 FileRecord('/tmp/new.txt', 1, 0, 0)]
+
+        #
+        # Test files already in Swift with the same md5 are skipped but still deleted
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", delete=True, remote=remote)
+
+        self.assertEqual(pipeline.run(iter(files)), 2)
+        self.assertEqual(pipeline.skipped, 1)
+        self.assertEqual(sorted(c[0][1] for c in self.swift.put_object.call_args_list),
+                         ['/tmp/changed.txt', '/tmp/new.txt'])
+        self.assertEqual(sorted(c[0][0] for c in mock_delete.call_args_list),
+                         ['/tmp/changed.txt', '/tmp/new.txt', '/tmp/same.txt'])
+        remote.lookup.assert_any_call("same.txt", 1)
+
+        #
+        # Test files are hashed in a process pool with hash_processes
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", remote=remote, hash_processes=2)
+
+        self.assertEqual(pipeline.run(iter(files)), 2)
+        self.assertIsInstance(self.swift.local_etag.call_args[0][2], concurrent.futures.ProcessPoolExecutor)
+        self.assertIsNone(pipeline.hash_executor)
+
+        #
+        # Test the process pool is created without a multiprocessing context on Python 3.6
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", remote=remote, hash_processes=2)
+
+        with patch('swiftarchive.pipeline.sys') as mock_sys, \
+                patch('concurrent.futures.ProcessPoolExecutor') as mock_executor:
+            mock_sys.version_info = (3, 6, 15)
+            self.assertEqual(pipeline.run(iter(files)), 2)
+
+        mock_executor.assert_called_once_with(2)
+
+    def test_run_bulk(self):
+        def side_effect_put_archive(container, paths, strip_path):
+            verified = {path: "abcdefghijklmnopqrstuvwxyz123456" for path in paths if path != '/tmp/fail.txt'}
+            failed = {path: "503 Service Unavailable" for path in paths if path == '/tmp/fail.txt'}
+            return verified, failed
+
+        self.swift.put_archive.side_effect = side_effect_put_archive
+
+        files = [FileRecord('/tmp/%s.txt' % i, 10, 0, 0) for i in range(5)] + \
+            [FileRecord('/tmp/fail.txt', 10, 0, 0), FileRecord('/tmp/large.txt', 1000, 0, 0)]
+
+        #
+        # Test small files are uploaded in batches of at most 2 files and failed files are uploaded on their own
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=1, bulk_threshold=100, bulk_count=2)
+
+        self.assertEqual(pipeline.run(iter(files)), 7)
+        self.assertEqual(self.swift.put_archive.call_count, 3)
+        self.assertTrue(all(len(c[0][1]) <= 2 for c in self.swift.put_archive.call_args_list))
+        self.assertEqual(sorted(c[0][1] for c in self.swift.put_object.call_args_list),
+                         ['/tmp/fail.txt', '/tmp/large.txt'])
+
+        #
+        # Test batches are limited by bulk_size
+        #
+        self.swift.put_archive.reset_mock()
+        self.swift.put_object.reset_mock()
+
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=1, bulk_threshold=100, bulk_size=20)
+
+        self.assertEqual(pipeline.run(iter(files[:5])), 5)
+        self.assertEqual([len(c[0][1]) for c in self.swift.put_archive.call_args_list], [2, 2, 1])
+        self.swift.put_object.assert_not_called()
+
+        #
+        # Test files are batched when the archive path has no trailing slash; files retried on their own are named
+        # without the leading slash like the batched files, other files keep it
+        #
+        self.swift.put_archive.reset_mock()
+
+        pipeline = Pipeline(self.swift, "container", "/tmp", workers=1, bulk_threshold=100, bulk_count=10)
+
+        self.assertEqual(pipeline.run(iter(files)), 7)
+        self.assertEqual(self.swift.put_archive.call_count, 1)
+        self.assertEqual(sorted(c[0][1:] for c in self.swift.put_object.call_args_list),
+                         [('/tmp/fail.txt', '/tmp/'), ('/tmp/large.txt', '/tmp')])
+
+    @patch('swiftarchive.pack.PackWriter')
+    def test_run_pack(self, mock_pack_writer):
+        files = [FileRecord('/tmp/%s.txt' % i, 10, 0, 0) for i in range(3)] + [FileRecord('/tmp/large.txt', 1000, 0, 0)]
+
+        mock_pack_writer.return_value.add.side_effect = lambda record: [(record, "abcdefghijklmnopqrstuvwxyz123456")] \
+            if record.path == '/tmp/1.txt' else []
+        mock_pack_writer.return_value.flush.return_value = [(files[2], "abcdefghijklmnopqrstuvwxyz123456")]
+
+        #
+        # Test small files are packed and the last pack is flushed when the scan is done
+        #
+        pipeline = Pipeline(self.swift, "container", "/tmp/", workers=1, pack_threshold=100, pack_size=1000)
+
+        self.assertEqual(pipeline.run(iter(files)), 3)
+        mock_pack_writer.assert_called_once_with(self.swift, "container", "/tmp/", 1000)
+        self.assertEqual(mock_pack_writer.return_value.add.call_count, 3)
+        mock_pack_writer.return_value.flush.assert_called_once_with()
+        self.swift.put_object.assert_called_once_with("container", '/tmp/large.txt', "/tmp/")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import swiftarchive.exceptions
+from mock import MagicMock
+
+from swiftarchive.files import FileRecord
+from swiftarchive.listing import RemoteListing
+from swiftarchive.plan import Plan, format_bytes, format_seconds, measured_rates
+
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_plan(self):
+        index = MagicMock()
+        index.unchanged.side_effect = lambda container, record: record.path == "/archive/unchanged.txt"
+        remote = RemoteListing()
+        remote.add("in_swift.txt", 10, "abcdefabcdefabcdefabcdefabcdef12")
+
+        plan = Plan("container", "/archive/", index=index, remote=remote, segment_size=1000, segment_threshold=2500,
+                    bulk_threshold=100, bulk_count=2, pack_threshold=10, pack_size=15)
+
+        for path, size in (("unchanged.txt", 5), ("in_swift.txt", 10), ("pack1", 10), ("pack2", 10), ("pack3", 1),
+                           ("bulk1", 50), ("bulk2", 50), ("bulk3", 50), ("object", 2000), ("slo", 2600)):
+            plan.add(FileRecord("/archive/" + path, size, 0, 0))
+        plan.finish()
+
+        #
+        # Test files are counted as unchanged, already in swift or to upload
+        #
+        self.assertEqual(plan.files, {"scanned": 10, "unchanged": 1, "in_swift": 1, "upload": 8})
+        self.assertEqual(plan.bytes, {"scanned": 4786, "unchanged": 5, "in_swift": 10, "upload": 4771})
+        index.unchanged.assert_any_call("container", FileRecord("/archive/pack1", 10, 0, 0))
+
+        #
+        # Test the requests of each upload method: 2 per pack, 1 per batch, 1 per segment plus the manifest
+        #
+        self.assertEqual(plan.methods, {"object": 1, "segmented": 1, "bulk": 3, "pack": 3})
+        self.assertEqual(plan.requests, {"object": 1, "segmented": 4, "bulk": 2, "pack": 4})
+
+        report = plan.report(throughput=1000, request_seconds=1.0, workers=2)
+        self.assertEqual(report["requests"]["total"], 11)
+        self.assertEqual([bucket["files"] for bucket in report["histogram"]], [8, 2, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(report["histogram"][1], {"le": 16384, "files": 2, "bytes": 4600})
+
+        #
+        # Test the estimate is the longer of the transfer time and the request time
+        #
+        self.assertEqual(report["seconds"], 5.5)
+        self.assertAlmostEqual(plan.estimate(throughput=100, request_seconds=1.0, workers=2), 47.71)
+        self.assertIsNone(plan.estimate())
+        self.assertIn("Estimated duration: 6s", Plan.format(report))
+        self.assertIn("Estimated duration: unknown", Plan.format(plan.report()))
+
+    def test_plan_object_names(self):
+        remote = RemoteListing()
+        remote.add("/object", 200, "abcdefabcdefabcdefabcdefabcdef12")
+        remote.add("bulk", 50, "abcdefabcdefabcdefabcdefabcdef12")
+
+        #
+        # Test files are looked up by the names they are uploaded to without a trailing slash on the archive path
+        #
+        plan = Plan("container", "/archive", remote=remote, bulk_threshold=100)
+        plan.add(FileRecord("/archive/object", 200, 0, 0))
+        plan.add(FileRecord("/archive/bulk", 50, 0, 0))
+
+        self.assertEqual(plan.files["in_swift"], 2)
+
+    def test_measured_rates(self):
+        metrics_json = os.path.join(self.directory, "metrics.json")
+
+        #
+        # Test the throughput and request latency are measured from the metrics of a previous run
+        #
+        with open(metrics_json, "w") as metrics_file:
+            json.dump({"counters": {"bytes_uploaded_total": 5000},
+                       "gauges": {"run_duration_seconds": 10.0},
+                       "histograms": {"upload_seconds": {"sum": 2.0, "count": 8}}}, metrics_file)
+
+        self.assertEqual(measured_rates(metrics_json), (500.0, 0.25))
+
+        #
+        # Test a run that uploaded nothing doesn't measure anything
+        #
+        with open(metrics_json, "w") as metrics_file:
+            json.dump({"counters": {"bytes_uploaded_total": 0},
+                       "gauges": {"run_duration_seconds": 10.0},
+                       "histograms": {"upload_seconds": {"sum": 0.0, "count": 0}}}, metrics_file)
+
+        self.assertEqual(measured_rates(metrics_json), (None, None))
+
+        #
+        # Test invalid or missing metrics
+        #
+        with open(metrics_json, "w") as metrics_file:
+            metrics_file.write("{")
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            measured_rates(metrics_json)
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            measured_rates(os.path.join(self.directory, "missing.json"))
+
+    def test_format(self):
+        self.assertEqual(format_bytes(100), "100 B")
+        self.assertEqual(format_bytes(1536), "1.5 KiB")
+        self.assertEqual(format_bytes(5 * 1024 ** 5), "5120.0 TiB")
+        self.assertEqual(format_seconds(4.2), "5s")
+        self.assertEqual(format_seconds(7384), "2h 03m 04s")
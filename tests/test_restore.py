@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from mock import patch
+import swiftarchive.exceptions
+import swiftarchive.restore
+
+from swiftarchive.files import FileRecord
+from swiftarchive.pack import PackWriter
+from tests.test_pack import FakeSwift
+
+
+class RestoreSwift(FakeSwift):
+    """
+    FakeSwift that also supports the container listing and download_object used by swift-restore
+    """
+
+    def list_objects(self, container, prefix=None):
+        return iter([{"name": name} for name in sorted(self.objects) if name.startswith(prefix or "")])
+
+    def download_object(self, container, object_name, file_path):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as local:
+            local.write(self.objects[object_name])
+        return hashlib.md5(self.objects[object_name]).hexdigest()
+
+
+class RestoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_restore_path(self):
+        self.assertEqual(swiftarchive.restore.restore_path("/restore", "/a/b.txt"), "/restore/a/b.txt")
+        self.assertEqual(swiftarchive.restore.restore_path("/restore/", "a/b.txt"), "/restore/a/b.txt")
+        self.assertEqual(swiftarchive.restore.restore_path("/", "a/b.txt"), "/a/b.txt")
+        self.assertEqual(swiftarchive.restore.restore_path("/restore", "a/../b.txt"), "/restore/b.txt")
+
+        #
+        # Test an object name that leaves the restore path raises LocalFileException (failing test)
+        #
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException) as le:
+            swiftarchive.restore.restore_path("/restore", "../etc/passwd")
+
+        the_exception = le.exception
+        self.assertEqual(str(the_exception), "Object \"../etc/passwd\" would be restored outside of \"/restore\"")
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            swiftarchive.restore.restore_path("/restore", "/restore2/a.txt/../../../restore2/a.txt")
+
+        with self.assertRaises(swiftarchive.exceptions.LocalFileException):
+            swiftarchive.restore.restore_path("/restore", "a/..")
+
+    def test_restore(self):
+        swift = RestoreSwift()
+        swift.objects = {"/a/1.txt": b"one", "/a/b/2.txt": b"two", "/c/3.txt": b"three"}
+
+        #
+        # Test every object is restored under the restore path
+        #
+        self.assertEqual(swiftarchive.restore.restore(swift, "container", self.directory, workers=2), 3)
+
+        for name, data in swift.objects.items():
+            with open(os.path.join(self.directory, name.lstrip("/")), "rb") as local:
+                self.assertEqual(local.read(), data)
+
+        #
+        # Test only the objects matching the prefix are restored
+        #
+        restore_root = os.path.join(self.directory, "prefix")
+        self.assertEqual(swiftarchive.restore.restore(swift, "container", restore_root, prefix="/a/"), 2)
+        self.assertFalse(os.path.exists(os.path.join(restore_root, "c")))
+
+    def test_restore_packs(self):
+        swift = RestoreSwift()
+        source = os.path.join(self.directory, "source")
+        os.makedirs(source)
+
+        pack = PackWriter(swift, "container", source)
+        for i in range(3):
+            path = os.path.join(source, "%s.txt" % i)
+            with open(path, "wb") as local:
+                local.write(("file %s" % i).encode())
+            pack.add(FileRecord(path, os.path.getsize(path), 0, 0))
+        pack.flush()
+
+        swift.objects["/large.bin"] = b"large"
+
+        #
+        # Test the pack members are restored from the pack indexes instead of restoring the packs
+        #
+        restore_root = os.path.join(self.directory, "restore")
+        self.assertEqual(swiftarchive.restore.restore(swift, "container", restore_root, packs=True), 4)
+        self.assertEqual(sorted(os.listdir(restore_root)), ["0.txt", "1.txt", "2.txt", "large.bin"])
+
+        with open(os.path.join(restore_root, "2.txt"), "rb") as local:
+            self.assertEqual(local.read(), b"file 2")
+
+    @patch('swiftarchive.swift.Swift.close')
+    @patch('swiftarchive.restore.restore')
+    @patch('swiftarchive.swift.Swift.__init__')
+    def test_main(self, mock_swift, mock_restore, mock_close):
+        mock_swift.return_value = None
+        mock_restore.return_value = 0
+
+        #
+        # Test missing arguments returns an error message (failing test)
+        #
+        with patch('sys.argv', ["swift-restore"]), patch.dict(os.environ, {}, clear=True):
+            self.assertRegex(swiftarchive.restore.main(), "swift-restore requires")
+
+        #
+        # Test the restore runs with the arguments (passing test)
+        #
+        with patch('sys.argv', ["swift-restore", "--os-username", "u", "--os-password", "p",
+                                "--os-project-name", "p", "--os-auth-url", "https://keystone:5000/v3",
+                                "--container", "container", "--restore-path", self.directory, "--workers", "2"]):
+            self.assertEqual(swiftarchive.restore.main(), 0)
+
+        self.assertEqual(mock_restore.call_args[1]["workers"], 2)
+        self.assertFalse(mock_restore.call_args[1]["packs"])
+        self.assertEqual(mock_swift.call_args[1]["pool_size"], 2)
+        mock_close.assert_called_once_with()
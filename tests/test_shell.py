@@ -8,6 +8,7 @@ import swiftarchive.shell as shell
 import swiftarchive.exceptions
 import swiftarchive.files
 
+from swiftarchive.files import FileRecord
 from swiftarchive.swift import Swift
 
 
@@ -28,11 +29,11 @@ class ShellTestCase(unittest.TestCase):
             del os.environ["ARCHIVE_PATH"]
 
     @patch('swiftarchive.files.delete')
-    @patch('swiftarchive.files.md5')
+    @patch.object(Swift, 'close')
     @patch.object(Swift, 'put_object')
-    @patch('swiftarchive.files.get_files')
+    @patch('swiftarchive.files.scan_files')
     @patch.object(Swift, '__init__')
-    def test_main(self, mock_swift_init, mock_get_files, mock_put_object, mock_md5, mock_delete):
+    def test_main(self, mock_swift_init, mock_scan_files, mock_put_object, mock_close, mock_delete):
 
         mock_swift_init.return_value = None
 
@@ -73,13 +74,29 @@ class ShellTestCase(unittest.TestCase):
         with patch.object(sys, 'argv', ["swift-archive", "--debug"]):
             shell.main()
 
+        #
+        # Test an error message is returned when the buffers don't fit in the memory limit
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--max-memory", "1048576"]):
+            self.assertRegex(shell.main(), "^--max-memory of 1048576 bytes is too small")
+
+        #
+        # Test the run exits before creating the Swift object when there are no files to archive
+        #
+        with patch.object(sys, 'argv', ["swift-archive"]):
+            mock_scan_files.return_value = []
+            mock_swift_init.reset_mock()
+
+            self.assertEqual(shell.main(), 0)
+
+            mock_swift_init.assert_not_called()
+
         #
         # Test with one file
         #
         with patch.object(sys, 'argv', ["swift-archive"]):
-            mock_get_files.return_value = ['/tmp/mock.txt']
+            mock_scan_files.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
             mock_put_object.return_value = "abcdefghijklmnopqrstuvwxyz123456"
-            mock_md5.return_value = "abcdefghijklmnopqrstuvwxyz123456"
 
             shell.main()
 
@@ -88,9 +105,10 @@ class ShellTestCase(unittest.TestCase):
         #
         with self.assertRaises(swiftarchive.exceptions.SwiftException) as se:
             with patch.object(sys, 'argv', ["swift-archive"]):
-                mock_get_files.return_value = ['/tmp/mock.txt']
-                mock_put_object.return_value = "abcdefghijklmnopqrstuvwxyz123456"
-                mock_md5.return_value = "123456abcdefghijklmnopqrstuvwxyz"
+                mock_scan_files.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
+                mock_put_object.side_effect = swiftarchive.exceptions.SwiftException(
+                    "md5 sum does not match for file \"/tmp/mock.txt\" file: "
+                    "123456abcdefghijklmnopqrstuvwxyz swift: abcdefghijklmnopqrstuvwxyz123456")
 
                 shell.main()
 
@@ -99,13 +117,112 @@ class ShellTestCase(unittest.TestCase):
                                                  "123456abcdefghijklmnopqrstuvwxyz swift: "
                                                  "abcdefghijklmnopqrstuvwxyz123456")
 
+        #
+        # Test the parallel scan is used when there is more than one scan worker
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--scan-workers", "4"]):
+            with patch('swiftarchive.files.scan_files_parallel') as mock_scan_files_parallel:
+                mock_scan_files_parallel.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
+                mock_put_object.side_effect = None
+
+                shell.main()
+
+                self.assertEqual(mock_scan_files_parallel.call_args[1]["workers"], 4)
+
+        #
+        # Test the state index is opened and closed
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--state-db", "/tmp/state.db"]):
+            with patch('swiftarchive.index.StateIndex') as mock_state_index:
+                mock_scan_files.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
+                mock_state_index.return_value.unchanged.return_value = False
+
+                shell.main()
+
+                mock_state_index.assert_called_once_with("/tmp/state.db")
+                mock_state_index.return_value.update.assert_called_once_with(
+                    "test", FileRecord('/tmp/mock.txt', 1, 0, 0), "abcdefghijklmnopqrstuvwxyz123456")
+                mock_state_index.return_value.close.assert_called_once_with()
+
+        #
+        # Test the container listing is loaded when skipping existing objects
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--skip-existing"]):
+            with patch('swiftarchive.listing.RemoteListing') as mock_remote_listing:
+                mock_scan_files.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
+                mock_remote_listing.return_value.lookup.return_value = None
+
+                shell.main()
+
+                mock_remote_listing.return_value.load.assert_called_once()
+                self.assertEqual(mock_remote_listing.return_value.load.call_args[0][1], "test")
+
         #
         # Test delete files
         #
         with patch.object(sys, 'argv', ["swift-archive", "--delete"]):
-            mock_get_files.return_value = ['/tmp/mock.txt']
+            mock_scan_files.return_value = [FileRecord('/tmp/mock.txt', 1, 0, 0)]
+            mock_put_object.side_effect = None
             mock_put_object.return_value = "abcdefghijklmnopqrstuvwxyz123456"
-            mock_md5.return_value = "abcdefghijklmnopqrstuvwxyz123456"
             mock_delete.return_value = True
 
             shell.main()
+
+        #
+        # Test watch mode archives each batch of files from the watcher with the same Swift object
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--watch"]):
+            with patch('swiftarchive.watch.Watcher') as mock_watcher:
+                mock_watcher.return_value.batches.return_value = iter([[FileRecord('/tmp/a.txt', 1, 0, 0)],
+                                                                       [FileRecord('/tmp/b.txt', 1, 0, 0)]])
+                mock_put_object.reset_mock()
+                mock_swift_init.reset_mock()
+
+                self.assertEqual(shell.main(), 0)
+
+                mock_watcher.assert_called_once()
+                self.assertEqual(mock_watcher.call_args[1]["rescan_interval"], 600)
+                self.assertEqual(sorted(c[0][1] for c in mock_put_object.call_args_list), ["/tmp/a.txt", "/tmp/b.txt"])
+                mock_swift_init.assert_called_once()
+                mock_watcher.return_value.close.assert_called_once_with()
+
+        #
+        # Test a failed write of the metrics doesn't hide the exception that failed the run
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--watch"]):
+            with patch('swiftarchive.watch.Watcher') as mock_watcher:
+                with patch('swiftarchive.metrics.Metrics.stop') as mock_stop:
+                    mock_watcher.return_value.batches.side_effect = RuntimeError("watch failed")
+                    mock_stop.side_effect = swiftarchive.exceptions.LocalFileException("metrics failed")
+
+                    with self.assertRaisesRegex(RuntimeError, "watch failed"):
+                        shell.main()
+
+                    mock_stop.assert_called_once_with(False)
+
+    @patch.object(Swift, 'put_object')
+    @patch('swiftarchive.files.scan_files')
+    @patch.object(Swift, '__init__')
+    def test_plan(self, mock_swift_init, mock_scan_files, mock_put_object):
+        mock_swift_init.return_value = None
+        mock_scan_files.return_value = [FileRecord('/tmp/a.txt', 100, 0, 0), FileRecord('/tmp/b.txt', 5000, 0, 0)]
+
+        #
+        # Test the plan reports the files and requests without creating the Swift object or uploading
+        #
+        with patch.object(sys, 'argv', ["swift-archive", "--plan", "--plan-throughput", "1000",
+                                        "--os-username", "test",
+                                        "--os-password", "test",
+                                        "--os-project-name", "test",
+                                        "--os-auth-url", "test",
+                                        "--container", "test",
+                                        "--archive-path", "/tmp/"]):
+            with patch('builtins.print') as mock_print:
+                self.assertEqual(shell.main(), 0)
+
+        report = mock_print.call_args[0][0]
+        self.assertRegex(report, r"to upload +2 +5.0 KiB")
+        self.assertRegex(report, r"single objects +2 files +2 requests")
+        self.assertIn("Estimated duration: 6s", report)
+        mock_swift_init.assert_not_called()
+        mock_put_object.assert_not_called()
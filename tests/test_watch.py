@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from mock import patch
+import swiftarchive.exceptions
+import swiftarchive.watch
+
+from swiftarchive.watch import Watcher
+
+
+def write_file(path, data=b"data"):
+    with open(path, "wb") as local:
+        local.write(data)
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        try:
+            swiftarchive.watch.Inotify().close()
+        except swiftarchive.exceptions.LocalFileException:
+            self.skipTest("inotify is not available")
+
+    def test_watcher(self):
+        write_file(os.path.join(self.directory, "existing.txt"))
+
+        watcher = Watcher(self.directory, seconds_since_updated=-1, poll_interval=0.1)
+        self.addCleanup(watcher.close)
+
+        #
+        # Test the first scan passes on the existing files without holding them and watches the tree
+        #
+        self.assertEqual([record.path for record in watcher.rescan()], [os.path.join(self.directory, "existing.txt")])
+        self.assertEqual(watcher.pending, {})
+        self.assertEqual(list(watcher.directories.values()), [self.directory])
+
+        #
+        # Test files written to the tree and to new directories are found without a rescan
+        #
+        write_file(os.path.join(self.directory, "new.txt"))
+        os.makedirs(os.path.join(self.directory, "a"))
+        write_file(os.path.join(self.directory, "a", "nested.txt"))
+
+        ready = []
+        for attempt in range(20):
+            watcher.read_events(0.05)
+            ready.extend(record.path for record in watcher.ready())
+            if len(ready) == 2:
+                break
+
+        self.assertEqual(sorted(ready), [os.path.join(self.directory, "a", "nested.txt"),
+                                         os.path.join(self.directory, "new.txt")])
+        self.assertIn(os.path.join(self.directory, "a"), watcher.directories.values())
+
+        # Test a file written and removed before it is quiet is dropped
+        write_file(os.path.join(self.directory, "removed.txt"))
+        watcher.read_events(0.1)
+        os.remove(os.path.join(self.directory, "removed.txt"))
+
+        self.assertEqual(watcher.ready(), [])
+        self.assertEqual(watcher.pending, {})
+
+    def test_watcher_quiet(self):
+        write_file(os.path.join(self.directory, "written.txt"))
+
+        watcher = Watcher(self.directory, seconds_since_updated=60, poll_interval=0.1)
+        self.addCleanup(watcher.close)
+
+        #
+        # Test a file found by the first scan that is still being written to is held until it is quiet
+        #
+        self.assertEqual(list(watcher.rescan()), [])
+        self.assertIn(os.path.join(self.directory, "written.txt"), watcher.pending)
+        watcher.pending = {}
+
+        #
+        # Test a file is held until it hasn't been written to for seconds_since_updated
+        #
+        path = os.path.join(self.directory, "busy.txt")
+        write_file(path)
+        watcher.read_events(0.1)
+
+        self.assertEqual(watcher.ready(), [])
+        self.assertIn(path, watcher.pending)
+
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        watcher.pending[path] = time.time() - 120
+
+        self.assertEqual([record.path for record in watcher.ready()], [path])
+
+    def test_watcher_overflow(self):
+        watcher = Watcher(self.directory, seconds_since_updated=-1, rescan_interval=600)
+        self.addCleanup(watcher.close)
+        list(watcher.rescan())
+
+        write_file(os.path.join(self.directory, "old.txt"))
+        os.utime(os.path.join(self.directory, "old.txt"), (0, 0))
+        # Written after the first scan and seen through inotify, so it has been archived
+        write_file(os.path.join(self.directory, "archived.txt"))
+        time.sleep(0.05)
+        watcher.read_events(0.1)
+        self.assertIn(os.path.join(self.directory, "archived.txt"), watcher.pending)
+        watcher.pending = {}
+        watcher.read_events(0.1)
+
+        #
+        # Test an overflow schedules a rescan that only finds files modified since the events were last read
+        #
+        with patch.object(watcher.inotify, "read") as mock_read:
+            mock_read.return_value = [(-1, swiftarchive.watch.IN_Q_OVERFLOW, "")]
+            write_file(os.path.join(self.directory, "missed.txt"))
+            watcher.read_events(0)
+
+            self.assertEqual(watcher.next_rescan, 0.0)
+
+            mock_read.return_value = []
+            batch = list(next(watcher.batches()))
+
+        self.assertEqual([record.path for record in batch], [os.path.join(self.directory, "missed.txt")])
+
+    def test_watcher_fallback(self):
+        write_file(os.path.join(self.directory, "existing.txt"))
+
+        #
+        # Test the tree is rescanned periodically when inotify is not available
+        #
+        with patch('swiftarchive.watch.Inotify') as mock_inotify:
+            mock_inotify.side_effect = swiftarchive.exceptions.LocalFileException("inotify is not available")
+            watcher = Watcher(self.directory, seconds_since_updated=-1, rescan_interval=0, poll_interval=0)
+
+        batches = watcher.batches()
+
+        self.assertEqual([record.path for record in next(batches)], [os.path.join(self.directory, "existing.txt")])
+        self.assertIsNone(watcher.inotify)
+
+        write_file(os.path.join(self.directory, "new.txt"))
+
+        self.assertEqual([record.path for record in next(batches)], [os.path.join(self.directory, "new.txt")])
+
+        #
+        # Test a file moved into the tree with its original mtime is found by the next rescan
+        #
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        write_file(os.path.join(outside, "moved.txt"))
+        os.utime(os.path.join(outside, "moved.txt"), (0, 0))
+        time.sleep(0.01)
+        os.rename(os.path.join(outside, "moved.txt"), os.path.join(self.directory, "moved.txt"))
+
+        self.assertEqual([record.path for record in next(batches)], [os.path.join(self.directory, "moved.txt")])